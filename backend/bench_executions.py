@@ -0,0 +1,138 @@
+"""Benchmark execution history paging on a large executions table
+
+Seeds a throwaway script with `count` executions (2M by default),
+then times the old full-row listing against keyset pages and prints the
+query plans. The seeded rows are removed afterwards.
+
+    python bench_executions.py [count]
+"""
+
+import asyncio
+import sys
+import time
+import uuid
+
+from sqlalchemy import text
+
+from database import Database
+from services import ExecutionService, decode_cursor
+
+OUTPUT_BYTES = 4096
+
+SEED = text("""
+    INSERT INTO executions (
+        id, script_id, script_name, status, output, error, exit_code,
+        priority, queued_at, started_at, completed_at, created_at, updated_at
+    )
+    SELECT
+        md5(:script_id || n), :script_id, 'bench',
+        (ARRAY['completed', 'completed', 'completed', 'failed', 'cancelled'])[1 + n % 5],
+        repeat('x', :output_bytes), '', n % 2, 0,
+        ts, ts, ts + interval '2 seconds', ts, ts
+    FROM (
+        SELECT n, now() - n * interval '1 second' AS ts
+        FROM generate_series(1, :count) AS n
+    ) AS rows
+    """)
+
+LEGACY_LIST = text(
+    "SELECT * FROM executions WHERE script_id = :script_id "
+    "ORDER BY updated_at DESC LIMIT 100"
+)
+
+
+def seed(db: Database, script_id: str, count: int):
+    with db.engine.begin() as connection:
+        connection.execute(
+            text(
+                "INSERT INTO scripts (id, name, description, content, tags) "
+                "VALUES (:id, :name, '', 'true', '{}')"
+            ),
+            {"id": script_id, "name": f"bench-{script_id}"},
+        )
+        connection.execute(
+            SEED,
+            {"script_id": script_id, "count": count, "output_bytes": OUTPUT_BYTES},
+        )
+        connection.exec_driver_sql("ANALYZE executions")
+
+
+def explain(db: Database, statement, params):
+    with db.engine.connect() as connection:
+        plan = connection.execute(
+            text(f"EXPLAIN (ANALYZE, BUFFERS) {statement.text}"), params
+        )
+        print("\n".join(row[0] for row in plan))
+
+
+async def timed(label: str, call):
+    start = time.perf_counter()
+    result = await call()
+    print(f"{label:<32} {(time.perf_counter() - start) * 1000:8.1f} ms")
+    return result
+
+
+async def run(count: int):
+    db = Database()
+    db.create_tables()
+    service = ExecutionService()
+    script_id = str(uuid.uuid4())
+
+    print(f"Seeding {count} executions...")
+    started = time.perf_counter()
+    seed(db, script_id, count)
+    print(f"Seeded in {time.perf_counter() - started:.1f} s\n")
+
+    try:
+        with db.engine.connect() as connection:
+            start = time.perf_counter()
+            connection.execute(LEGACY_LIST, {"script_id": script_id}).all()
+            legacy_ms = (time.perf_counter() - start) * 1000
+        print(f"{'legacy list (full rows)':<32} {legacy_ms:8.1f} ms")
+
+        page = await timed(
+            "first page",
+            lambda: service.get_executions_page(script_id=script_id),
+        )
+        cursor = page["next_cursor"]
+        for _ in range(100):
+            page = await service.get_executions_page(script_id=script_id, cursor=cursor)
+            cursor = page["next_cursor"]
+        await timed(
+            "page 102 (keyset)",
+            lambda: service.get_executions_page(script_id=script_id, cursor=cursor),
+        )
+        await timed(
+            "failed only",
+            lambda: service.get_executions_page(statuses=["failed"]),
+        )
+        await timed(
+            "failed, one script",
+            lambda: service.get_executions_page(
+                script_id=script_id, statuses=["failed"]
+            ),
+        )
+
+        created_at, execution_id = decode_cursor(cursor)
+        print("\nKeyset page plan:")
+        explain(
+            db,
+            text(
+                "SELECT id, script_id, script_name, status, exit_code, started_at,"
+                " completed_at, created_at FROM executions"
+                " WHERE script_id = :script_id"
+                " AND (created_at, id) < (:created_at, :id)"
+                " ORDER BY created_at DESC, id DESC LIMIT 101"
+            ),
+            {"script_id": script_id, "created_at": created_at, "id": execution_id},
+        )
+    finally:
+        with db.engine.begin() as connection:
+            connection.execute(
+                text("DELETE FROM scripts WHERE id = :id"), {"id": script_id}
+            )
+        await db.async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000))
@@ -0,0 +1,165 @@
+"""Benchmark /api/scripts latency while executions stream output
+
+Seeds `scripts` throwaway scripts and starts `streams` executions (50 by
+default) of one that prints a line every 10 ms, each followed by a viewer.
+While they run, times the /api/scripts handler `requests` times two ways:
+as it was, loading every script with its content through the sync
+session on the event loop, and as it is now. Reports p50/p99 latency,
+the worst stall of a 10 ms event-loop heartbeat and the lines viewers
+received per second. The seeded rows are removed afterwards.
+
+    python bench_latency.py [streams] [requests] [scripts]
+"""
+
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+
+STREAMS = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+# Every stream runs at once
+os.environ.setdefault("MAX_CONCURRENT_EXECUTIONS", str(STREAMS))
+
+from sqlalchemy import text  # noqa: E402
+
+import main  # noqa: E402
+from models import Script  # noqa: E402
+
+# Content size of each seeded script
+CONTENT_BYTES = 2048
+
+STREAM_SCRIPT = 'while true; do echo "line $(date +%s.%N)"; sleep 0.01; done'
+
+SEED = text("""
+    INSERT INTO scripts (
+        id, name, description, content, tags, created_at, updated_at
+    )
+    SELECT
+        md5(:prefix || n), :prefix || n, 'bench',
+        repeat('echo ' || n || E'\\n', :content_bytes / 10), '{bench}',
+        now() - n * interval '1 second', now() - n * interval '1 second'
+    FROM generate_series(1, :count) AS n
+    """)
+
+
+async def legacy_get_scripts():
+    # Every script with its content through the sync session, encoded on
+    # the loop by FastAPI, as the handler did before the async session
+    with main.db.session_scope() as session:
+        scripts = session.query(Script).order_by(Script.updated_at.desc()).all()
+        items = [script.to_dict() for script in scripts]
+    return json.dumps({"items": items, "total": len(items)})
+
+
+async def get_scripts():
+    return await main.get_scripts(
+        tag=None,
+        tags=None,
+        match="all",
+        search=None,
+        cursor=None,
+        limit=50,
+        fields=None,
+        if_none_match=None,
+    )
+
+
+async def heartbeat(lags: list):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(0.01)
+        lags.append((loop.time() - start - 0.01) * 1000)
+
+
+async def view(broadcaster, received: list):
+    async for message in broadcaster.stream():
+        received[0] += message.get("data", "").count("\n")
+
+
+def percentile(samples: list, fraction: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+async def measure(label: str, call, requests: int):
+    lags, received = [], [0]
+    beat = asyncio.create_task(heartbeat(lags))
+    viewers = [
+        asyncio.create_task(view(broadcaster, received))
+        for broadcaster in list(main.execution_service.broadcasters.values())
+    ]
+    start = time.perf_counter()
+
+    samples = []
+    for _ in range(requests):
+        began = time.perf_counter()
+        await call()
+        samples.append((time.perf_counter() - began) * 1000)
+        await asyncio.sleep(0.01)
+
+    elapsed = time.perf_counter() - start
+    for task in (beat, *viewers):
+        task.cancel()
+    p50, p99 = statistics.median(samples), percentile(samples, 0.99)
+    print(
+        f"{label:<28} {p50:7.1f} {p99:7.1f}"
+        f" {max(lags):9.1f} {received[0] / elapsed:10.0f}"
+    )
+
+
+async def run(streams: int, requests: int, scripts: int):
+    db = main.db
+    db.create_tables()
+    service = main.execution_service
+    await service.start()
+    prefix = f"bench-{uuid.uuid4().hex[:8]}-"
+
+    print(f"Seeding {scripts} scripts...")
+    with db.engine.begin() as connection:
+        connection.execute(
+            SEED,
+            {"prefix": prefix, "count": scripts, "content_bytes": CONTENT_BYTES},
+        )
+        connection.exec_driver_sql("ANALYZE scripts")
+    script = await main.script_service.create_script(
+        {"name": f"{prefix}stream", "content": STREAM_SCRIPT, "tags": []}
+    )
+
+    try:
+        executions = [
+            (await service.start_detached(script, concurrent=True))["execution_id"]
+            for _ in range(streams)
+        ]
+        await asyncio.sleep(2)  # let every stream start
+
+        print(f"\n{streams} executions streaming, {requests} requests each way")
+        print(f"{'':<28} {'p50 ms':>7} {'p99 ms':>7} {'stall ms':>9} {'lines/s':>10}")
+        await measure("full list, sync (before)", legacy_get_scripts, requests)
+        await measure("async session (after)", get_scripts, requests)
+
+        for execution_id in executions:
+            await service.cancel_execution(execution_id)
+        await asyncio.sleep(1)
+    finally:
+        await main.script_service.delete_script(script["id"])
+        with db.engine.begin() as connection:
+            connection.execute(
+                text("DELETE FROM scripts WHERE name LIKE :prefix"),
+                {"prefix": f"{prefix}%"},
+            )
+        await service.stop()
+        await db.async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(
+        run(
+            STREAMS,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 500,
+            int(sys.argv[3]) if len(sys.argv) > 3 else 10_000,
+        )
+    )
@@ -0,0 +1,71 @@
+"""Benchmark tiny scripts with and without the warm shell pool
+
+Runs `count` one-line scripts, `concurrency` at a time, each through
+ShellPool.spawn as executions do, and reports executions per second. Then
+reports spawn-to-first-byte latency of spaced-out runs, where the pool has
+time to refill between them. No database is needed.
+
+    python bench_pool.py [count] [concurrency]
+"""
+
+import asyncio
+import statistics
+import sys
+import time
+
+from runner import ShellPool
+
+SCRIPT = "echo ok\n"
+
+
+async def throughput(pool: ShellPool, count: int, concurrency: int) -> float:
+    limit = asyncio.Semaphore(concurrency)
+
+    async def execute():
+        async with limit:
+            process = await pool.spawn(SCRIPT)
+            await process.communicate()
+
+    pool.start()
+    await asyncio.sleep(0.5)  # let the pool fill
+    start = time.perf_counter()
+    await asyncio.gather(*(execute() for _ in range(count)))
+    elapsed = time.perf_counter() - start
+    await pool.stop()
+    return count / elapsed
+
+
+async def first_byte_ms(pool: ShellPool, runs: int = 50) -> float:
+    pool.start()
+    samples = []
+    for _ in range(runs):
+        await asyncio.sleep(0.02)
+        start = time.perf_counter()
+        process = await pool.spawn(SCRIPT)
+        await process.stdout.read(1)
+        samples.append((time.perf_counter() - start) * 1000)
+        await process.communicate()
+    await pool.stop()
+    return statistics.median(samples)
+
+
+async def run(count: int, concurrency: int):
+    print(f"{count} executions, {concurrency} at a time")
+    for size in (0, concurrency, concurrency * 4):
+        rate = await throughput(ShellPool(size), count, concurrency)
+        label = f"pool of {size}" if size else "no pool"
+        print(f"{label:<12} {rate:8.0f} executions/s")
+
+    for size in (0, 2):
+        latency = await first_byte_ms(ShellPool(size))
+        label = f"pool of {size}" if size else "no pool"
+        print(f"{label:<12} {latency:8.2f} ms to first byte (median)")
+
+
+if __name__ == "__main__":
+    asyncio.run(
+        run(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 8,
+        )
+    )
@@ -0,0 +1,140 @@
+"""Benchmark script listing at 10k and 100k scripts
+
+Seeds throwaway scripts with `content_bytes` of content each, first up to
+10k then up to 100k by default, and at each size times the old full-row
+listing against projected keyset pages and the filtered count, with the
+size of each response and the keyset page plan. The seeded rows are
+removed afterwards.
+
+    python bench_scripts.py [content_bytes]
+"""
+
+import asyncio
+import json
+import sys
+import time
+import uuid
+
+from sqlalchemy import text
+
+from database import Database
+from services import ScriptService, decode_cursor
+
+SIZES = (10_000, 100_000)
+
+SEED = text("""
+    INSERT INTO scripts (
+        id, name, description, content, tags, created_at, updated_at
+    )
+    SELECT
+        md5(:prefix || n), :prefix || n, 'bench script ' || n,
+        repeat('echo ' || n || E'\\n', :content_bytes / 10),
+        ARRAY['bench', 'group-' || n % 20], ts, ts
+    FROM (
+        SELECT n, now() - n * interval '1 second' AS ts
+        FROM generate_series(:start, :count) AS n
+    ) AS rows
+    """)
+
+LEGACY_LIST = text("SELECT * FROM scripts ORDER BY name")
+
+
+def seed(db: Database, prefix: str, start: int, count: int, content_bytes: int):
+    with db.engine.begin() as connection:
+        connection.execute(
+            SEED,
+            {
+                "prefix": prefix,
+                "start": start,
+                "count": count,
+                "content_bytes": content_bytes,
+            },
+        )
+        connection.exec_driver_sql("ANALYZE scripts")
+
+
+def explain(db: Database, statement, params):
+    with db.engine.connect() as connection:
+        plan = connection.execute(
+            text(f"EXPLAIN (ANALYZE, BUFFERS) {statement.text}"), params
+        )
+        print("\n".join(row[0] for row in plan))
+
+
+def report(label: str, elapsed: float, payload):
+    size = len(json.dumps(payload, default=str)) / 1024
+    print(f"{label:<32} {elapsed * 1000:8.1f} ms {size:10.0f} KiB")
+
+
+async def timed(label: str, call):
+    start = time.perf_counter()
+    result = await call()
+    report(label, time.perf_counter() - start, result)
+    return result
+
+
+async def measure(db: Database, service: ScriptService):
+    with db.engine.connect() as connection:
+        start = time.perf_counter()
+        rows = connection.execute(LEGACY_LIST).mappings().all()
+        scripts = [dict(row) for row in rows]
+        elapsed = time.perf_counter() - start
+    report("legacy list (full rows)", elapsed, {"items": scripts})
+
+    page = await timed("first page", lambda: service.get_scripts_page())
+    cursor = page["next_cursor"]
+    for _ in range(100):
+        page = await service.get_scripts_page(cursor=cursor)
+        cursor = page["next_cursor"]
+    await timed("page 102 (keyset)", lambda: service.get_scripts_page(cursor=cursor))
+    await timed(
+        "one tag",
+        lambda: service.get_scripts_page(tags=["group-7"]),
+    )
+    await timed(
+        "first page with content",
+        lambda: service.get_scripts_page(fields=["id", "name", "content"]),
+    )
+    return cursor
+
+
+async def run(content_bytes: int):
+    db = Database()
+    db.create_tables()
+    service = ScriptService()
+    prefix = f"bench-{uuid.uuid4().hex[:8]}-"
+
+    try:
+        seeded = 0
+        for size in SIZES:
+            print(f"\nSeeding up to {size} scripts...")
+            seed(db, prefix, seeded + 1, size, content_bytes)
+            seeded = size
+
+            print(f"{'':<32} {'time':>11} {'response':>14}")
+            cursor = await measure(db, service)
+
+        updated_at, script_id = decode_cursor(cursor)
+        print("\nKeyset page plan:")
+        explain(
+            db,
+            text(
+                "SELECT id, name, description, tags, created_at, updated_at"
+                " FROM scripts WHERE (updated_at, id) < (:updated_at, :id)"
+                " ORDER BY updated_at DESC, id DESC LIMIT 51"
+            ),
+            {"updated_at": updated_at, "id": script_id},
+        )
+        print("\nCount plan:")
+        explain(db, text("SELECT count(*) FROM scripts"), {})
+    finally:
+        with db.engine.begin() as connection:
+            connection.execute(
+                text("DELETE FROM scripts WHERE name LIKE :prefix"),
+                {"prefix": f"{prefix}%"},
+            )
+        await db.async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 2048))
@@ -0,0 +1,127 @@
+"""Benchmark script search on a large scripts table
+
+Seeds `count` throwaway scripts (200k by default) whose content mixes
+common and rare commands, then times the old ILIKE filter over name and
+description against ranked search for common, rare, multi-word and
+substring queries, and prints the query plans of the match step. The
+seeded rows are removed afterwards.
+
+    python bench_search.py [count]
+"""
+
+import asyncio
+import sys
+import time
+import uuid
+
+from sqlalchemy import text
+
+from database import Database
+from services import ScriptService
+
+SEED = text("""
+    INSERT INTO scripts (
+        id, name, description, content, tags, created_at, updated_at
+    )
+    SELECT
+        md5(:prefix || n), :prefix || n,
+        'nightly ' || (ARRAY['backup', 'deploy', 'cleanup', 'report'])[1 + n % 4],
+        'set -e' || E'\\n'
+            || (ARRAY[
+                'rsync -a /srv/ /backup/', 'docker compose pull',
+                'find /tmp -mtime +7 -delete', 'curl -fsS https://example.com'
+            ])[1 + n % 4]
+            || E'\\n' || 'echo step ' || n
+            || CASE WHEN n % 1000 = 0
+                THEN E'\\npg_dump --format=custom app' ELSE '' END,
+        ARRAY['bench'], ts, ts
+    FROM (
+        SELECT n, now() - n * interval '1 second' AS ts
+        FROM generate_series(1, :count) AS n
+    ) AS rows
+    """)
+
+LEGACY_SEARCH = text(
+    "SELECT * FROM scripts WHERE name ILIKE :pattern OR description ILIKE :pattern"
+    " ORDER BY name"
+)
+
+MATCH = text(
+    "SELECT id, ts_rank_cd(search_vector, websearch_to_tsquery('simple', :query))"
+    " + similarity(name, :query) AS rank FROM scripts"
+    " WHERE search_vector @@ websearch_to_tsquery('simple', :query)"
+    " OR name ILIKE :pattern OR description ILIKE :pattern OR content ILIKE :pattern"
+    " ORDER BY rank DESC, id LIMIT 20"
+)
+
+QUERIES = (
+    ("common word", "backup"),
+    ("rare word", "pg_dump"),
+    ("two words", "docker pull"),
+    ("substring", "mtim"),
+)
+
+
+def seed(db: Database, prefix: str, count: int):
+    with db.engine.begin() as connection:
+        connection.execute(SEED, {"prefix": prefix, "count": count})
+        connection.exec_driver_sql("ANALYZE scripts")
+
+
+def explain(db: Database, statement, params):
+    with db.engine.connect() as connection:
+        plan = connection.execute(
+            text(f"EXPLAIN (ANALYZE, BUFFERS) {statement.text}"), params
+        )
+        print("\n".join(row[0] for row in plan))
+
+
+async def timed(label: str, call):
+    start = time.perf_counter()
+    result = await call()
+    print(
+        f"{label:<32} {(time.perf_counter() - start) * 1000:8.1f} ms"
+        f" {len(result):6} results"
+    )
+    return result
+
+
+async def run(count: int):
+    db = Database()
+    db.create_tables()
+    service = ScriptService()
+    prefix = f"bench-{uuid.uuid4().hex[:8]}-"
+
+    print(f"Seeding {count} scripts...")
+    started = time.perf_counter()
+    seed(db, prefix, count)
+    print(f"Seeded in {time.perf_counter() - started:.1f} s\n")
+
+    try:
+        for label, query in QUERIES:
+            with db.engine.connect() as connection:
+                start = time.perf_counter()
+                rows = connection.execute(
+                    LEGACY_SEARCH, {"pattern": f"%{query}%"}
+                ).all()
+                legacy_ms = (time.perf_counter() - start) * 1000
+            print(
+                f"{'legacy ILIKE, ' + label:<32} {legacy_ms:8.1f} ms"
+                f" {len(rows):6} results"
+            )
+            await timed(f"search, {label}", lambda: service.search_scripts(query))
+
+        for label, query in (QUERIES[1], QUERIES[3]):
+            print(f"\nMatch plan, {label}:")
+            explain(db, MATCH, {"query": query, "pattern": f"%{query}%"})
+    finally:
+        with db.engine.begin() as connection:
+            connection.execute(
+                text("DELETE FROM scripts WHERE name LIKE :prefix"),
+                {"prefix": f"{prefix}%"},
+            )
+        await db.async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000))
@@ -0,0 +1,59 @@
+"""Benchmark spawn-to-first-byte latency of the script execution modes
+
+Starts a one-line script `runs` times per mode and reports how long the
+first byte of output takes, next to the old temp file plus
+`create_subprocess_shell` path. No database is needed.
+
+    python bench_spawn.py [runs]
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+from runner import MODES, spawn_script
+
+SCRIPT = "echo ready\n"
+LEGACY_PATH = f"/tmp/script_bench_{os.getpid()}.sh"
+
+
+async def legacy_spawn(content: str) -> asyncio.subprocess.Process:
+    """What executions did before: temp file, chmod, /bin/sh and stdbuf"""
+    with open(LEGACY_PATH, "w") as f:
+        f.write(content)
+    os.chmod(LEGACY_PATH, 0o755)
+    return await asyncio.create_subprocess_shell(
+        f"stdbuf -oL -eL bash {LEGACY_PATH}",
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+
+
+async def first_byte_ms(spawn) -> float:
+    start = time.perf_counter()
+    process = await spawn()
+    await process.stdout.read(1)
+    elapsed = (time.perf_counter() - start) * 1000
+    await process.communicate()
+    return elapsed
+
+
+async def run(runs: int):
+    candidates = {"legacy": lambda: legacy_spawn(SCRIPT)}
+    for mode in MODES:
+        candidates[mode] = lambda mode=mode: spawn_script(SCRIPT, mode)
+
+    print(f"{'mode':<8} {'median':>9} {'p95':>9}  ({runs} runs)")
+    for name, spawn in candidates.items():
+        await first_byte_ms(spawn)  # warm up
+        samples = sorted([await first_byte_ms(spawn) for _ in range(runs)])
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        print(f"{name:<8} {statistics.median(samples):7.2f}ms {p95:7.2f}ms")
+
+    os.remove(LEGACY_PATH)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 100))
@@ -0,0 +1,101 @@
+"""Benchmark WebSocket output streaming with and without batching
+
+Runs a script printing `lines` short lines through the pipe reader and
+relays its output to `viewers` viewers, once one frame per message and
+once in batched frames, and reports lines per second end to end (first
+read to last line decoded by every viewer) and the frames sent. Frames
+are JSON encoded and decoded as Starlette and the browser would. No
+database is needed.
+
+    python bench_streaming.py [lines] [viewers]
+"""
+
+import asyncio
+import json
+import sys
+import time
+
+from runner import spawn_script
+from services import WS_BATCH_BYTES, ExecutionService
+from socket_utils import ExecutionBroadcaster
+
+BATCH_MS = 50
+
+
+class DiscardLog:
+    """What _stream_output needs of ExecutionLogWriter, keeping nothing"""
+
+    head_bytes = None
+    tail_bytes = 0
+    truncation_announced = False
+
+    def __init__(self):
+        self.size = 0
+
+    async def write(self, stream: str, chunk: bytes) -> int:
+        offset = self.size
+        self.size += len(chunk)
+        return offset
+
+    def in_head(self, offset: int, size: int) -> int:
+        return size
+
+
+class Viewer:
+    """A WebSocket stand-in that encodes frames and decodes them again"""
+
+    def __init__(self):
+        self.frames = 0
+        self.lines = 0
+
+    async def send_json(self, data):
+        frame = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        self.frames += 1
+        message = json.loads(frame)
+        for part in message.get("messages", [message]):
+            self.lines += (part.get("data") or "").count("\n")
+
+
+async def measure(service: ExecutionService, lines: int, viewers: int, batch_ms: int):
+    script = f'for i in $(seq {lines}); do echo "line $i"; done\n'
+    broadcaster = ExecutionBroadcaster("bench", queue_bytes=1 << 40)
+    clients = [Viewer() for _ in range(viewers)]
+    relays = [
+        asyncio.create_task(
+            service.relay(client, broadcaster, batch_ms, WS_BATCH_BYTES)
+        )
+        for client in clients
+    ]
+    await asyncio.sleep(0)  # let every viewer subscribe
+
+    process = await spawn_script(script)
+    start = time.perf_counter()
+    await service._stream_output(
+        process.stdout, broadcaster, DiscardLog(), "bench", "stdout"
+    )
+    broadcaster.close()
+    await asyncio.gather(*relays)
+    elapsed = time.perf_counter() - start
+    await process.wait()
+
+    assert all(client.lines == lines for client in clients)
+    frames = sum(client.frames for client in clients) / viewers
+    label = f"batched ({batch_ms} ms)" if batch_ms else "unbatched"
+    print(f"{label:<20} {lines / elapsed:12.0f} {frames:10.0f} {elapsed:9.2f}")
+
+
+async def run(lines: int, viewers: int):
+    service = ExecutionService()
+    print(f"{lines} lines to {viewers} viewers")
+    print(f"{'':<20} {'lines/s':>12} {'frames':>10} {'seconds':>9}")
+    await measure(service, lines, viewers, 0)
+    await measure(service, lines, viewers, BATCH_MS)
+
+
+if __name__ == "__main__":
+    asyncio.run(
+        run(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 100_000,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 10,
+        )
+    )
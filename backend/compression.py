@@ -0,0 +1,60 @@
+import os
+import zlib
+from typing import Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # optional, zlib is always there
+    zstandard = None
+
+# Codec for newly stored execution output: zstd, zlib or none. zstd falls
+# back to zlib when the zstandard package isn't installed.
+LOG_COMPRESSION = os.getenv("LOG_COMPRESSION", "zstd")
+LOG_COMPRESSION_LEVEL = int(os.getenv("LOG_COMPRESSION_LEVEL", 3))
+
+# Chunks smaller than this aren't worth a compression frame
+MIN_COMPRESS_BYTES = 256
+
+# Codec recorded for data that was deliberately kept as is
+RAW = "none"
+
+
+def _codec() -> str:
+    if LOG_COMPRESSION == "zstd" and zstandard is None:
+        return "zlib"
+    return LOG_COMPRESSION
+
+
+def compress(data: bytes) -> Tuple[str, bytes]:
+    """Compress with the configured codec
+
+    Returns the codec and the stored bytes; small or incompressible data is
+    kept raw.
+    """
+    codec = _codec()
+    if codec == RAW or len(data) < MIN_COMPRESS_BYTES:
+        return RAW, data
+
+    if codec == "zstd":
+        packed = zstandard.ZstdCompressor(level=LOG_COMPRESSION_LEVEL).compress(data)
+    elif codec == "zlib":
+        packed = zlib.compress(data, LOG_COMPRESSION_LEVEL)
+    else:
+        raise ValueError(f"Unknown LOG_COMPRESSION codec: {codec}")
+
+    if len(packed) >= len(data):
+        return RAW, data
+    return codec, packed
+
+
+def decompress(codec: Optional[str], data: bytes) -> bytes:
+    """Undo `compress`; a missing codec means the data was stored raw"""
+    if codec in (None, RAW):
+        return data
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd-compressed output needs the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Unknown codec: {codec}")
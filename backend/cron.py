@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+from typing import Dict, Set
+
+# Shorthands for common expressions
+MACROS = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+
+MONTHS = ("jan", "feb", "mar", "apr", "may", "jun")
+MONTHS += ("jul", "aug", "sep", "oct", "nov", "dec")
+WEEKDAYS = ("sun", "mon", "tue", "wed", "thu", "fri", "sat")
+
+# (low, high, names) of minute, hour, day of month, month, day of week
+FIELDS = (
+    (0, 59, {}),
+    (0, 23, {}),
+    (1, 31, {}),
+    (1, 12, {name: number for number, name in enumerate(MONTHS, 1)}),
+    (0, 7, {name: number for number, name in enumerate(WEEKDAYS)}),
+)
+
+# How far ahead to look before deciding an expression never fires (Feb 30)
+SEARCH_YEARS = 5
+
+
+def _value(text: str, names: Dict[str, int]) -> int:
+    return names[text.lower()] if text.lower() in names else int(text)
+
+
+def _parse_field(text: str, low: int, high: int, names: Dict[str, int]) -> Set[int]:
+    values = set()
+    for part in text.split(","):
+        base, _, step = part.partition("/")
+        if base == "*":
+            start, end = low, high
+        elif "-" in base:
+            first, last = base.split("-", 1)
+            start, end = _value(first, names), _value(last, names)
+        else:
+            start = end = _value(base, names)
+            if step:
+                end = high  # "5/15" is "5-59/15"
+
+        step = int(step) if step else 1
+        if not (low <= start <= end <= high) or step < 1:
+            raise ValueError(f"Bad cron field '{text}': values run {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronExpression:
+    """A standard five-field cron expression, evaluated on naive UTC times
+
+    Supports `*`, ranges, steps, lists, month and weekday names, and the
+    @hourly/@daily/... macros. As in cron, when both day of month and day
+    of week are restricted a day matching either one fires.
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        fields = MACROS.get(expression.strip().lower(), expression).split()
+        if len(fields) != 5:
+            raise ValueError(
+                f"Cron expression '{expression}' needs 5 fields: "
+                "minute hour day-of-month month day-of-week"
+            )
+        try:
+            parsed = [
+                _parse_field(text, *field) for text, field in zip(fields, FIELDS)
+            ]
+        except (KeyError, ValueError) as e:
+            raise ValueError(f"Invalid cron expression '{expression}': {e}")
+
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays = {day % 7 for day in weekdays}  # 7 is Sunday too
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = moment.isoweekday() % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment: datetime) -> datetime:
+        """First time the expression fires strictly after `moment`"""
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        last_year = moment.year + SEARCH_YEARS
+        while moment.year <= last_year:
+            if moment.month not in self.months:
+                year, month = divmod(moment.month, 12)
+                moment = datetime(moment.year + year, month + 1, 1)
+            elif not self._day_matches(moment):
+                moment = datetime(moment.year, moment.month, moment.day)
+                moment += timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression '{self.expression}' never fires")
@@ -1,7 +1,13 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, Session
-from contextlib import contextmanager
-from typing import Generator
+from sqlalchemy.ext.asyncio import (
+    create_async_engine,
+    async_sessionmaker,
+    AsyncEngine,
+    AsyncSession,
+)
+from contextlib import contextmanager, asynccontextmanager
+from typing import AsyncGenerator, Generator
 import os
 
 
@@ -11,6 +17,9 @@ class Database:
     _instance = None
     _engine = None
     _session_factory = None
+    _async_engine = None
+    _async_session_factory = None
+    _database_url = None
 
     def __new__(cls):
         if cls._instance is None:
@@ -31,6 +40,7 @@ class Database:
         )
 
         print("database_url: ", database_url)
+        self._database_url = database_url
 
         self._engine = create_engine(
             database_url,
@@ -44,10 +54,44 @@ class Database:
             autocommit=False, autoflush=False, bind=self._engine
         )
 
+        # Async engine used by the request handlers so queries never block
+        # the event loop that also drives the execution websockets
+        self._async_engine = create_async_engine(
+            self._async_url(database_url),
+            pool_pre_ping=True,
+            pool_size=10,
+            max_overflow=20,
+            echo=False,
+        )
+
+        self._async_session_factory = async_sessionmaker(
+            bind=self._async_engine,
+            autoflush=False,
+            expire_on_commit=False,
+        )
+
+    @staticmethod
+    def _async_url(database_url: str) -> str:
+        """Map a sync postgres URL onto the async psycopg (v3) driver"""
+        scheme, sep, rest = database_url.partition("://")
+        if scheme in ("postgresql", "postgres", "postgresql+psycopg2"):
+            return f"postgresql+psycopg{sep}{rest}"
+        return database_url
+
     @property
     def engine(self):
         return self._engine
 
+    @property
+    def async_engine(self) -> AsyncEngine:
+        return self._async_engine
+
+    @property
+    def conninfo(self) -> str:
+        """Plain libpq URL for direct psycopg connections"""
+        scheme, sep, rest = self._database_url.partition("://")
+        return f"{scheme.split('+')[0]}{sep}{rest}"
+
     def get_session(self) -> Session:
         """Get a new database session"""
         return self._session_factory()
@@ -65,11 +109,45 @@ class Database:
         finally:
             session.close()
 
-    def create_tables(self):
-        """Create all tables"""
-        from models import Base
+    def get_async_session(self) -> AsyncSession:
+        """Get a new async database session"""
+        return self._async_session_factory()
+
+    @asynccontextmanager
+    async def async_session_scope(self) -> AsyncGenerator[AsyncSession, None]:
+        """Provide an async transactional scope for database operations"""
+        session = self.get_async_session()
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
 
-        Base.metadata.create_all(self._engine)
+    def create_tables(self):
+        """Create missing tables and bring existing ones up to date
+
+        Runs in one transaction under an advisory lock, so workers starting
+        together take turns.
+        """
+        from models import Base, SCHEMA_UPGRADES
+
+        with self._engine.begin() as connection:
+            connection.exec_driver_sql(
+                "SELECT pg_advisory_xact_lock(hashtext('zeploy-schema'))"
+            )
+            # Needed by the trigram search indexes
+            connection.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+            Base.metadata.create_all(connection)
+            for statement in SCHEMA_UPGRADES:
+                connection.exec_driver_sql(statement)
+            # create_all leaves out new indexes of tables that already existed
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(connection, checkfirst=True)
 
     def drop_tables(self):
         """Drop all tables (use with caution!)"""
@@ -1,15 +1,31 @@
 from fastapi import (
     FastAPI,
     HTTPException,
-    BackgroundTasks,
+    Header,
+    Query,
     WebSocket,
-    WebSocketDisconnect,
 )
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Dict, Optional, List
+from datetime import datetime
+import hashlib
+import json
+import re
 from database import Database
-from services import ScriptService, ExecutionService
+from services import (
+    ScriptService,
+    ExecutionService,
+    PipelineService,
+    ScheduleService,
+    LOG_CHUNK_BYTES,
+    WS_BATCH_BYTES,
+    BATCH_PARALLELISM,
+    BATCH_MAX_SIZE,
+    SCRIPT_PAGE_SIZE,
+    EXECUTION_PAGE_SIZE,
+)
 
 from dotenv import load_dotenv
 
@@ -28,6 +44,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "Content-Range",
+        "X-Log-Offset",
+        "X-Next-Offset",
+        "X-Log-Size",
+        "X-Execution-Status",
+        "X-Log-Complete",
+        "ETag",
+    ],
 )
 
 # Initialize database
@@ -40,6 +65,12 @@ class ScriptCreate(BaseModel):
     description: Optional[str] = ""
     content: str = Field(..., min_length=1)
     tags: List[str] = []
+    output_head_bytes: Optional[int] = Field(None, ge=0)
+    output_tail_bytes: Optional[int] = Field(None, ge=0)
+    cpu_limit_seconds: Optional[int] = Field(None, gt=0)
+    memory_limit_bytes: Optional[int] = Field(None, gt=0)
+    open_files_limit: Optional[int] = Field(None, gt=0)
+    timeout_seconds: Optional[int] = Field(None, gt=0)
 
 
 class ScriptUpdate(BaseModel):
@@ -47,6 +78,12 @@ class ScriptUpdate(BaseModel):
     description: Optional[str] = None
     content: Optional[str] = Field(None, min_length=1)
     tags: Optional[List[str]] = None
+    output_head_bytes: Optional[int] = Field(None, ge=0)
+    output_tail_bytes: Optional[int] = Field(None, ge=0)
+    cpu_limit_seconds: Optional[int] = Field(None, gt=0)
+    memory_limit_bytes: Optional[int] = Field(None, gt=0)
+    open_files_limit: Optional[int] = Field(None, gt=0)
+    timeout_seconds: Optional[int] = Field(None, gt=0)
 
 
 class ScriptResponse(BaseModel):
@@ -55,6 +92,12 @@ class ScriptResponse(BaseModel):
     description: str
     content: str
     tags: List[str]
+    output_head_bytes: Optional[int] = None
+    output_tail_bytes: Optional[int] = None
+    cpu_limit_seconds: Optional[int] = None
+    memory_limit_bytes: Optional[int] = None
+    open_files_limit: Optional[int] = None
+    timeout_seconds: Optional[int] = None
     created_at: str
     updated_at: str
 
@@ -64,16 +107,101 @@ class ExecutionResponse(BaseModel):
     script_id: str
     script_name: str
     status: str
+    batch_id: Optional[str] = None
+    batch_index: Optional[int] = None
+    parameters: Optional[Dict] = None
+    pipeline_run_id: Optional[str] = None
+    stage: Optional[str] = None
+    worker_id: Optional[str] = None
+    host: Optional[str] = None
+    pid: Optional[int] = None
     output: str
     error: str
     started_at: str
     completed_at: Optional[str]
     exit_code: Optional[int]
+    priority: Optional[int] = 0
+    queued_at: Optional[str] = None
+    queue_wait_ms: Optional[int] = None
+    output_bytes: Optional[int] = None
+    stored_bytes: Optional[int] = None
+    wall_ms: Optional[int] = None
+    cpu_user_ms: Optional[int] = None
+    cpu_system_ms: Optional[int] = None
+    max_rss_kb: Optional[int] = None
+    block_input: Optional[int] = None
+    block_output: Optional[int] = None
+    ctx_voluntary: Optional[int] = None
+    ctx_involuntary: Optional[int] = None
+
+
+class ExecuteRequest(BaseModel):
+    concurrent: bool = False
+    env: Dict[str, str] = {}
+    args: List[str] = []
+    priority: Optional[int] = None
+
+
+class BatchParameters(BaseModel):
+    env: Dict[str, str] = {}
+    args: List[str] = []
+
+
+class BatchCreate(BaseModel):
+    parameters: List[BatchParameters] = Field(
+        ..., min_length=1, max_length=BATCH_MAX_SIZE
+    )
+    parallelism: int = Field(BATCH_PARALLELISM, ge=1)
+    priority: Optional[int] = None
+
+
+class PipelineStage(BaseModel):
+    name: str = Field(..., pattern=r"^[A-Za-z0-9_-]{1,64}$")
+    script_id: str
+    needs: List[str] = []
+
+
+class PipelineCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=255)
+    description: Optional[str] = ""
+    stages: List[PipelineStage] = Field(..., min_length=1)
+
+
+class PipelineUpdate(BaseModel):
+    name: Optional[str] = Field(None, min_length=1, max_length=255)
+    description: Optional[str] = None
+    stages: Optional[List[PipelineStage]] = Field(None, min_length=1)
+
+
+class ScheduleCreate(BaseModel):
+    script_id: str
+    cron: Optional[str] = Field(None, max_length=100)
+    interval_seconds: Optional[int] = Field(None, ge=1)
+    jitter_seconds: int = Field(0, ge=0)
+    misfire_policy: str = "run_once"
+    misfire_grace_seconds: int = Field(300, ge=0)
+    overlap_policy: str = "skip"
+    priority: Optional[int] = None
+    enabled: bool = True
+
+
+class ScheduleUpdate(BaseModel):
+    script_id: Optional[str] = None
+    cron: Optional[str] = Field(None, max_length=100)
+    interval_seconds: Optional[int] = Field(None, ge=1)
+    jitter_seconds: Optional[int] = Field(None, ge=0)
+    misfire_policy: Optional[str] = None
+    misfire_grace_seconds: Optional[int] = Field(None, ge=0)
+    overlap_policy: Optional[str] = None
+    priority: Optional[int] = None
+    enabled: Optional[bool] = None
 
 
 # Initialize services
 script_service = ScriptService()
-execution_service = ExecutionService()
+execution_service = ExecutionService(script_service)
+pipeline_service = PipelineService(execution_service)
+schedule_service = ScheduleService(execution_service)
 
 
 @app.on_event("startup")
@@ -81,6 +209,16 @@ async def startup_event():
     """Initialize database tables on startup"""
     db.create_tables()
     print("✅ Database tables created successfully")
+    await execution_service.start()
+    schedule_service.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release pooled database connections"""
+    await schedule_service.stop()
+    await execution_service.stop()
+    await db.async_engine.dispose()
 
 
 @app.get("/")
@@ -93,27 +231,129 @@ async def root():
 
 
 # Script endpoints
+def split_list(value: Optional[str]) -> List[str]:
+    """Parse a comma-separated query parameter"""
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+def make_etag(data: bytes) -> str:
+    return '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header covers `etag` (weak comparison)"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def conditional_json(
+    data, if_none_match: Optional[str], etag: Optional[str] = None
+) -> Response:
+    """JSON response with a strong ETag, or 304 when the client has it
+
+    Without an explicit `etag` the serialized body is hashed.
+    """
+    body = None
+    if etag is None:
+        body = json.dumps(data, separators=(",", ":")).encode()
+        etag = make_etag(body)
+
+    headers = {"ETag": etag}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    if body is None:
+        body = json.dumps(data, separators=(",", ":")).encode()
+    return Response(body, media_type="application/json", headers=headers)
+
+
 @app.get("/api/scripts")
-async def get_scripts(tag: Optional[str] = None, search: Optional[str] = None):
-    """Get all scripts with optional filtering"""
-    scripts = script_service.get_all_scripts(tag=tag, search=search)
+async def get_scripts(
+    tag: Optional[str] = None,
+    tags: Optional[str] = None,
+    match: str = Query("all", pattern="^(all|any)$"),
+    search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(SCRIPT_PAGE_SIZE, ge=1, le=500),
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+):
+    """Get a page of scripts with optional filtering
+
+    `tags` is comma-separated; `match=all` keeps scripts carrying every tag,
+    `match=any` those carrying at least one. Pass the returned
+    `next_cursor` as `cursor` for the next page. `fields` is a
+    comma-separated projection; `content` is left out unless requested.
+    Answers 304 when If-None-Match holds the page's ETag.
+    """
+    try:
+        page = await script_service.get_scripts_page(
+            tags=split_list(tags) + ([tag] if tag else []),
+            search=search,
+            cursor=cursor,
+            limit=limit,
+            fields=split_list(fields) or None,
+            match=match,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return conditional_json(page, if_none_match)
+
+
+@app.get("/api/scripts/search")
+async def search_scripts(
+    q: str = Query(..., min_length=1, max_length=255),
+    limit: int = Query(20, ge=1, le=100),
+    tag: Optional[str] = None,
+    tags: Optional[str] = None,
+    match: str = Query("all", pattern="^(all|any)$"),
+):
+    """Search scripts by name, description and content, best match first
+
+    Highlights wrap matched terms in <mark></mark>; the surrounding text is
+    not HTML-escaped.
+    """
+    scripts = await script_service.search_scripts(
+        q, limit=limit, tags=split_list(tags) + ([tag] if tag else []), match=match
+    )
     return {"items": scripts, "total": len(scripts)}
 
 
+@app.get("/api/tags")
+async def get_tags(
+    tags: Optional[str] = None,
+    match: str = Query("all", pattern="^(all|any)$"),
+    search: Optional[str] = None,
+):
+    """Get tags with their script counts
+
+    With `tags`/`search`, counts are limited to the matching scripts, for
+    drilling down from a selected set of tags.
+    """
+    facets = await script_service.get_tag_facets(split_list(tags), search, match)
+    return {"items": facets, "total": len(facets)}
+
+
 @app.get("/api/scripts/{script_id}", response_model=ScriptResponse)
-async def get_script(script_id: str):
-    """Get a specific script by ID"""
-    script = script_service.get_script(script_id)
+async def get_script(script_id: str, if_none_match: Optional[str] = Header(None)):
+    """Get a specific script by ID
+
+    The ETag changes with `updated_at`; answers 304 when If-None-Match
+    holds it.
+    """
+    script = await script_service.get_script(script_id)
     if not script:
         raise HTTPException(status_code=404, detail="Script not found")
-    return script
+    etag = make_etag(f"{script['id']}:{script['updated_at']}".encode())
+    return conditional_json(script, if_none_match, etag)
 
 
 @app.post("/api/scripts", response_model=ScriptResponse, status_code=201)
 async def create_script(script: ScriptCreate):
     """Create a new script"""
     try:
-        created_script = script_service.create_script(script.dict())
+        created_script = await script_service.create_script(script.dict())
         return created_script
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -125,7 +365,7 @@ async def update_script(script_id: str, script: ScriptUpdate):
     try:
         # Only include fields that are not None
         update_data = {k: v for k, v in script.dict().items() if v is not None}
-        updated_script = script_service.update_script(script_id, update_data)
+        updated_script = await script_service.update_script(script_id, update_data)
 
         if not updated_script:
             raise HTTPException(status_code=404, detail="Script not found")
@@ -138,39 +378,110 @@ async def update_script(script_id: str, script: ScriptUpdate):
 @app.delete("/api/scripts/{script_id}")
 async def delete_script(script_id: str):
     """Delete a script"""
-    success = script_service.delete_script(script_id)
+    success = await script_service.delete_script(script_id)
     if not success:
         raise HTTPException(status_code=404, detail="Script not found")
     return {"message": "Script deleted successfully"}
 
 
-@app.post("/api/scripts/{script_id}/execute")
-async def execute_script(script_id: str):
-    """(DEPRECATED) Execute a script. Use websocket instead."""
-    return {
-        "message": "This endpoint is deprecated. Please use the websocket endpoint /ws/execute/{script_id} to execute scripts."
-    }
+@app.post("/api/scripts/{script_id}/execute", status_code=202)
+async def execute_script(script_id: str, request: Optional[ExecuteRequest] = None):
+    """Start a script in the background and return its execution id
+
+    Nothing needs to stay connected: attach any time on
+    /ws/executions/{execution_id}, read /api/executions/{execution_id}/log,
+    or cancel with POST /api/executions/{execution_id}/cancel. Like the
+    WebSocket trigger this joins a running execution of the script unless
+    `concurrent` is set or `env`/`args` are given.
+    """
+    request = request or ExecuteRequest()
+    script = await execution_service.get_script(script_id)
+    if not script:
+        raise HTTPException(status_code=404, detail="Script not found")
 
+    parameters = None
+    if request.env or request.args:
+        parameters = {"env": request.env, "args": request.args}
+    try:
+        return await execution_service.start_detached(
+            script,
+            execution_service.resolve_priority(script["tags"], request.priority),
+            request.concurrent,
+            parameters,
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
-@app.websocket("/ws/execute/{script_id}")
-async def websocket_execute(websocket: WebSocket, script_id: str):
-    script = execution_service.get_script(script_id)
 
+@app.post("/api/scripts/{script_id}/batches", status_code=201)
+async def create_batch(script_id: str, batch: BatchCreate):
+    """Run a script once per parameter set, `parallelism` at a time
+
+    Returns the batch with its executions right away; follow the
+    multiplexed output on /ws/batches/{batch_id}.
+    """
+    script = await execution_service.get_script(script_id)
     if not script:
-        await websocket.close(code=1011, reason="Script not found")
-        return
+        raise HTTPException(status_code=404, detail="Script not found")
 
-    if script_id in execution_service.active_executions:
-        await websocket.close(
-            code=1008, reason="Execution already in progress for this script"
+    try:
+        return await execution_service.start_batch(
+            script,
+            [parameters.dict() for parameters in batch.parameters],
+            batch.parallelism,
+            execution_service.resolve_priority(script["tags"], batch.priority),
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    """Get a batch, its executions and their aggregated results"""
+    batch = await execution_service.get_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch
+
+
+@app.post("/api/batches/{batch_id}/cancel")
+async def cancel_batch(batch_id: str):
+    """Cancel the queued and running executions of a batch"""
+    if not await execution_service.cancel_batch(batch_id):
+        raise HTTPException(status_code=404, detail="No running batch found")
+    return {"message": "Batch cancelled"}
+
+
+@app.websocket("/ws/execute/{script_id}")
+async def websocket_execute(
+    websocket: WebSocket,
+    script_id: str,
+    batch_ms: int = Query(0, ge=0, le=5000),
+    batch_bytes: int = Query(WS_BATCH_BYTES, ge=1024, le=16 * WS_BATCH_BYTES),
+    priority: Optional[int] = None,
+):
+    """Execute a script and stream its output
+
+    `batch_ms`/`batch_bytes` opt the connection into coalesced frames.
+    `priority` overrides the script's tag priority in the execution queue.
+    """
+    script = await execution_service.get_script(script_id)
+
+    if not script:
+        await websocket.close(code=1011, reason="Script not found")
         return
 
     await websocket.accept()
 
     try:
         await execution_service.execute_script_ws(
-            websocket, script_id, script["name"], script["content"]
+            websocket,
+            script_id,
+            script["name"],
+            script["content"],
+            batch_ms,
+            batch_bytes,
+            execution_service.resolve_priority(script["tags"], priority),
         )
     except Exception as e:
         error_message = f"An unexpected error occurred: {str(e)}"
@@ -186,28 +497,390 @@ async def websocket_execute(websocket: WebSocket, script_id: str):
             pass  # Websocket might be already closed
 
 
+@app.websocket("/ws/executions/{execution_id}")
+async def websocket_attach(
+    websocket: WebSocket,
+    execution_id: str,
+    batch_ms: int = Query(0, ge=0, le=5000),
+    batch_bytes: int = Query(WS_BATCH_BYTES, ge=1024, le=16 * WS_BATCH_BYTES),
+):
+    """Replay and follow the output of an execution"""
+    await websocket.accept()
+
+    try:
+        if not await execution_service.attach(
+            websocket, execution_id, batch_ms, batch_bytes
+        ):
+            await websocket.close(code=1011, reason="Execution not found")
+            return
+    except Exception as e:
+        error_message = f"An unexpected error occurred: {str(e)}"
+        try:
+            await websocket.send_json({"type": "error", "data": error_message})
+        except Exception:
+            print(f"Could not send error message to websocket: {error_message}")
+    finally:
+        try:
+            await websocket.close()
+        except Exception:
+            pass  # Websocket might be already closed
+
+
+@app.websocket("/ws/batches/{batch_id}")
+async def websocket_batch(
+    websocket: WebSocket,
+    batch_id: str,
+    batch_ms: int = Query(0, ge=0, le=5000),
+    batch_bytes: int = Query(WS_BATCH_BYTES, ge=1024, le=16 * WS_BATCH_BYTES),
+):
+    """Follow the output of all executions of a batch on one socket"""
+    await websocket.accept()
+
+    try:
+        if not await execution_service.attach_batch(
+            websocket, batch_id, batch_ms, batch_bytes
+        ):
+            await websocket.close(code=1011, reason="Batch not found")
+            return
+    except Exception as e:
+        error_message = f"An unexpected error occurred: {str(e)}"
+        try:
+            await websocket.send_json({"type": "error", "data": error_message})
+        except Exception:
+            print(f"Could not send error message to websocket: {error_message}")
+    finally:
+        try:
+            await websocket.close()
+        except Exception:
+            pass  # Websocket might be already closed
+
+
+# Schedule endpoints
+@app.get("/api/schedules")
+async def get_schedules(script_id: Optional[str] = None):
+    """Get schedules, soonest due first"""
+    schedules = await schedule_service.get_schedules(script_id)
+    return {"items": schedules, "total": len(schedules)}
+
+
+@app.get("/api/schedules/{schedule_id}")
+async def get_schedule(schedule_id: str):
+    """Get a schedule by ID"""
+    schedule = await schedule_service.get_schedule(schedule_id)
+    if not schedule:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    return schedule
+
+
+@app.post("/api/schedules", status_code=201)
+async def create_schedule(schedule: ScheduleCreate):
+    """Run a script on a cron expression (UTC) or every `interval_seconds`"""
+    try:
+        return await schedule_service.create_schedule(schedule.dict())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.put("/api/schedules/{schedule_id}")
+async def update_schedule(schedule_id: str, schedule: ScheduleUpdate):
+    """Update a schedule; a new cron expression or interval replaces the other"""
+    try:
+        update_data = {k: v for k, v in schedule.dict().items() if v is not None}
+        updated_schedule = await schedule_service.update_schedule(
+            schedule_id, update_data
+        )
+
+        if not updated_schedule:
+            raise HTTPException(status_code=404, detail="Schedule not found")
+
+        return updated_schedule
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.delete("/api/schedules/{schedule_id}")
+async def delete_schedule(schedule_id: str):
+    """Delete a schedule"""
+    if not await schedule_service.delete_schedule(schedule_id):
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    return {"message": "Schedule deleted successfully"}
+
+
+# Pipeline endpoints
+@app.get("/api/pipelines")
+async def get_pipelines():
+    """Get all pipelines"""
+    pipelines = await pipeline_service.get_all_pipelines()
+    return {"items": pipelines, "total": len(pipelines)}
+
+
+@app.get("/api/pipelines/{pipeline_id}")
+async def get_pipeline(pipeline_id: str):
+    """Get a pipeline by ID"""
+    pipeline = await pipeline_service.get_pipeline(pipeline_id)
+    if not pipeline:
+        raise HTTPException(status_code=404, detail="Pipeline not found")
+    return pipeline
+
+
+@app.post("/api/pipelines", status_code=201)
+async def create_pipeline(pipeline: PipelineCreate):
+    """Create a pipeline; its stages must form a DAG of existing scripts"""
+    try:
+        return await pipeline_service.create_pipeline(pipeline.dict())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.put("/api/pipelines/{pipeline_id}")
+async def update_pipeline(pipeline_id: str, pipeline: PipelineUpdate):
+    """Update an existing pipeline"""
+    try:
+        update_data = {k: v for k, v in pipeline.dict().items() if v is not None}
+        updated_pipeline = await pipeline_service.update_pipeline(
+            pipeline_id, update_data
+        )
+
+        if not updated_pipeline:
+            raise HTTPException(status_code=404, detail="Pipeline not found")
+
+        return updated_pipeline
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.delete("/api/pipelines/{pipeline_id}")
+async def delete_pipeline(pipeline_id: str):
+    """Delete a pipeline and its runs"""
+    if not await pipeline_service.delete_pipeline(pipeline_id):
+        raise HTTPException(status_code=404, detail="Pipeline not found")
+    return {"message": "Pipeline deleted successfully"}
+
+
+@app.post("/api/pipelines/{pipeline_id}/runs", status_code=201)
+async def start_pipeline_run(pipeline_id: str, priority: Optional[int] = None):
+    """Start a pipeline run; follow it on /ws/pipeline-runs/{run_id}"""
+    try:
+        run = await pipeline_service.start_run(pipeline_id, priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not run:
+        raise HTTPException(status_code=404, detail="Pipeline not found")
+    return run
+
+
+@app.get("/api/pipelines/{pipeline_id}/runs")
+async def get_pipeline_runs(pipeline_id: str, limit: int = Query(100, ge=1, le=500)):
+    """Get a pipeline's latest runs"""
+    runs = await pipeline_service.get_runs(pipeline_id, limit)
+    return {"items": runs, "total": len(runs)}
+
+
+@app.get("/api/pipeline-runs/{run_id}")
+async def get_pipeline_run(run_id: str):
+    """Get a pipeline run with its stages and critical path"""
+    run = await pipeline_service.get_run(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Pipeline run not found")
+    return run
+
+
+@app.post("/api/pipeline-runs/{run_id}/cancel")
+async def cancel_pipeline_run(run_id: str):
+    """Cancel a pipeline run"""
+    if not await pipeline_service.cancel_run(run_id):
+        raise HTTPException(status_code=404, detail="No running pipeline run found")
+    return {"message": "Pipeline run cancelled"}
+
+
+@app.websocket("/ws/pipeline-runs/{run_id}")
+async def websocket_pipeline_run(
+    websocket: WebSocket,
+    run_id: str,
+    batch_ms: int = Query(0, ge=0, le=5000),
+    batch_bytes: int = Query(WS_BATCH_BYTES, ge=1024, le=16 * WS_BATCH_BYTES),
+):
+    """Follow the output of a pipeline run's stages on one socket"""
+    await websocket.accept()
+
+    try:
+        if not await pipeline_service.attach(websocket, run_id, batch_ms, batch_bytes):
+            await websocket.close(code=1011, reason="Pipeline run not found")
+            return
+    except Exception as e:
+        error_message = f"An unexpected error occurred: {str(e)}"
+        try:
+            await websocket.send_json({"type": "error", "data": error_message})
+        except Exception:
+            print(f"Could not send error message to websocket: {error_message}")
+    finally:
+        try:
+            await websocket.close()
+        except Exception:
+            pass  # Websocket might be already closed
+
+
 # Execution endpoints
 @app.get("/api/executions")
-async def get_executions(script_id: Optional[str] = None):
-    """Get execution history"""
-    executions = execution_service.get_all_executions(script_id=script_id)
-    return {"items": executions, "total": len(executions)}
+async def get_executions(
+    script_id: Optional[str] = None,
+    status: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(EXECUTION_PAGE_SIZE, ge=1, le=500),
+    fields: Optional[str] = None,
+):
+    """Get a page of execution history, newest first
+
+    `status` is comma-separated; `since`/`until` bound the creation time.
+    Pass the returned `next_cursor` as `cursor` for the next page.
+    `output` and `error` are left out unless requested in `fields`.
+    """
+    try:
+        return await execution_service.get_executions_page(
+            script_id=script_id,
+            statuses=split_list(status) or None,
+            since=since,
+            until=until,
+            cursor=cursor,
+            limit=limit,
+            fields=split_list(fields) or None,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/executions/queue")
+async def get_execution_queue():
+    """Get running/queued execution counts and the queue in run order"""
+    return execution_service.get_queue()
 
 
 @app.get("/api/executions/{execution_id}", response_model=ExecutionResponse)
 async def get_execution(execution_id: str):
     """Get execution details"""
-    execution = execution_service.get_execution(execution_id)
+    execution = await execution_service.get_execution(execution_id)
     if not execution:
         raise HTTPException(status_code=404, detail="Execution not found")
     return execution
 
 
+@app.post("/api/executions/{execution_id}/cancel")
+async def cancel_execution(execution_id: str):
+    """Cancel a queued or running execution, stopping its whole process group"""
+    if not await execution_service.cancel_execution(execution_id):
+        raise HTTPException(
+            status_code=404, detail="No queued or running execution found"
+        )
+    return {"message": "Execution cancelled", "execution_id": execution_id}
+
+
+@app.get("/api/executions/{execution_id}/log")
+async def get_execution_log(
+    execution_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(LOG_CHUNK_BYTES, ge=1024, le=16 * LOG_CHUNK_BYTES),
+    stream: Optional[str] = Query(None, pattern="^(stdout|stderr)$"),
+    follow: bool = False,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    """Read execution output from a byte offset, or follow it as SSE
+
+    Offsets address the combined log, or a single stream when `stream` is
+    given. A `Range: bytes=N-[M]` header takes precedence over offset/limit;
+    `bytes=-N` reads the last N bytes.
+    """
+    if range_header:
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+        if not match or not any(match.groups()):
+            raise HTTPException(status_code=416, detail="Invalid range")
+        start, end = match.groups()
+        if not start:
+            # Suffix range; read_log counts a negative offset from the end
+            if not int(end):
+                raise HTTPException(status_code=416, detail="Invalid range")
+            offset = -int(end)
+            limit = min(limit, int(end))
+        else:
+            offset = int(start)
+            if end:
+                if int(end) < offset:
+                    raise HTTPException(status_code=416, detail="Invalid range")
+                limit = min(limit, int(end) - offset + 1)
+
+    if follow:
+        # EventSource reconnects resume from the last delivered offset
+        if last_event_id and last_event_id.isdigit():
+            offset = int(last_event_id)
+
+        if not await execution_service.read_log(execution_id, 0, 1, stream):
+            raise HTTPException(status_code=404, detail="Execution not found")
+
+        async def events():
+            status = None
+            async for window in execution_service.follow_log(
+                execution_id, offset, limit, stream
+            ):
+                status = window["status"]
+                payload = {
+                    "offset": window["offset"],
+                    "next_offset": window["next_offset"],
+                    "data": window["data"].decode("utf-8", errors="replace"),
+                }
+                yield f"id: {window['next_offset']}\ndata: {json.dumps(payload)}\n\n"
+            yield f"event: status\ndata: {json.dumps({'status': status})}\n\n"
+
+        return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache"},
+        )
+
+    window = await execution_service.read_log(execution_id, offset, limit, stream)
+    if not window:
+        raise HTTPException(status_code=404, detail="Execution not found")
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "X-Log-Offset": str(window["offset"]),
+        "X-Next-Offset": str(window["next_offset"]),
+        "X-Log-Size": str(window["size"]),
+        "X-Execution-Status": window["status"],
+        "X-Log-Complete": "true" if window["complete"] else "false",
+    }
+    status_code = 200
+    if range_header:
+        if window["complete"] and window["size"] and offset >= window["size"]:
+            headers["Content-Range"] = f"bytes */{window['size']}"
+            raise HTTPException(status_code=416, headers=headers)
+        if window["data"]:
+            total = window["size"] if window["complete"] else "*"
+            headers["Content-Range"] = (
+                f"bytes {window['offset']}-{window['next_offset'] - 1}/{total}"
+            )
+            status_code = 206
+
+    return Response(
+        content=window["data"],
+        status_code=status_code,
+        media_type="text/plain; charset=utf-8",
+        headers=headers,
+    )
+
+
 # Statistics endpoint
 @app.get("/api/stats")
 async def get_stats():
     """Get dashboard statistics"""
-    exec_stats = execution_service.get_stats()
-    script_count = script_service.get_script_count()
+    return {"items": await execution_service.get_stats()}
+
 
-    return {"items": {"total_scripts": script_count, **exec_stats}}
+@app.get("/api/stats/hourly")
+async def get_hourly_stats(
+    script_id: Optional[str] = None, hours: int = Query(24, ge=1, le=24 * 90)
+):
+    """Get per-hour execution counts, failures and mean duration"""
+    buckets = await execution_service.get_hourly_stats(script_id, hours)
+    return {"items": buckets, "total": len(buckets)}
@@ -1,10 +1,49 @@
-from sqlalchemy import Column, String, Text, DateTime, Integer, ARRAY, ForeignKey
+from sqlalchemy import (
+    Column,
+    Computed,
+    String,
+    Text,
+    DateTime,
+    Integer,
+    BigInteger,
+    Boolean,
+    LargeBinary,
+    ForeignKey,
+    Index,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, TSVECTOR
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime
 import uuid
 
-Base = declarative_base()
+from compression import decompress
+
+
+class Serializable:
+    """Serialization for models listing their serializable columns in FIELDS"""
+
+    FIELDS = ()
+
+    def to_dict(self, fields=None):
+        """The given columns, by default FIELDS, with datetimes in ISO format"""
+        data = {}
+        for field in fields or self.FIELDS:
+            value = getattr(self, field)
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            data[field] = value
+        return data
+
+
+Base = declarative_base(cls=Serializable)
+
+# Weighted full-text document of a script, kept in scripts.search_vector
+SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(content, '')), 'C')"
+)
 
 
 class Script(Base):
@@ -15,24 +54,72 @@ class Script(Base):
     description = Column(Text, default="")
     content = Column(Text, nullable=False)
     tags = Column(ARRAY(String), default=list)
+    # Output caps of this script's executions; NULL uses the global ones
+    output_head_bytes = Column(BigInteger, nullable=True)
+    output_tail_bytes = Column(BigInteger, nullable=True)
+    # Resource limits of this script's executions; NULL is unlimited
+    cpu_limit_seconds = Column(Integer, nullable=True)
+    memory_limit_bytes = Column(BigInteger, nullable=True)
+    open_files_limit = Column(Integer, nullable=True)
+    timeout_seconds = Column(Integer, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Weighted full-text document maintained by Postgres; never loaded
+    # unless asked for
+    search_vector = deferred(
+        Column(
+            TSVECTOR,
+            Computed(SEARCH_DOCUMENT, persisted=True),
+        )
+    )
+
     # Relationship
     executions = relationship(
-        "Execution", back_populates="script", cascade="all, delete-orphan"
+        "Execution",
+        back_populates="script",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+
+    # Serializable columns; list views project a subset of them
+    FIELDS = (
+        "id",
+        "name",
+        "description",
+        "content",
+        "tags",
+        "output_head_bytes",
+        "output_tail_bytes",
+        "cpu_limit_seconds",
+        "memory_limit_bytes",
+        "open_files_limit",
+        "timeout_seconds",
+        "created_at",
+        "updated_at",
+    )
+
+    __table_args__ = (
+        Index("ix_scripts_updated_at_id", "updated_at", "id"),
+        Index("ix_scripts_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_scripts_tags", "tags", postgresql_using="gin"),
+        # Trigram indexes serve ILIKE '%...%' substring matches
+        *(
+            Index(
+                f"ix_scripts_{column}_trgm",
+                column,
+                postgresql_using="gin",
+                postgresql_ops={column: "gin_trgm_ops"},
+            )
+            for column in ("name", "description", "content")
+        ),
     )
 
-    def to_dict(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "description": self.description,
-            "content": self.content,
-            "tags": self.tags or [],
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
-        }
+    def to_dict(self, fields=None):
+        data = super().to_dict(fields)
+        if "tags" in data:
+            data["tags"] = data["tags"] or []
+        return data
 
 
 class Execution(Base):
@@ -43,10 +130,48 @@ class Execution(Base):
         String, ForeignKey("scripts.id", ondelete="CASCADE"), nullable=False
     )
     script_name = Column(String(255), nullable=False)
-    status = Column(String(50), default="running")  # running, completed, failed
+    status = Column(String(50), default="running")
+    # Set for the runs of a batch: its id, the run's place in it and the
+    # parameter set it ran with ({"env": {...}, "args": [...]})
+    batch_id = Column(
+        String, ForeignKey("execution_batches.id", ondelete="CASCADE"), nullable=True
+    )
+    batch_index = Column(Integer, nullable=True)
+    parameters = Column(JSONB, nullable=True)
+    # Set for the stages of a pipeline run: the run and the stage's name.
+    # Executions outlive the run, like any other history.
+    pipeline_run_id = Column(
+        String, ForeignKey("pipeline_runs.id", ondelete="SET NULL"), nullable=True
+    )
+    stage = Column(String(255), nullable=True)
+    # Who runs it, so the reaper can tell when that worker is gone: the
+    # owning worker, and the process group leader by host, boot, pid and
+    # start time (clock ticks since boot, guarding against pid reuse)
+    worker_id = Column(String(100), nullable=True)
+    host = Column(String(255), nullable=True)
+    boot_id = Column(String(64), nullable=True)
+    pid = Column(Integer, nullable=True)
+    pid_started = Column(BigInteger, nullable=True)
     output = Column(Text, default="")
     error = Column(Text, default="")
     exit_code = Column(Integer, nullable=True)
+    priority = Column(Integer, default=0)
+    queued_at = Column(DateTime, nullable=True)
+    queue_wait_ms = Column(Integer, nullable=True)
+    output_bytes = Column(BigInteger, nullable=True)  # produced by the script
+    stored_bytes = Column(BigInteger, nullable=True)  # kept after the caps
+    # Resource usage of the run, from wait4
+    wall_ms = Column(Integer, nullable=True)
+    cpu_user_ms = Column(Integer, nullable=True)
+    cpu_system_ms = Column(Integer, nullable=True)
+    max_rss_kb = Column(BigInteger, nullable=True)
+    block_input = Column(BigInteger, nullable=True)
+    block_output = Column(BigInteger, nullable=True)
+    ctx_voluntary = Column(BigInteger, nullable=True)
+    ctx_involuntary = Column(BigInteger, nullable=True)
+    # How much of the output retention has left: full, trimmed (head and
+    # tail), purged (none)
+    log_retention = Column(String(10), default="full")
     started_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -55,17 +180,350 @@ class Execution(Base):
     # Relationship
     script = relationship("Script", back_populates="executions")
 
-    def to_dict(self):
-        return {
-            "id": self.id,
-            "script_id": self.script_id,
-            "script_name": self.script_name,
-            "status": self.status,
-            "output": self.output,
-            "error": self.error,
-            "started_at": self.started_at.isoformat() if self.started_at else None,
-            "completed_at": (
-                self.completed_at.isoformat() if self.completed_at else None
-            ),
-            "exit_code": self.exit_code,
-        }
+    STATUSES = (
+        "queued",
+        "running",
+        "completed",
+        "failed",
+        "cancelled",
+        "timed_out",
+        "lost",
+    )
+    FINISHED = ("completed", "failed", "cancelled", "timed_out", "lost")
+    # Finished without succeeding, as counted in the stats
+    FAILED = ("failed", "timed_out", "lost")
+
+    # Serializable columns; history lists leave out output/error
+    FIELDS = (
+        "id",
+        "script_id",
+        "script_name",
+        "status",
+        "batch_id",
+        "batch_index",
+        "parameters",
+        "pipeline_run_id",
+        "stage",
+        "worker_id",
+        "host",
+        "pid",
+        "output",
+        "error",
+        "started_at",
+        "completed_at",
+        "exit_code",
+        "priority",
+        "queued_at",
+        "queue_wait_ms",
+        "output_bytes",
+        "stored_bytes",
+        "wall_ms",
+        "cpu_user_ms",
+        "cpu_system_ms",
+        "max_rss_kb",
+        "block_input",
+        "block_output",
+        "ctx_voluntary",
+        "ctx_involuntary",
+    )
+
+    __table_args__ = (
+        Index("ix_executions_created_at_id", "created_at", "id"),
+        Index("ix_executions_script_id_created_at_id", "script_id", "created_at", "id"),
+        Index("ix_executions_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_executions_log_retention", "log_retention", "completed_at"),
+        Index("ix_executions_batch_id_batch_index", "batch_id", "batch_index"),
+        Index("ix_executions_pipeline_run_id", "pipeline_run_id"),
+    )
+
+
+class ExecutionBatch(Base):
+    """One script run over a list of parameter sets, one execution each"""
+
+    __tablename__ = "execution_batches"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    script_id = Column(
+        String, ForeignKey("scripts.id", ondelete="CASCADE"), nullable=False
+    )
+    script_name = Column(String(255), nullable=False)
+    # running, then completed/failed/cancelled, or lost with its worker
+    status = Column(String(50), default="running")
+    total = Column(Integer, nullable=False)
+    parallelism = Column(Integer, nullable=False)
+    worker_id = Column(String(100), nullable=True)  # runs the batch
+    completed_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    FIELDS = (
+        "id",
+        "script_id",
+        "script_name",
+        "status",
+        "total",
+        "parallelism",
+        "worker_id",
+        "completed_at",
+        "created_at",
+        "updated_at",
+    )
+
+    __table_args__ = (
+        Index("ix_execution_batches_script_id_created_at", "script_id", "created_at"),
+    )
+
+
+class Pipeline(Base):
+    """Scripts composed into a DAG of stages
+
+    `stages` is a list of {"name", "script_id", "needs": [stage names]}.
+    """
+
+    __tablename__ = "pipelines"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    name = Column(String(255), nullable=False, unique=True)
+    description = Column(Text, default="")
+    stages = Column(JSONB, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    FIELDS = ("id", "name", "description", "stages", "created_at", "updated_at")
+
+
+class PipelineRun(Base):
+    """One run of a pipeline
+
+    `stages` maps each stage name to its state: status (pending, running,
+    completed, failed, cancelled, timed_out, skipped), execution_id,
+    start/end in ms since the run started, and the outputs it set.
+    """
+
+    __tablename__ = "pipeline_runs"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    pipeline_id = Column(
+        String, ForeignKey("pipelines.id", ondelete="CASCADE"), nullable=False
+    )
+    pipeline_name = Column(String(255), nullable=False)
+    # running, then completed/failed/cancelled, or lost with its worker
+    status = Column(String(50), default="running")
+    stages = Column(JSONB, nullable=False)
+    worker_id = Column(String(100), nullable=True)  # runs the pipeline
+    # Longest chain of dependent stages, its length, and the time the
+    # stages took added up, i.e. what running them one by one would take
+    critical_path = Column(JSONB, nullable=True)
+    critical_path_ms = Column(BigInteger, nullable=True)
+    total_stage_ms = Column(BigInteger, nullable=True)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    FIELDS = (
+        "id",
+        "pipeline_id",
+        "pipeline_name",
+        "status",
+        "stages",
+        "worker_id",
+        "critical_path",
+        "critical_path_ms",
+        "total_stage_ms",
+        "started_at",
+        "completed_at",
+        "created_at",
+        "updated_at",
+    )
+
+    __table_args__ = (
+        Index("ix_pipeline_runs_pipeline_id_created_at", "pipeline_id", "created_at"),
+    )
+
+
+class Schedule(Base):
+    """Recurring execution of a script, on a cron expression or an interval
+
+    Times are naive UTC like everywhere else. `next_run_at` is the next
+    nominal fire time; up to `jitter_seconds` of random delay is added
+    when it fires.
+    """
+
+    __tablename__ = "schedules"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    script_id = Column(
+        String, ForeignKey("scripts.id", ondelete="CASCADE"), nullable=False
+    )
+    cron = Column(String(100), nullable=True)
+    interval_seconds = Column(Integer, nullable=True)
+    jitter_seconds = Column(Integer, nullable=False, default=0)
+    # Fire times missed by more than the grace period (no leader, restart)
+    # are run_once, collapsed into one run, or skip-ped
+    misfire_policy = Column(String(20), nullable=False, default="run_once")
+    misfire_grace_seconds = Column(Integer, nullable=False, default=300)
+    # What to do when the script is still running: skip this run, queue it
+    # until that run ends, or cancel_previous and then run
+    overlap_policy = Column(String(20), nullable=False, default="skip")
+    priority = Column(Integer, nullable=True)
+    enabled = Column(Boolean, nullable=False, default=True)
+    next_run_at = Column(DateTime, nullable=True)
+    last_run_at = Column(DateTime, nullable=True)
+    last_status = Column(String(20), nullable=True)  # started, skipped, missed
+    last_execution_id = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    MISFIRE_POLICIES = ("run_once", "skip")
+    OVERLAP_POLICIES = ("skip", "queue", "cancel_previous")
+
+    FIELDS = (
+        "id",
+        "script_id",
+        "cron",
+        "interval_seconds",
+        "jitter_seconds",
+        "misfire_policy",
+        "misfire_grace_seconds",
+        "overlap_policy",
+        "priority",
+        "enabled",
+        "next_run_at",
+        "last_run_at",
+        "last_status",
+        "last_execution_id",
+        "created_at",
+        "updated_at",
+    )
+
+    __table_args__ = (
+        Index("ix_schedules_enabled_next_run_at", "enabled", "next_run_at"),
+    )
+
+
+class ExecutionLogChunk(Base):
+    """Append-only piece of an execution's stdout/stderr"""
+
+    __tablename__ = "execution_log_chunks"
+
+    execution_id = Column(
+        String, ForeignKey("executions.id", ondelete="CASCADE"), primary_key=True
+    )
+    seq = Column(Integer, primary_key=True)
+    stream = Column(String(10), nullable=False)  # stdout, stderr
+    offset = Column(BigInteger, nullable=False)  # position in the combined log
+    stream_offset = Column(BigInteger, nullable=False)  # position within stream
+    size = Column(Integer, nullable=False)  # uncompressed
+    data = Column("bytes", LargeBinary, nullable=False)  # as stored
+    codec = Column(String(8), nullable=True)  # zstd, zlib, none; NULL if never tried
+    ts = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_execution_log_chunks_offset", "execution_id", "offset"),
+        Index(
+            "ix_execution_log_chunks_stream_offset",
+            "execution_id",
+            "stream",
+            "stream_offset",
+        ),
+    )
+
+    @property
+    def payload(self) -> bytes:
+        """The chunk's output, decompressed"""
+        return decompress(self.codec, self.data)
+
+
+class StatsCounter(Base):
+    """Running total kept up to date as scripts and executions change
+
+    Names are `scripts`, `executions` and `executions:<status>`.
+    """
+
+    __tablename__ = "stats_counters"
+
+    name = Column(String(64), primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+
+
+class ExecutionStatsHourly(Base):
+    """Per-script, per-hour rollup of finished executions"""
+
+    __tablename__ = "execution_stats_hourly"
+
+    script_id = Column(
+        String, ForeignKey("scripts.id", ondelete="CASCADE"), primary_key=True
+    )
+    bucket = Column(DateTime, primary_key=True)  # hour the executions started
+    executions = Column(Integer, nullable=False, default=0)
+    failures = Column(Integer, nullable=False, default=0)
+    duration_ms = Column(BigInteger, nullable=False, default=0)
+    cpu_ms = Column(BigInteger, nullable=False, default=0)  # user + system
+    max_rss_kb = Column(BigInteger, nullable=False, default=0)  # peak of the hour
+
+    __table_args__ = (Index("ix_execution_stats_hourly_bucket", "bucket"),)
+
+
+# Bring tables created by earlier versions up to date; create_all only
+# creates the missing ones (and their indexes, see Database.create_tables).
+# Every statement must be idempotent. Append new ones at the end.
+SCHEMA_UPGRADES = (
+    # Scheduler: priority and queueing time
+    "ALTER TABLE executions"
+    " ADD COLUMN IF NOT EXISTS priority INTEGER DEFAULT 0,"
+    " ADD COLUMN IF NOT EXISTS queued_at TIMESTAMP WITHOUT TIME ZONE,"
+    " ADD COLUMN IF NOT EXISTS queue_wait_ms INTEGER",
+    # Script search; computing it for existing scripts rewrites the table once
+    "ALTER TABLE scripts ADD COLUMN IF NOT EXISTS search_vector TSVECTOR"
+    f" GENERATED ALWAYS AS ({SEARCH_DOCUMENT}) STORED",
+    # Log compression and retention; existing output counts as kept in full
+    "ALTER TABLE executions"
+    " ADD COLUMN IF NOT EXISTS log_retention VARCHAR(10) DEFAULT 'full'",
+    "ALTER TABLE execution_log_chunks ADD COLUMN IF NOT EXISTS codec VARCHAR(8)",
+    # Output caps
+    "ALTER TABLE scripts"
+    " ADD COLUMN IF NOT EXISTS output_head_bytes BIGINT,"
+    " ADD COLUMN IF NOT EXISTS output_tail_bytes BIGINT",
+    "ALTER TABLE executions"
+    " ADD COLUMN IF NOT EXISTS output_bytes BIGINT,"
+    " ADD COLUMN IF NOT EXISTS stored_bytes BIGINT",
+    # Resource limits and usage
+    "ALTER TABLE scripts"
+    " ADD COLUMN IF NOT EXISTS cpu_limit_seconds INTEGER,"
+    " ADD COLUMN IF NOT EXISTS memory_limit_bytes BIGINT,"
+    " ADD COLUMN IF NOT EXISTS open_files_limit INTEGER,"
+    " ADD COLUMN IF NOT EXISTS timeout_seconds INTEGER",
+    "ALTER TABLE executions"
+    " ADD COLUMN IF NOT EXISTS wall_ms INTEGER,"
+    " ADD COLUMN IF NOT EXISTS cpu_user_ms INTEGER,"
+    " ADD COLUMN IF NOT EXISTS cpu_system_ms INTEGER,"
+    " ADD COLUMN IF NOT EXISTS max_rss_kb BIGINT,"
+    " ADD COLUMN IF NOT EXISTS block_input BIGINT,"
+    " ADD COLUMN IF NOT EXISTS block_output BIGINT,"
+    " ADD COLUMN IF NOT EXISTS ctx_voluntary BIGINT,"
+    " ADD COLUMN IF NOT EXISTS ctx_involuntary BIGINT",
+    "ALTER TABLE execution_stats_hourly"
+    " ADD COLUMN IF NOT EXISTS cpu_ms BIGINT NOT NULL DEFAULT 0,"
+    " ADD COLUMN IF NOT EXISTS max_rss_kb BIGINT NOT NULL DEFAULT 0",
+    # Batches
+    "ALTER TABLE executions"
+    " ADD COLUMN IF NOT EXISTS batch_id VARCHAR"
+    " REFERENCES execution_batches (id) ON DELETE CASCADE,"
+    " ADD COLUMN IF NOT EXISTS batch_index INTEGER,"
+    " ADD COLUMN IF NOT EXISTS parameters JSONB",
+    # Pipelines
+    "ALTER TABLE executions"
+    " ADD COLUMN IF NOT EXISTS pipeline_run_id VARCHAR"
+    " REFERENCES pipeline_runs (id) ON DELETE SET NULL,"
+    " ADD COLUMN IF NOT EXISTS stage VARCHAR(255)",
+    # Crash recovery: who runs what, and where
+    "ALTER TABLE executions"
+    " ADD COLUMN IF NOT EXISTS worker_id VARCHAR(100),"
+    " ADD COLUMN IF NOT EXISTS host VARCHAR(255),"
+    " ADD COLUMN IF NOT EXISTS boot_id VARCHAR(64),"
+    " ADD COLUMN IF NOT EXISTS pid INTEGER,"
+    " ADD COLUMN IF NOT EXISTS pid_started BIGINT",
+    "ALTER TABLE execution_batches ADD COLUMN IF NOT EXISTS worker_id VARCHAR(100)",
+    "ALTER TABLE pipeline_runs ADD COLUMN IF NOT EXISTS worker_id VARCHAR(100)",
+)
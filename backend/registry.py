@@ -0,0 +1,288 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List
+
+import psycopg
+
+from database import Database
+
+logger = logging.getLogger("registry")
+
+# Channel shared by every backend worker
+REGISTRY_CHANNEL = os.getenv("REGISTRY_CHANNEL", "zeploy_executions")
+
+# Seconds between attempts to re-establish a lost LISTEN connection, and
+# the first wait before retrying a lost lock connection, doubled per failure
+# up to REGISTRY_RECONNECT_MAX_DELAY
+REGISTRY_RECONNECT_DELAY = float(os.getenv("REGISTRY_RECONNECT_DELAY", 5))
+REGISTRY_RECONNECT_MAX_DELAY = float(os.getenv("REGISTRY_RECONNECT_MAX_DELAY", 60))
+
+# Seconds between checks that the lock connection, and with it every lock
+# this worker holds, is still up
+REGISTRY_KEEPALIVE_INTERVAL = float(os.getenv("REGISTRY_KEEPALIVE_INTERVAL", 5))
+
+# First key of the two-key advisory locks taken by the registry
+LOCK_NAMESPACE = 0x5A45
+
+# Worker id prefix of a worker running standalone, which holds no worker lock
+STANDALONE_PREFIX = "standalone:"
+
+
+class ExecutionRegistry:
+    """Cross-worker execution coordination backed by Postgres
+
+    Advisory locks, held on a dedicated connection for as long as this
+    worker owns the locked resource, make ownership exclusive across
+    workers; LISTEN/NOTIFY carries signals (cancel, invalidation, ...) to
+    every worker. Each worker also holds a lock on its own id while it
+    runs, which tells the others whether it is alive. A dropped lock
+    connection takes every lock with it, so it is reconnected and the
+    locks are taken again. When Postgres is unreachable at startup the
+    registry degrades to single-process behaviour: every lock is granted
+    and signals are only delivered locally.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ExecutionRegistry, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.db = Database()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.enabled = False
+        self._lock_conn = None
+        self._listen_conn = None
+        self._listener = None
+        self._keeper = None
+        # Keys locked on the lock connection, and how many times: advisory
+        # locks are reentrant and need as many unlocks
+        self._held = Counter()
+        self._lock = asyncio.Lock()
+        self._handlers: Dict[str, List[Callable[[Dict], Awaitable[None]]]] = {}
+
+    async def start(self):
+        """Open the registry connections and start listening for signals"""
+        try:
+            self._lock_conn = await self._connect()
+            self._listen_conn = await self._connect()
+            await self._listen_conn.execute(f'LISTEN "{REGISTRY_CHANNEL}"')
+        except Exception:
+            logger.exception("Execution registry unavailable, running standalone")
+            await self.stop()
+            # Tells other workers not to judge this one by its worker lock
+            if not self.worker_id.startswith(STANDALONE_PREFIX):
+                self.worker_id = STANDALONE_PREFIX + self.worker_id
+            return
+
+        self.enabled = True
+        await self.try_lock(f"worker:{self.worker_id}")
+        self._listener = asyncio.create_task(self._listen())
+        self._keeper = asyncio.create_task(self._keep_alive())
+
+    async def stop(self):
+        """Stop listening and release every lock held by this worker"""
+        self.enabled = False
+        for task in (self._listener, self._keeper):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._listener = self._keeper = None
+        self._held.clear()
+
+        for conn in (self._listen_conn, self._lock_conn):
+            if conn:
+                try:
+                    await conn.close()
+                except Exception:
+                    pass
+        self._listen_conn = self._lock_conn = None
+
+    async def _connect(self) -> psycopg.AsyncConnection:
+        return await psycopg.AsyncConnection.connect(self.db.conninfo, autocommit=True)
+
+    async def _execute(self, query: str, params: tuple) -> Any:
+        """First value of a statement run on the lock connection
+
+        A dropped connection is replaced and the statement retried once;
+        while Postgres stays unreachable this raises.
+        """
+        async with self._lock:
+            if self._lock_conn.closed:
+                await self._reconnect()
+            try:
+                cursor = await self._lock_conn.execute(query, params)
+            except psycopg.OperationalError:
+                if not self._lock_conn.closed:
+                    raise
+                await self._reconnect()
+                cursor = await self._lock_conn.execute(query, params)
+            return (await cursor.fetchone())[0]
+
+    async def _reconnect(self):
+        """Replace the lock connection and take this worker's locks again
+
+        Another worker may have taken a lock in the meantime; that one is
+        dropped, and its owner finds out through holds().
+        """
+        try:
+            await self._lock_conn.close()
+        except Exception:
+            pass
+        self._lock_conn = await self._connect()
+
+        for key, count in list(self._held.items()):
+            for _ in range(count):
+                cursor = await self._lock_conn.execute(
+                    "SELECT pg_try_advisory_lock(%s, hashtext(%s))",
+                    (LOCK_NAMESPACE, key),
+                )
+                if not (await cursor.fetchone())[0]:
+                    del self._held[key]
+                    logger.warning("Execution registry lost the lock on %s", key)
+                    break
+        logger.info("Execution registry reconnected its lock connection")
+
+    async def _keep_alive(self):
+        delay = 0
+        while True:
+            await asyncio.sleep(delay or REGISTRY_KEEPALIVE_INTERVAL)
+            try:
+                await self._execute("SELECT 1", ())
+                delay = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                delay = min(
+                    delay * 2 if delay else REGISTRY_RECONNECT_DELAY,
+                    REGISTRY_RECONNECT_MAX_DELAY,
+                )
+                logger.warning(
+                    "Execution registry lock connection down, retrying in %ss",
+                    delay,
+                )
+
+    def on(self, event: str, handler: Callable[[Dict], Awaitable[None]]):
+        """Register a coroutine called with the payload of each `event`"""
+        self._handlers.setdefault(event, []).append(handler)
+
+    async def try_lock(self, key: str) -> bool:
+        """Take a cluster-wide lock on `key` without waiting"""
+        if not self.enabled:
+            return True
+
+        locked = await self._execute(
+            "SELECT pg_try_advisory_lock(%s, hashtext(%s))", (LOCK_NAMESPACE, key)
+        )
+        if locked:
+            self._held[key] += 1
+        return locked
+
+    async def holds(self, key: str) -> bool:
+        """Whether this worker still holds the lock on `key`
+
+        Locks vanish with the lock connection, so long-lived owners check
+        before acting on one.
+        """
+        if not self.enabled:
+            return True
+
+        return await self._execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_locks WHERE locktype = 'advisory'"
+            " AND pid = pg_backend_pid() AND granted AND classid = %s"
+            " AND objid = hashtext(%s)::oid AND objsubid = 2)",
+            (LOCK_NAMESPACE, key),
+        )
+
+    async def alive(self, worker_id: str) -> bool:
+        """Whether the worker `worker_id` is still running
+
+        Judged by its worker lock. A standalone worker holds none, and
+        standalone there are no locks to ask, so then there is no telling
+        and the worker is taken to be alive.
+        """
+        if (
+            worker_id == self.worker_id
+            or not self.enabled
+            or worker_id.startswith(STANDALONE_PREFIX)
+        ):
+            return True
+
+        key = f"worker:{worker_id}"
+        if await self._execute(
+            "SELECT pg_try_advisory_lock(%s, hashtext(%s))", (LOCK_NAMESPACE, key)
+        ):
+            await self._execute(
+                "SELECT pg_advisory_unlock(%s, hashtext(%s))", (LOCK_NAMESPACE, key)
+            )
+            return False
+        return True
+
+    async def unlock(self, key: str):
+        """Release a lock taken with try_lock, once per time it was taken"""
+        if not self.enabled:
+            return
+
+        # Forgotten first, so a reconnect in between doesn't take it again
+        if self._held[key] > 1:
+            self._held[key] -= 1
+        else:
+            self._held.pop(key, None)
+        await self._execute(
+            "SELECT pg_advisory_unlock(%s, hashtext(%s))", (LOCK_NAMESPACE, key)
+        )
+
+    async def notify(self, event: str, **payload: Any):
+        """Signal every worker, including this one"""
+        message = {"event": event, "worker": self.worker_id, **payload}
+        if not self.enabled:
+            await self._dispatch(message)
+            return
+
+        await self._execute(
+            "SELECT pg_notify(%s, %s)", (REGISTRY_CHANNEL, json.dumps(message))
+        )
+
+    async def _dispatch(self, message: Dict):
+        for handler in self._handlers.get(message.get("event"), []):
+            try:
+                await handler(message)
+            except Exception:
+                logger.exception("Registry handler failed for %s", message)
+
+    async def _listen(self):
+        while True:
+            try:
+                async for notify in self._listen_conn.notifies():
+                    try:
+                        message = json.loads(notify.payload)
+                    except ValueError:
+                        continue
+                    await self._dispatch(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Execution registry listener lost its connection")
+
+            await asyncio.sleep(REGISTRY_RECONNECT_DELAY)
+            try:
+                await self._listen_conn.close()
+                self._listen_conn = await self._connect()
+                await self._listen_conn.execute(f'LISTEN "{REGISTRY_CHANNEL}"')
+            except Exception:
+                logger.warning("Execution registry could not reconnect, retrying")
+                continue
+
+            # Signals sent while disconnected are lost; let handlers resync
+            await self._dispatch({"event": "reconnect", "worker": self.worker_id})
@@ -1,49 +1,103 @@
-from abc import ABC, abstractmethod
-from typing import List, Optional, Dict, Any
-from sqlalchemy.orm import Session
-from sqlalchemy import func, or_
-from models import Script, Execution
+from typing import List, Optional, Dict, Any, Sequence, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import (
+    BigInteger,
+    cast,
+    delete,
+    exists,
+    func,
+    insert,
+    literal_column,
+    or_,
+    select,
+    tuple_,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import load_only
+from models import (
+    Script,
+    Execution,
+    ExecutionBatch,
+    ExecutionLogChunk,
+    Pipeline,
+    PipelineRun,
+    Schedule,
+    ExecutionStatsHourly,
+    StatsCounter,
+)
 from datetime import datetime
+from compression import decompress
 
 
-class BaseRepository(ABC):
-    """Abstract base repository"""
+class AsyncBaseRepository:
+    """Base repository for async sessions: rows of `model` by primary key"""
 
-    def __init__(self, session: Session):
+    model = None
+
+    def __init__(self, session: AsyncSession):
         self.session = session
 
-    @abstractmethod
-    def get_all(self, **filters) -> List:
-        pass
+    async def get_by_id(self, id: str) -> Optional[Any]:
+        """Get a row by ID"""
+        return await self.session.get(self.model, id)
+
+    async def create(self, data: Dict[str, Any]) -> Any:
+        """Create a new row"""
+        row = self.model(**data)
+        self.session.add(row)
+        await self.session.flush()
+        return row
+
+    async def update(self, id: str, data: Dict[str, Any]) -> Optional[Any]:
+        """Update an existing row; keys that aren't attributes are ignored"""
+        row = await self.get_by_id(id)
+        if not row:
+            return None
 
-    @abstractmethod
-    def get_by_id(self, id: str):
-        pass
+        for key, value in data.items():
+            if hasattr(row, key):
+                setattr(row, key, value)
 
-    @abstractmethod
-    def create(self, data: Dict[str, Any]):
-        pass
+        await self.session.flush()
+        return row
 
-    @abstractmethod
-    def update(self, id: str, data: Dict[str, Any]):
-        pass
+    async def delete(self, id: str) -> bool:
+        """Delete a row, and whatever the database cascades to"""
+        row = await self.get_by_id(id)
+        if not row:
+            return False
 
-    @abstractmethod
-    def delete(self, id: str) -> bool:
-        pass
+        await self.session.delete(row)
+        await self.session.flush()
+        return True
 
 
-class ScriptRepository(BaseRepository):
-    """Repository for Script operations"""
+class AsyncScriptRepository(AsyncBaseRepository):
+    """Async repository for Script operations"""
 
-    def get_all(
-        self, tag: Optional[str] = None, search: Optional[str] = None
-    ) -> List[Script]:
-        """Get all scripts with optional filtering"""
-        query = self.session.query(Script)
+    model = Script
 
-        if tag:
-            query = query.filter(Script.tags.contains([tag]))
+    async def update(self, id: str, data: Dict[str, Any]) -> Optional[Script]:
+        """Update an existing script"""
+        return await super().update(id, {**data, "updated_at": datetime.utcnow()})
+
+    def _filtered(
+        self,
+        query,
+        tags: Optional[List[str]],
+        search: Optional[str],
+        match: str = "all",
+    ):
+        """Apply the tag and search filters shared by the list queries
+
+        `match` is "all" (scripts carrying every tag) or "any" (at least one);
+        both are served by the GIN index on tags.
+        """
+        if tags:
+            if match == "any":
+                query = query.filter(Script.tags.overlap(tags))
+            else:
+                query = query.filter(Script.tags.contains(tags))
 
         if search:
             search_filter = or_(
@@ -52,108 +106,726 @@ class ScriptRepository(BaseRepository):
             )
             query = query.filter(search_filter)
 
-        return query.order_by(Script.updated_at.desc()).all()
+        return query
 
-    def get_by_id(self, id: str) -> Optional[Script]:
-        """Get script by ID"""
-        return self.session.query(Script).filter(Script.id == id).first()
+    async def get_page(
+        self,
+        tags: Optional[List[str]] = None,
+        search: Optional[str] = None,
+        after: Optional[Tuple[datetime, str]] = None,
+        limit: int = 50,
+        fields: Sequence[str] = Script.FIELDS,
+        match: str = "all",
+    ) -> List[Script]:
+        """Get one page of scripts, newest first, loading only `fields`
 
-    def get_by_name(self, name: str) -> Optional[Script]:
-        """Get script by name"""
-        return self.session.query(Script).filter(Script.name == name).first()
+        `after` is the (updated_at, id) of the last script of the previous
+        page, so pages are read by index seek rather than OFFSET.
+        """
+        query = self._filtered(select(Script), tags, search, match).options(
+            load_only(*(getattr(Script, field) for field in fields))
+        )
 
-    def create(self, data: Dict[str, Any]) -> Script:
-        """Create a new script"""
-        script = Script(**data)
-        self.session.add(script)
-        self.session.flush()
-        return script
+        if after:
+            query = query.filter(tuple_(Script.updated_at, Script.id) < after)
 
-    def update(self, id: str, data: Dict[str, Any]) -> Optional[Script]:
-        """Update an existing script"""
-        script = self.get_by_id(id)
-        if not script:
-            return None
+        result = await self.session.scalars(
+            query.order_by(Script.updated_at.desc(), Script.id.desc()).limit(limit)
+        )
+        return list(result.all())
+
+    async def search(
+        self,
+        text: str,
+        limit: int = 20,
+        tags: Optional[List[str]] = None,
+        match: str = "all",
+    ) -> List[Dict[str, Any]]:
+        """Ranked full-text and substring search over name/description/content
+
+        Full-text matches use the GIN-indexed search_vector; substring
+        matches use the trigram indexes. Highlighted snippets are only
+        computed for the returned page.
+        """
+        query = func.websearch_to_tsquery("simple", text)
+        pattern = (
+            "%"
+            + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            + "%"
+        )
 
-        for key, value in data.items():
-            if hasattr(script, key):
-                setattr(script, key, value)
+        rank = func.ts_rank_cd(Script.search_vector, query) + func.similarity(
+            Script.name, text
+        )
+        matches = (
+            select(Script.id, rank.label("rank"))
+            .filter(
+                or_(
+                    Script.search_vector.op("@@")(query),
+                    Script.name.ilike(pattern, escape="\\"),
+                    Script.description.ilike(pattern, escape="\\"),
+                    Script.content.ilike(pattern, escape="\\"),
+                )
+            )
+            .order_by(rank.desc(), Script.id)
+            .limit(limit)
+        )
+        matches = self._filtered(matches, tags, None, match).subquery()
+
+        options = "StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=15"
+        result = await self.session.execute(
+            select(
+                Script.id,
+                Script.name,
+                Script.description,
+                Script.tags,
+                Script.updated_at,
+                matches.c.rank,
+                func.ts_headline("simple", Script.name, query, options),
+                func.ts_headline("simple", Script.description, query, options),
+                func.ts_headline("simple", Script.content, query, options),
+            )
+            .join(matches, matches.c.id == Script.id)
+            .order_by(matches.c.rank.desc(), Script.id)
+        )
 
-        script.updated_at = datetime.utcnow()
-        self.session.flush()
-        return script
+        return [
+            {
+                "id": row[0],
+                "name": row[1],
+                "description": row[2],
+                "tags": row[3] or [],
+                "updated_at": row[4].isoformat() if row[4] else None,
+                "rank": float(row[5]),
+                "highlights": {
+                    "name": row[6],
+                    "description": row[7],
+                    "content": row[8],
+                },
+            }
+            for row in result.all()
+        ]
+
+    async def count_filtered(
+        self,
+        tags: Optional[List[str]] = None,
+        search: Optional[str] = None,
+        match: str = "all",
+    ) -> int:
+        """Count scripts matching the filters without loading them"""
+        return await self.session.scalar(
+            self._filtered(select(func.count(Script.id)), tags, search, match)
+        )
 
-    def delete(self, id: str) -> bool:
-        """Delete a script"""
-        script = self.get_by_id(id)
-        if not script:
-            return False
+    async def tag_counts(
+        self,
+        tags: Optional[List[str]] = None,
+        search: Optional[str] = None,
+        match: str = "all",
+    ) -> List[Tuple[str, int]]:
+        """Count scripts per tag, among scripts matching the filters"""
+        tag = func.unnest(Script.tags).label("tag")
+        scripts = self._filtered(select(tag), tags, search, match).subquery()
+        count = func.count().label("count")
+        result = await self.session.execute(
+            select(scripts.c.tag, count)
+            .group_by(scripts.c.tag)
+            .order_by(count.desc(), scripts.c.tag)
+        )
+        return [(row[0], row[1]) for row in result.all()]
 
-        self.session.delete(script)
-        self.session.flush()
-        return True
+    async def get_by_name(self, name: str) -> Optional[Script]:
+        """Get script by name"""
+        result = await self.session.scalars(
+            select(Script).filter(Script.name == name).limit(1)
+        )
+        return result.first()
 
-    def count(self) -> int:
+    async def count(self) -> int:
         """Count total scripts"""
-        return self.session.query(func.count(Script.id)).scalar()
+        return await self.session.scalar(select(func.count(Script.id)))
 
 
-class ExecutionRepository(BaseRepository):
-    """Repository for Execution operations"""
+class AsyncExecutionRepository(AsyncBaseRepository):
+    """Async repository for Execution operations"""
 
-    def get_all(
-        self, script_id: Optional[str] = None, limit: int = 100
+    model = Execution
+
+    async def get_page(
+        self,
+        script_id: Optional[str] = None,
+        statuses: Optional[List[str]] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        after: Optional[Tuple[datetime, str]] = None,
+        limit: int = 100,
+        fields: Sequence[str] = Execution.FIELDS,
     ) -> List[Execution]:
-        """Get all executions with optional filtering"""
-        query = self.session.query(Execution)
+        """Get one page of executions, newest first, loading only `fields`
+
+        Ordered by the immutable (created_at, id) so rows don't move between
+        pages while executions update; `after` is that key of the last row
+        of the previous page. `since`/`until` bound created_at.
+        """
+        query = self._filtered(
+            select(Execution).options(
+                load_only(*(getattr(Execution, field) for field in fields))
+            ),
+            script_id,
+            statuses,
+            since,
+            until,
+        )
+        if after:
+            query = query.filter(tuple_(Execution.created_at, Execution.id) < after)
 
+        result = await self.session.scalars(
+            query.order_by(Execution.created_at.desc(), Execution.id.desc()).limit(
+                limit
+            )
+        )
+        return list(result.all())
+
+    async def count_filtered(
+        self,
+        script_id: Optional[str] = None,
+        statuses: Optional[List[str]] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> int:
+        """Count executions matching the filters without loading them"""
+        return await self.session.scalar(
+            self._filtered(
+                select(func.count(Execution.id)), script_id, statuses, since, until
+            )
+        )
+
+    def _filtered(
+        self,
+        query,
+        script_id: Optional[str],
+        statuses: Optional[List[str]],
+        since: Optional[datetime],
+        until: Optional[datetime],
+    ):
+        """Apply the filters shared by the history page and its count"""
         if script_id:
             query = query.filter(Execution.script_id == script_id)
+        if statuses:
+            query = query.filter(Execution.status.in_(statuses))
+        if since:
+            query = query.filter(Execution.created_at >= since)
+        if until:
+            query = query.filter(Execution.created_at < until)
+        return query
+
+    async def get_for_update(self, id: str) -> Optional[Execution]:
+        """Get execution by ID, row-locked until the transaction ends"""
+        return await self.session.get(Execution, id, with_for_update=True)
+
+    async def get_running(self, script_id: str) -> Optional[Execution]:
+        """Get the latest queued or running execution of a script, outside
+        of batches and pipelines"""
+        result = await self.session.scalars(
+            select(Execution)
+            .filter(
+                Execution.script_id == script_id,
+                Execution.status.in_(("queued", "running")),
+                Execution.batch_id.is_(None),
+                Execution.pipeline_run_id.is_(None),
+            )
+            .order_by(Execution.started_at.desc())
+            .limit(1)
+        )
+        return result.first()
+
+    async def create_many(self, rows: List[Dict[str, Any]]) -> List[Execution]:
+        """Create several execution records in one flush"""
+        executions = [Execution(**data) for data in rows]
+        self.session.add_all(executions)
+        await self.session.flush()
+        return executions
+
+    async def get_inline_output(self, limit: int) -> List[Execution]:
+        """Get finished executions whose output predates the log store"""
+        result = await self.session.scalars(
+            select(Execution)
+            .filter(
+                Execution.status.in_(Execution.FINISHED),
+                Execution.output != "",
+                ~exists().where(ExecutionLogChunk.execution_id == Execution.id),
+            )
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        return list(result.all())
 
-        return query.order_by(Execution.updated_at.desc()).limit(limit).all()
+    async def get_for_retention(
+        self, before: datetime, retention: Sequence[str], limit: int
+    ) -> List[Execution]:
+        """Get finished executions completed before `before` whose log is
+        still at one of the `retention` levels"""
+        result = await self.session.scalars(
+            select(Execution)
+            .filter(
+                Execution.log_retention.in_(retention),
+                Execution.completed_at < before,
+                Execution.status.in_(Execution.FINISHED),
+            )
+            .order_by(Execution.completed_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        return list(result.all())
 
-    def get_by_id(self, id: str) -> Optional[Execution]:
-        """Get execution by ID"""
-        return self.session.query(Execution).filter(Execution.id == id).first()
+    async def get_unfinished(self) -> List[Execution]:
+        """Get every queued or running execution"""
+        result = await self.session.scalars(
+            select(Execution).filter(Execution.status.in_(("queued", "running")))
+        )
+        return list(result.all())
 
-    def create(self, data: Dict[str, Any]) -> Execution:
-        """Create a new execution record"""
-        execution = Execution(**data)
-        self.session.add(execution)
-        self.session.flush()
-        return execution
+    async def get_by_batch(
+        self, batch_id: str, fields: Sequence[str] = Execution.FIELDS
+    ) -> List[Execution]:
+        """Get the executions of a batch in batch order, loading only `fields`"""
+        result = await self.session.scalars(
+            select(Execution)
+            .options(load_only(*(getattr(Execution, field) for field in fields)))
+            .filter(Execution.batch_id == batch_id)
+            .order_by(Execution.batch_index)
+        )
+        return list(result.all())
+
+    async def status_counts(
+        self, script_id: Optional[str] = None, batch_id: Optional[str] = None
+    ) -> Dict[str, int]:
+        """Count executions in total and per status in a single pass"""
+        query = select(
+            func.count(Execution.id),
+            *(
+                func.count(Execution.id).filter(Execution.status == status)
+                for status in Execution.STATUSES
+            ),
+        )
+        if script_id:
+            query = query.filter(Execution.script_id == script_id)
+        if batch_id:
+            query = query.filter(Execution.batch_id == batch_id)
 
-    def update(self, id: str, data: Dict[str, Any]) -> Optional[Execution]:
-        """Update an existing execution"""
-        execution = self.get_by_id(id)
-        if not execution:
-            return None
+        total, *counts = (await self.session.execute(query)).one()
+        return {"total": total, **dict(zip(Execution.STATUSES, counts))}
 
-        for key, value in data.items():
-            if hasattr(execution, key):
-                setattr(execution, key, value)
 
-        self.session.flush()
-        return execution
+class AsyncBatchRepository(AsyncBaseRepository):
+    """Async repository for ExecutionBatch operations"""
 
-    def delete(self, id: str) -> bool:
-        """Delete an execution"""
-        execution = self.get_by_id(id)
-        if not execution:
-            return False
+    model = ExecutionBatch  # deleting a batch deletes its executions
 
-        self.session.delete(execution)
-        self.session.flush()
-        return True
+    async def get_all(
+        self, script_id: Optional[str] = None, limit: int = 100
+    ) -> List[ExecutionBatch]:
+        """Get the latest batches with optional filtering"""
+        query = select(ExecutionBatch)
+
+        if script_id:
+            query = query.filter(ExecutionBatch.script_id == script_id)
+
+        result = await self.session.scalars(
+            query.order_by(ExecutionBatch.created_at.desc()).limit(limit)
+        )
+        return list(result.all())
 
-    def count_by_status(self, status: str) -> int:
-        """Count executions by status"""
-        return (
-            self.session.query(func.count(Execution.id))
-            .filter(Execution.status == status)
-            .scalar()
+    async def get_running(self) -> List[ExecutionBatch]:
+        """Get every batch still in progress"""
+        result = await self.session.scalars(
+            select(ExecutionBatch).filter(ExecutionBatch.status == "running")
         )
+        return list(result.all())
+
+
+class AsyncPipelineRepository(AsyncBaseRepository):
+    """Async repository for Pipeline operations"""
+
+    model = Pipeline  # deleting a pipeline deletes its runs
+
+    async def get_all(self) -> List[Pipeline]:
+        """Get all pipelines by name"""
+        result = await self.session.scalars(select(Pipeline).order_by(Pipeline.name))
+        return list(result.all())
+
+    async def get_by_name(self, name: str) -> Optional[Pipeline]:
+        """Get pipeline by name"""
+        result = await self.session.scalars(
+            select(Pipeline).filter(Pipeline.name == name)
+        )
+        return result.first()
+
 
-    def count_total(self) -> int:
-        """Count total executions"""
-        return self.session.query(func.count(Execution.id)).scalar()
+class AsyncPipelineRunRepository(AsyncBaseRepository):
+    """Async repository for PipelineRun operations"""
+
+    model = PipelineRun  # deleting a run keeps its executions
+
+    async def get_all(
+        self, pipeline_id: Optional[str] = None, limit: int = 100
+    ) -> List[PipelineRun]:
+        """Get the latest runs with optional filtering"""
+        query = select(PipelineRun)
+
+        if pipeline_id:
+            query = query.filter(PipelineRun.pipeline_id == pipeline_id)
+
+        result = await self.session.scalars(
+            query.order_by(PipelineRun.created_at.desc()).limit(limit)
+        )
+        return list(result.all())
+
+    async def get_running(self) -> List[PipelineRun]:
+        """Get every run still in progress"""
+        result = await self.session.scalars(
+            select(PipelineRun).filter(PipelineRun.status == "running")
+        )
+        return list(result.all())
+
+
+class AsyncScheduleRepository(AsyncBaseRepository):
+    """Async repository for Schedule operations"""
+
+    model = Schedule
+
+    async def get_all(
+        self, script_id: Optional[str] = None, enabled: Optional[bool] = None
+    ) -> List[Schedule]:
+        """Get schedules, soonest due first, with optional filtering"""
+        query = select(Schedule)
+
+        if script_id:
+            query = query.filter(Schedule.script_id == script_id)
+        if enabled is not None:
+            query = query.filter(Schedule.enabled == enabled)
+
+        result = await self.session.scalars(
+            query.order_by(Schedule.next_run_at.asc().nulls_last(), Schedule.id)
+        )
+        return list(result.all())
+
+    async def get_for_update(self, id: str) -> Optional[Schedule]:
+        """Get schedule by ID, row-locked until the transaction ends"""
+        return await self.session.get(Schedule, id, with_for_update=True)
+
+
+class AsyncStatsRepository:
+    """Async repository for the maintained dashboard counters and rollups"""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get_counters(self) -> Dict[str, int]:
+        """Get every counter by name"""
+        result = await self.session.execute(
+            select(StatsCounter.name, StatsCounter.value)
+        )
+        return dict(result.all())
+
+    async def initialize(self, counters: Dict[str, int]) -> bool:
+        """Seed the counters unless present; True if this call seeded them"""
+        result = await self.session.execute(
+            pg_insert(StatsCounter)
+            .values(
+                [{"name": name, "value": value} for name, value in counters.items()]
+            )
+            .on_conflict_do_nothing()
+            .returning(StatsCounter.name)
+        )
+        return bool(result.all())
+
+    async def bump(self, deltas: Dict[str, int]) -> None:
+        """Add deltas to counters, creating missing ones
+
+        Rows are touched in name order so concurrent transactions can't
+        deadlock on each other.
+        """
+        rows = [
+            {"name": name, "value": delta}
+            for name, delta in sorted(deltas.items())
+            if delta
+        ]
+        if not rows:
+            return
+
+        query = pg_insert(StatsCounter)
+        await self.session.execute(
+            query.on_conflict_do_update(
+                index_elements=[StatsCounter.name],
+                set_={"value": StatsCounter.value + query.excluded.value},
+            ),
+            rows,
+        )
+
+    async def record(
+        self,
+        script_id: str,
+        bucket: datetime,
+        failed: bool,
+        duration_ms: int,
+        cpu_ms: int = 0,
+        max_rss_kb: int = 0,
+    ) -> None:
+        """Add a finished execution to its hourly rollup row"""
+        query = pg_insert(ExecutionStatsHourly).values(
+            script_id=script_id,
+            bucket=bucket,
+            executions=1,
+            failures=int(failed),
+            duration_ms=duration_ms,
+            cpu_ms=cpu_ms,
+            max_rss_kb=max_rss_kb,
+        )
+        await self.session.execute(
+            query.on_conflict_do_update(
+                index_elements=[
+                    ExecutionStatsHourly.script_id,
+                    ExecutionStatsHourly.bucket,
+                ],
+                set_={
+                    "executions": ExecutionStatsHourly.executions + 1,
+                    "failures": ExecutionStatsHourly.failures + query.excluded.failures,
+                    "duration_ms": ExecutionStatsHourly.duration_ms
+                    + query.excluded.duration_ms,
+                    "cpu_ms": ExecutionStatsHourly.cpu_ms + query.excluded.cpu_ms,
+                    "max_rss_kb": func.greatest(
+                        ExecutionStatsHourly.max_rss_kb, query.excluded.max_rss_kb
+                    ),
+                },
+            )
+        )
+
+    async def rebuild_hourly(self) -> None:
+        """Fill the hourly rollup from the executions table"""
+        # A literal, so the GROUP BY expression matches the select list
+        bucket = func.date_trunc(literal_column("'hour'"), Execution.started_at)
+        duration_ms = func.coalesce(
+            func.sum(
+                func.extract("epoch", Execution.completed_at - Execution.started_at)
+                * 1000
+            ),
+            0,
+        )
+        await self.session.execute(
+            pg_insert(ExecutionStatsHourly)
+            .from_select(
+                [
+                    "script_id",
+                    "bucket",
+                    "executions",
+                    "failures",
+                    "duration_ms",
+                    "cpu_ms",
+                    "max_rss_kb",
+                ],
+                select(
+                    Execution.script_id,
+                    bucket,
+                    func.count(Execution.id),
+                    func.count(Execution.id).filter(
+                        Execution.status.in_(Execution.FAILED)
+                    ),
+                    cast(duration_ms, BigInteger),
+                    func.coalesce(
+                        func.sum(Execution.cpu_user_ms + Execution.cpu_system_ms), 0
+                    ),
+                    func.coalesce(func.max(Execution.max_rss_kb), 0),
+                )
+                .filter(
+                    Execution.status.in_(Execution.FINISHED),
+                    Execution.started_at.isnot(None),
+                )
+                .group_by(Execution.script_id, bucket),
+            )
+            .on_conflict_do_nothing()
+        )
+
+    async def get_hourly(
+        self, since: datetime, script_id: Optional[str] = None
+    ) -> List[Tuple[datetime, int, int, int, int, int]]:
+        """Get (bucket, executions, failures, duration_ms, cpu_ms, max_rss_kb)
+        per hour since `since`"""
+        query = select(
+            ExecutionStatsHourly.bucket,
+            func.sum(ExecutionStatsHourly.executions),
+            func.sum(ExecutionStatsHourly.failures),
+            func.sum(ExecutionStatsHourly.duration_ms),
+            func.sum(ExecutionStatsHourly.cpu_ms),
+            func.max(ExecutionStatsHourly.max_rss_kb),
+        ).filter(ExecutionStatsHourly.bucket >= since)
+
+        if script_id:
+            query = query.filter(ExecutionStatsHourly.script_id == script_id)
+
+        result = await self.session.execute(
+            query.group_by(ExecutionStatsHourly.bucket).order_by(
+                ExecutionStatsHourly.bucket
+            )
+        )
+        return [tuple(row) for row in result.all()]
+
+
+class AsyncExecutionLogRepository:
+    """Async repository for the append-only execution log chunks"""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def append(self, chunks: List[Dict[str, Any]]) -> None:
+        """Insert a batch of chunks in a single executemany round trip"""
+        if chunks:
+            await self.session.execute(insert(ExecutionLogChunk), chunks)
+
+    async def get_chunks(
+        self,
+        execution_id: str,
+        stream: Optional[str] = None,
+        after_seq: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[ExecutionLogChunk]:
+        """Get the chunks of an execution in write order"""
+        query = select(ExecutionLogChunk).filter(
+            ExecutionLogChunk.execution_id == execution_id
+        )
+
+        if stream:
+            query = query.filter(ExecutionLogChunk.stream == stream)
+
+        if after_seq is not None:
+            query = query.filter(ExecutionLogChunk.seq > after_seq)
+
+        query = query.order_by(ExecutionLogChunk.seq)
+        if limit:
+            query = query.limit(limit)
+
+        result = await self.session.scalars(query)
+        return list(result.all())
+
+    async def read(
+        self,
+        execution_id: str,
+        offset: int,
+        limit: int,
+        stream: Optional[str] = None,
+    ) -> Tuple[int, bytes]:
+        """Read up to `limit` bytes starting at `offset`
+
+        Offsets address the combined log, or a single stream when `stream`
+        is given. Returns the offset the data actually starts at, which is
+        past `offset` when that part of the log was trimmed.
+        """
+        position = (
+            ExecutionLogChunk.stream_offset if stream else ExecutionLogChunk.offset
+        )
+        query = select(
+            position, ExecutionLogChunk.data, ExecutionLogChunk.codec
+        ).filter(
+            ExecutionLogChunk.execution_id == execution_id,
+            position + ExecutionLogChunk.size > offset,
+            position < offset + limit,
+        )
+
+        if stream:
+            query = query.filter(ExecutionLogChunk.stream == stream)
+
+        result = await self.session.execute(query.order_by(ExecutionLogChunk.seq))
+        rows = result.all()
+        if not rows:
+            # The whole window may have been trimmed; resume after it
+            query = select(func.min(position)).filter(
+                ExecutionLogChunk.execution_id == execution_id, position > offset
+            )
+            if stream:
+                query = query.filter(ExecutionLogChunk.stream == stream)
+            following = await self.session.scalar(query)
+            if following is None:
+                return offset, b""
+            return await self.read(execution_id, following, limit, stream)
+
+        # Stop at a range dropped by retention; a window that starts
+        # inside one resumes at the next byte still stored
+        first = rows[0][0]
+        data = bytearray()
+        for position, chunk, codec in rows:
+            if position != first + len(data):
+                break
+            data += decompress(codec, chunk)
+
+        start = max(offset, first)
+        return start, bytes(data[start - first : start - first + limit])
+
+    async def get_position(self, execution_id: str) -> Dict[str, Any]:
+        """Get the next seq and offsets to continue appending at"""
+        result = await self.session.execute(
+            select(
+                ExecutionLogChunk.stream,
+                func.max(ExecutionLogChunk.seq),
+                func.max(ExecutionLogChunk.offset + ExecutionLogChunk.size),
+                func.max(ExecutionLogChunk.stream_offset + ExecutionLogChunk.size),
+            )
+            .filter(ExecutionLogChunk.execution_id == execution_id)
+            .group_by(ExecutionLogChunk.stream)
+        )
+
+        position = {"seq": 0, "offset": 0, "stream_offsets": {}}
+        for stream, max_seq, end, stream_end in result.all():
+            position["seq"] = max(position["seq"], max_seq + 1)
+            position["offset"] = max(position["offset"], end)
+            position["stream_offsets"][stream] = stream_end
+        return position
+
+    async def totals(self, script_id: Optional[str] = None) -> Tuple[int, int]:
+        """Sum the (uncompressed, stored) bytes of the log, optionally per script"""
+        query = select(
+            func.coalesce(func.sum(ExecutionLogChunk.size), 0),
+            func.coalesce(func.sum(func.octet_length(ExecutionLogChunk.data)), 0),
+        )
+        if script_id:
+            query = query.join(Execution).filter(Execution.script_id == script_id)
+
+        size, stored = (await self.session.execute(query)).one()
+        return int(size), int(stored)
+
+    async def get_uncompressed(self, limit: int) -> List[ExecutionLogChunk]:
+        """Get chunks no compression has been tried on yet"""
+        result = await self.session.scalars(
+            select(ExecutionLogChunk)
+            .filter(ExecutionLogChunk.codec.is_(None))
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        return list(result.all())
+
+    async def delete_range(
+        self,
+        execution_id: str,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+    ) -> Tuple[int, int]:
+        """Delete the chunks lying entirely within [start, end) of the log
+
+        Returns the (uncompressed, stored) bytes removed.
+        """
+        query = delete(ExecutionLogChunk).filter(
+            ExecutionLogChunk.execution_id == execution_id
+        )
+        if start is not None:
+            query = query.filter(ExecutionLogChunk.offset >= start)
+        if end is not None:
+            query = query.filter(
+                ExecutionLogChunk.offset + ExecutionLogChunk.size <= end
+            )
+
+        result = await self.session.execute(
+            query.returning(
+                ExecutionLogChunk.size, func.octet_length(ExecutionLogChunk.data)
+            )
+        )
+        rows = result.all()
+        return sum(row[0] for row in rows), sum(row[1] for row in rows)
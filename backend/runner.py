@@ -0,0 +1,424 @@
+import asyncio
+import collections
+import hashlib
+import os
+import resource
+import signal
+import socket
+import subprocess
+import tempfile
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# How a script reaches bash: memfd, pipe or file (see spawn_script)
+EXECUTION_MODE = os.getenv(
+    "EXECUTION_MODE", "memfd" if hasattr(os, "memfd_create") else "file"
+)
+
+# Run under `stdbuf -oL -eL` so programs line-buffer into the output pipes
+EXECUTION_LINE_BUFFERED = os.getenv("EXECUTION_LINE_BUFFERED", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+# Content-addressed scripts for the file mode
+SCRIPT_DIR = os.getenv(
+    "SCRIPT_DIR", os.path.join(tempfile.gettempdir(), "zeploy-scripts")
+)
+
+MODES = ("memfd", "pipe", "file")
+
+# Warm shells kept ready for executions; 0 disables the pool. Pooled
+# scripts are read from a pipe, as in the pipe mode.
+EXECUTION_POOL_SIZE = int(os.getenv("EXECUTION_POOL_SIZE", 0))
+
+# Recorded with each execution's pid: a pid only means something on its host
+HOSTNAME = socket.gethostname()
+
+
+def _boot_id() -> Optional[str]:
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+# Tells whether a pid recorded on this host predates a reboot
+BOOT_ID = _boot_id()
+
+
+# Per-script limits and the rlimit each maps to
+RLIMITS = {
+    "cpu_seconds": resource.RLIMIT_CPU,
+    "memory_bytes": resource.RLIMIT_AS,
+    "open_files": resource.RLIMIT_NOFILE,
+}
+
+# The ulimit option setting each rlimit, and its unit in bytes or seconds
+ULIMIT_OPTIONS = {
+    resource.RLIMIT_CPU: ("-t", 1),
+    resource.RLIMIT_AS: ("-v", 1024),
+    resource.RLIMIT_NOFILE: ("-n", 1),
+}
+
+
+def _command(*args: str, rlimits: Sequence[Tuple[int, int]] = ()) -> List[str]:
+    """bash on `args`, under `rlimits` set by a shell that then execs it
+
+    Setting them in the child from Python (preexec_fn) could deadlock it,
+    as the server runs threads.
+    """
+    command = ["stdbuf", "-oL", "-eL"] if EXECUTION_LINE_BUFFERED else []
+    command += ["bash", *args]
+    if rlimits:
+        options = " ".join(
+            f"{ULIMIT_OPTIONS[which][0]} {max(1, value // ULIMIT_OPTIONS[which][1])}"
+            for which, value in rlimits
+        )
+        command = ["bash", "-c", f'ulimit {options} && exec "$@"', "bash", *command]
+    return command
+
+
+def _rlimits(limits: Optional[Dict[str, Optional[int]]]) -> List[Tuple[int, int]]:
+    """(resource, value) pairs for the set limits, kept under our hard limits"""
+    rlimits = []
+    for name, value in (limits or {}).items():
+        if value:
+            hard = resource.getrlimit(RLIMITS[name])[1]
+            if hard != resource.RLIM_INFINITY:
+                value = min(value, hard)
+            rlimits.append((RLIMITS[name], value))
+    return rlimits
+
+
+class ScriptProcess:
+    """A child process with asyncio pipes, reaped with wait4
+
+    asyncio's own subprocesses are reaped by waitpid, which drops the
+    child's resource usage; here a thread waits with wait4 and keeps it.
+    Mirrors the parts of asyncio.subprocess.Process executions use, except
+    that `wait` doesn't wait for the pipes. Its stdin is /dev/null; a shell
+    started by _start_piped reads its script through `script` instead.
+
+    The child leads a session and process group of its own, and signals go
+    to that whole group, so whatever the script started goes down with it.
+    """
+
+    def __init__(self, popen: subprocess.Popen):
+        self.pid = popen.pid
+        self.returncode = None
+        self.rusage = None
+        self.script = None
+        self.stdout = None
+        self.stderr = None
+        self._popen = popen
+        self._exited = asyncio.get_running_loop().create_future()
+
+    @classmethod
+    async def start(cls, args: List[str], **popen_kwargs) -> "ScriptProcess":
+        loop = asyncio.get_running_loop()
+        popen = subprocess.Popen(
+            args,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+            **popen_kwargs,
+        )
+        process = cls(popen)
+        threading.Thread(target=process._reap, args=(loop,), daemon=True).start()
+
+        process.stdout = await cls._reader(loop, popen.stdout)
+        process.stderr = await cls._reader(loop, popen.stderr)
+        return process
+
+    @staticmethod
+    async def _reader(loop, pipe) -> asyncio.StreamReader:
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+        return reader
+
+    def _reap(self, loop: asyncio.AbstractEventLoop):
+        _, status, rusage = os.wait4(self.pid, 0)
+        try:
+            loop.call_soon_threadsafe(
+                self._set_exited, os.waitstatus_to_exitcode(status), rusage
+            )
+        except RuntimeError:
+            pass  # loop closed
+
+    def _set_exited(self, returncode: int, rusage):
+        self.returncode = self._popen.returncode = returncode
+        self.rusage = rusage
+        if not self._exited.done():
+            self._exited.set_result(returncode)
+
+    async def wait(self) -> int:
+        return await asyncio.shield(self._exited)
+
+    async def communicate(self) -> Tuple[bytes, bytes]:
+        stdout, stderr = await asyncio.gather(self.stdout.read(), self.stderr.read())
+        await self.wait()
+        return stdout, stderr
+
+    def send_signal(self, sig: int):
+        """Signal the process group; it outlives the script while any of
+        the script's children are left in it"""
+        os.killpg(self.pid, sig)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def limit(self, limits: Optional[Dict[str, Optional[int]]]):
+        """Apply limits to the running process"""
+        for which, value in _rlimits(limits):
+            resource.prlimit(self.pid, which, (value, value))
+
+    def usage(self) -> Dict[str, int]:
+        """Resource usage of the exited process and the children it waited for"""
+        usage = self.rusage
+        return {
+            "cpu_user_ms": int(usage.ru_utime * 1000),
+            "cpu_system_ms": int(usage.ru_stime * 1000),
+            "max_rss_kb": usage.ru_maxrss,
+            "block_input": usage.ru_inblock,
+            "block_output": usage.ru_oublock,
+            "ctx_voluntary": usage.ru_nvcsw,
+            "ctx_involuntary": usage.ru_nivcsw,
+        }
+
+
+def _proc_stat(pid: int) -> Optional[Tuple[str, int, int]]:
+    """(state, process group, start time in clock ticks since boot) from /proc"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name may hold spaces and parentheses; fields follow the last ")"
+    fields = stat.rsplit(")", 1)[1].split()
+    return fields[0], int(fields[2]), int(fields[19])
+
+
+def process_start_time(pid: int) -> Optional[int]:
+    """When a process started, to recognise it later despite pid reuse"""
+    stat = _proc_stat(pid)
+    return stat[2] if stat else None
+
+
+def kill_leftovers(pgid: int, started: int) -> int:
+    """SIGKILL what is left of a script's process group on this host
+
+    Only live members of group `pgid` that started no earlier than its
+    leader did (`started`) are killed, so a recycled id is left alone.
+    Returns how many processes were signalled; 0 where there is no /proc.
+    """
+    try:
+        pids = [int(entry) for entry in os.listdir("/proc") if entry.isdigit()]
+    except OSError:
+        return 0
+
+    killed = 0
+    for pid in pids:
+        stat = _proc_stat(pid)
+        if stat and stat[0] != "Z" and stat[1] == pgid and stat[2] >= started:
+            try:
+                os.kill(pid, signal.SIGKILL)
+                killed += 1
+            except ProcessLookupError:
+                pass
+    return killed
+
+
+async def _start_piped(
+    args: Sequence[str] = (), rlimits: Sequence[Tuple[int, int]] = (), **options
+) -> ScriptProcess:
+    """Start bash on a script it reads from a pipe passed as /dev/fd/N
+
+    The script is written through the process's `script` transport. Bash
+    moves the pipe out of its commands' reach, so one that reads stdin
+    gets /dev/null rather than the rest of the script.
+    """
+    read_fd, write_fd = os.pipe()
+    try:
+        process = await ScriptProcess.start(
+            _command(f"/dev/fd/{read_fd}", *args, rlimits=rlimits),
+            pass_fds=(read_fd,),
+            **options,
+        )
+    except BaseException:
+        os.close(write_fd)
+        raise
+    finally:
+        os.close(read_fd)
+
+    process.script, _ = await asyncio.get_running_loop().connect_write_pipe(
+        asyncio.Protocol, os.fdopen(write_fd, "wb", buffering=0)
+    )
+    return process
+
+
+def script_file(content: str) -> str:
+    """Path of a file holding `content`, written once per distinct content"""
+    data = content.encode()
+    path = os.path.join(SCRIPT_DIR, f"{hashlib.sha256(data).hexdigest()}.sh")
+    if not os.path.exists(path):
+        os.makedirs(SCRIPT_DIR, mode=0o700, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=SCRIPT_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(temp, 0o500)
+        # Atomic, so concurrent writers of the same script are harmless
+        os.replace(temp, path)
+    return path
+
+
+async def spawn_script(
+    content: str,
+    mode: str = EXECUTION_MODE,
+    limits: Optional[Dict[str, Optional[int]]] = None,
+    env: Optional[Dict[str, str]] = None,
+    args: Sequence[str] = (),
+) -> ScriptProcess:
+    """Start bash on a script with its stdout and stderr piped
+
+    memfd: the script is an in-memory file passed as /dev/fd/N, so nothing
+    touches the disk. pipe: bash reads the script from a pipe passed the
+    same way, for systems without memfd. file: bash runs a
+    content-addressed copy under SCRIPT_DIR, for scripts that need a real
+    path. In every mode the script's stdin is /dev/null. `limits` (see
+    RLIMITS) are set before bash starts; `env` is added to the environment
+    and `args` become the positional parameters.
+    """
+    rlimits = _rlimits(limits)
+    options = {}
+    if env:
+        options["env"] = {**os.environ, **env}
+
+    if mode == "memfd":
+        fd = os.memfd_create("script")
+        try:
+            with os.fdopen(fd, "wb", closefd=False) as f:
+                f.write(content.encode())
+            return await ScriptProcess.start(
+                _command(f"/dev/fd/{fd}", *args, rlimits=rlimits),
+                pass_fds=(fd,),
+                **options,
+            )
+        finally:
+            os.close(fd)
+
+    if mode == "pipe":
+        process = await _start_piped(args, rlimits, **options)
+        # Buffered by the transport and flushed as bash reads; never blocks
+        process.script.write(content.encode())
+        process.script.close()
+        return process
+
+    if mode == "file":
+        path = await asyncio.to_thread(script_file, content)
+        return await ScriptProcess.start(
+            _command(path, *args, rlimits=rlimits), **options
+        )
+
+    raise ValueError(f"Unknown execution mode: {mode}")
+
+
+class ShellPool:
+    """Pre-started shells waiting to read a script from a pipe
+
+    Handing a script to a warm shell skips the fork/exec and bash start-up
+    of a fresh spawn. Every shell runs a single script and is replaced once
+    that script exits, so no two executions share a process and the
+    replacement's fork, which blocks the event loop, stays off the
+    script's path to its first output. An empty or disabled (size 0) pool
+    falls back to spawn_script, as do scripts with their own environment
+    or arguments, which a running shell can't take.
+    """
+
+    def __init__(self, size: int = 0):
+        self.size = max(0, size)
+        self._idle = collections.deque()
+        self._filler = None
+        self._waiters = set()
+        self._closed = False
+
+    def start(self):
+        self._closed = False
+        self._refill()
+
+    async def stop(self):
+        self._closed = True
+        for waiter in self._waiters:
+            waiter.cancel()
+        if self._filler:
+            self._filler.cancel()
+            try:
+                await self._filler
+            except asyncio.CancelledError:
+                pass
+            self._filler = None
+
+        while self._idle:
+            process = self._idle.popleft()
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+    def _refill(self):
+        if (
+            self.size
+            and not self._closed
+            and not (self._filler and not self._filler.done())
+        ):
+            self._filler = asyncio.create_task(self._fill())
+
+    async def _fill(self):
+        while len(self._idle) < self.size:
+            self._idle.append(await _start_piped())
+
+    async def spawn(
+        self,
+        content: str,
+        limits: Optional[Dict[str, Optional[int]]] = None,
+        env: Optional[Dict[str, str]] = None,
+        args: Sequence[str] = (),
+    ) -> ScriptProcess:
+        """Run a script on a warm shell, or on a fresh one if none is idle"""
+        if env or args:
+            return await spawn_script(content, limits=limits, env=env, args=args)
+
+        process = None
+        while self._idle and process is None:
+            candidate = self._idle.popleft()
+            if candidate.returncode is None:
+                process = candidate
+
+        if process is not None and limits and not hasattr(resource, "prlimit"):
+            # Can't limit a running shell here; it goes back to the pool
+            self._idle.appendleft(process)
+            process = None
+
+        if process is None:
+            process = await spawn_script(content, limits=limits)
+        else:
+            # The shell is idle on its script pipe, so limits are in place
+            # before the script's first command
+            process.limit(limits)
+            process.script.write(content.encode())
+            process.script.close()
+
+        if self.size:
+            waiter = asyncio.create_task(self._replace(process))
+            self._waiters.add(waiter)
+            waiter.add_done_callback(self._waiters.discard)
+        return process
+
+    async def _replace(self, process: ScriptProcess):
+        await process.wait()
+        self._refill()
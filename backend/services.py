@@ -1,324 +1,2414 @@
 import logging
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Awaitable, Callable, Tuple
 import subprocess
+import base64
+import codecs
+import collections
+import glob
+import json
+import heapq
+import itertools
 import os
+import random
+import re
+import shutil
+import tempfile
+import time
 import asyncio
-from datetime import datetime
-from fastapi import WebSocket
+from datetime import datetime, timedelta, timezone
+from fastapi import WebSocket, WebSocketDisconnect
 from database import Database
-from repositories import ScriptRepository, ExecutionRepository
-from models import Script, Execution
+from socket_utils import ExecutionBroadcaster
+from registry import ExecutionRegistry
+from cache import TTLCache
+from compression import compress
+from cron import CronExpression
+from runner import (
+    BOOT_ID,
+    EXECUTION_POOL_SIZE,
+    HOSTNAME,
+    ShellPool,
+    kill_leftovers,
+    process_start_time,
+)
+from repositories import (
+    AsyncScriptRepository,
+    AsyncExecutionRepository,
+    AsyncBatchRepository,
+    AsyncPipelineRepository,
+    AsyncPipelineRunRepository,
+    AsyncScheduleRepository,
+    AsyncExecutionLogRepository,
+    AsyncStatsRepository,
+)
+from models import Script, Execution, Schedule
 
 logger = logging.getLogger("service")
 
+# Execution log chunking/flushing thresholds
+LOG_CHUNK_BYTES = int(os.getenv("LOG_CHUNK_BYTES", 64 * 1024))
+LOG_FLUSH_BYTES = int(os.getenv("LOG_FLUSH_BYTES", 256 * 1024))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", 0.5))
+
+# Script list page size, and the fields a list returns unless asked otherwise
+SCRIPT_PAGE_SIZE = int(os.getenv("SCRIPT_PAGE_SIZE", 50))
+SCRIPT_LIST_FIELDS = [field for field in Script.FIELDS if field != "content"]
+
+# Execution history page size; list rows leave out the output/error text
+EXECUTION_PAGE_SIZE = int(os.getenv("EXECUTION_PAGE_SIZE", 100))
+EXECUTION_LIST_FIELDS = [
+    field for field in Execution.FIELDS if field not in ("output", "error")
+]
+
+# Caps on each execution's stored and streamed output: the first
+# EXECUTION_OUTPUT_HEAD_BYTES and last EXECUTION_OUTPUT_TAIL_BYTES are kept.
+# Scripts may set lower caps of their own; a head cap of 0 is no cap.
+EXECUTION_OUTPUT_HEAD_BYTES = int(
+    os.getenv("EXECUTION_OUTPUT_HEAD_BYTES", 16 * 1024 * 1024)
+)
+EXECUTION_OUTPUT_TAIL_BYTES = int(os.getenv("EXECUTION_OUTPUT_TAIL_BYTES", 1024 * 1024))
+
+# Wall-clock limit in seconds for scripts without their own; 0 is none
+EXECUTION_TIMEOUT = float(os.getenv("EXECUTION_TIMEOUT", 0))
+
+# Execution output retention: full logs for LOG_RETENTION_FULL_DAYS, then
+# only the first/last LOG_RETAIN_HEAD/TAIL_BYTES until LOG_RETENTION_DAYS,
+# then metadata only. 0 disables a tier.
+LOG_RETENTION_FULL_DAYS = float(os.getenv("LOG_RETENTION_FULL_DAYS", 30))
+LOG_RETENTION_DAYS = float(os.getenv("LOG_RETENTION_DAYS", 180))
+LOG_RETAIN_HEAD_BYTES = int(os.getenv("LOG_RETAIN_HEAD_BYTES", 64 * 1024))
+LOG_RETAIN_TAIL_BYTES = int(os.getenv("LOG_RETAIN_TAIL_BYTES", 64 * 1024))
+LOG_COMPACT_INTERVAL = float(os.getenv("LOG_COMPACT_INTERVAL", 3600))
+LOG_COMPACT_BATCH = int(os.getenv("LOG_COMPACT_BATCH", 200))
+
+# Seconds tag facet counts are served from memory
+TAG_CACHE_TTL = float(os.getenv("TAG_CACHE_TTL", 30))
+
+# Scripts kept in memory per worker; writes on any worker evict them
+SCRIPT_CACHE_SIZE = int(os.getenv("SCRIPT_CACHE_SIZE", 1024))
+SCRIPT_CACHE_TTL = float(os.getenv("SCRIPT_CACHE_TTL", 300))
+
+# Executions allowed to run at once; the rest wait in the scheduler queue
+MAX_CONCURRENT_EXECUTIONS = int(os.getenv("MAX_CONCURRENT_EXECUTIONS", 8))
+
+# Default priority per script tag, e.g. "deploy=10,healthcheck=-5"
+EXECUTION_TAG_PRIORITIES = {
+    tag.strip(): int(priority)
+    for tag, _, priority in (
+        item.partition("=")
+        for item in os.getenv("EXECUTION_TAG_PRIORITIES", "").split(",")
+        if "=" in item
+    )
+}
+
+# Tries to take a script's cross-worker lock before giving up on starting it
+REGISTRY_CLAIM_ATTEMPTS = int(os.getenv("REGISTRY_CLAIM_ATTEMPTS", 5))
+
+# Size of each read from an execution's stdout/stderr pipe
+STREAM_READ_BYTES = int(os.getenv("STREAM_READ_BYTES", 64 * 1024))
+
+# Default size cap of a coalesced WebSocket frame
+WS_BATCH_BYTES = int(os.getenv("WS_BATCH_BYTES", 64 * 1024))
+
+# Seconds a cancelled script's process group gets to exit on SIGTERM
+# before it is sent SIGKILL
+CANCEL_GRACE_SECONDS = float(os.getenv("CANCEL_GRACE_SECONDS", 10))
+
+# Executions of one batch run at once unless it asks otherwise, and the
+# most parameter sets a batch may have
+BATCH_PARALLELISM = int(os.getenv("BATCH_PARALLELISM", 4))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 1000))
+
+# Per-run directory shared by a pipeline's stages, removed after the run,
+# and the most bytes of a stage's $PIPELINE_OUTPUT file that are read
+PIPELINE_ARTIFACT_DIR = os.getenv(
+    "PIPELINE_ARTIFACT_DIR", os.path.join(tempfile.gettempdir(), "zeploy-pipelines")
+)
+PIPELINE_OUTPUT_BYTES = int(os.getenv("PIPELINE_OUTPUT_BYTES", 64 * 1024))
+
+# Seconds between a worker's attempts to become the one firing schedules,
+# and the longest the leader sleeps before checking it still leads
+SCHEDULER_LEADER_INTERVAL = float(os.getenv("SCHEDULER_LEADER_INTERVAL", 15))
+
+# Seconds between checks whether the run a queued schedule waits on ended
+SCHEDULE_OVERLAP_POLL = float(os.getenv("SCHEDULE_OVERLAP_POLL", 1))
+
+# Seconds between passes of the reaper settling executions of dead workers
+REAPER_INTERVAL = float(os.getenv("REAPER_INTERVAL", 60))
+
+# Seconds before a leftover temp-dir script_*.sh, as runs wrote before
+# scripts moved to SCRIPT_DIR, is removed
+REAPER_TEMP_FILE_AGE = float(os.getenv("REAPER_TEMP_FILE_AGE", 3600))
+
+STAGE_NAME = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+OUTPUT_KEY = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# Columns of a batch's executions in batch views
+BATCH_EXECUTION_FIELDS = (
+    "id",
+    "batch_index",
+    "parameters",
+    "status",
+    "exit_code",
+    "started_at",
+    "completed_at",
+    "wall_ms",
+    "cpu_user_ms",
+    "cpu_system_ms",
+    "max_rss_kb",
+)
+
+
+def encode_cursor(*values: Any) -> str:
+    """Opaque keyset pagination cursor"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def output_caps(script: Dict[str, Any]) -> Tuple[Optional[int], int]:
+    """The (head, tail) byte caps for a script's output; head None is no cap
+
+    A script's own caps apply, but never above the global ones.
+    """
+    head = script.get("output_head_bytes")
+    tail = script.get("output_tail_bytes")
+    if tail is None:
+        tail = EXECUTION_OUTPUT_TAIL_BYTES
+
+    if EXECUTION_OUTPUT_HEAD_BYTES:
+        head = (
+            min(head, EXECUTION_OUTPUT_HEAD_BYTES)
+            if head
+            else EXECUTION_OUTPUT_HEAD_BYTES
+        )
+        tail = min(tail, EXECUTION_OUTPUT_TAIL_BYTES)
+    return head or None, tail
+
+
+def batch_summary(batch: Dict[str, Any], executions: List[Dict[str, Any]]) -> Dict:
+    """Aggregate a batch's executions: counts per status, timings and the
+    places of the runs that did not succeed"""
+    counts = collections.Counter(execution["status"] for execution in executions)
+    walls = [execution["wall_ms"] or 0 for execution in executions]
+    end = (
+        datetime.fromisoformat(batch["completed_at"])
+        if batch["completed_at"]
+        else datetime.utcnow()
+    )
+    return {
+        "total": batch["total"],
+        **{status: counts[status] for status in Execution.STATUSES},
+        "duration_ms": int(
+            (end - datetime.fromisoformat(batch["created_at"])).total_seconds() * 1000
+        ),
+        "max_wall_ms": max(walls, default=0),
+        "total_wall_ms": sum(walls),
+        "total_cpu_ms": sum(
+            (execution["cpu_user_ms"] or 0) + (execution["cpu_system_ms"] or 0)
+            for execution in executions
+        ),
+        "failed_indexes": [
+            execution["batch_index"]
+            for execution in executions
+            if execution["status"] in Execution.FAILED
+        ],
+    }
+
+
+def stage_order(stages: List[Dict[str, Any]]) -> List[str]:
+    """Names of a pipeline's stages with every stage after the ones it needs
+
+    Raises ValueError unless the stages have unique, valid names and their
+    `needs` form a DAG.
+    """
+    needs = {}
+    for stage in stages:
+        name = stage["name"]
+        if not STAGE_NAME.match(name):
+            raise ValueError(
+                f"Stage name '{name}' must be 1-64 letters, digits, '_' or '-'"
+            )
+        if name in needs:
+            raise ValueError(f"Duplicate stage name '{name}'")
+        needs[name] = set(stage.get("needs") or [])
+
+    for name, required in needs.items():
+        unknown = required - needs.keys()
+        if unknown:
+            raise ValueError(f"Stage '{name}' needs unknown stages {sorted(unknown)}")
+
+    order = []
+    waiting = {name: set(required) for name, required in needs.items()}
+    ready = [name for name, required in waiting.items() if not required]
+    while ready:
+        name = ready.pop()
+        order.append(name)
+        for other, required in waiting.items():
+            if name in required:
+                required.discard(name)
+                if not required:
+                    ready.append(other)
+    if len(order) != len(needs):
+        cycle = sorted(name for name in needs if name not in order)
+        raise ValueError(f"Stages {cycle} depend on each other in a cycle")
+    return order
+
+
+def critical_path(stages: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """The chain of stages that decided a pipeline run's duration
+
+    Walks back from the stage that finished last through the need that
+    finished last. `total_stage_ms` adds up every stage's own time: what
+    running them one after another would have taken.
+    """
+    finished = {
+        name: stage for name, stage in stages.items() if stage.get("end_ms") is not None
+    }
+    path = []
+    name = max(finished, key=lambda name: finished[name]["end_ms"], default=None)
+    while name is not None:
+        path.append(name)
+        name = max(
+            (need for need in stages[name]["needs"] if need in finished),
+            key=lambda need: finished[need]["end_ms"],
+            default=None,
+        )
+    path.reverse()
+    return {
+        "critical_path": path,
+        "critical_path_ms": finished[path[-1]]["end_ms"] if path else 0,
+        "total_stage_ms": sum(
+            stage["end_ms"] - stage["start_ms"] for stage in finished.values()
+        ),
+    }
+
+
+def next_run_at(
+    cron: Optional[str],
+    interval_seconds: Optional[int],
+    after: datetime,
+    anchor: Optional[datetime] = None,
+) -> datetime:
+    """Next nominal fire time of a schedule strictly after `after`
+
+    Intervals keep to the grid of `anchor`, the previous fire time, so
+    fires don't drift by however late each one ran.
+    """
+    if cron:
+        return CronExpression(cron).next_after(after)
+
+    interval = timedelta(seconds=interval_seconds)
+    if anchor is None or anchor > after:
+        return after + interval
+    return anchor + interval * ((after - anchor) // interval + 1)
+
+
+def read_stage_outputs(path: str) -> Dict[str, str]:
+    """KEY=VALUE lines a stage wrote to its $PIPELINE_OUTPUT file"""
+    try:
+        with open(path, "rb") as f:
+            data = f.read(PIPELINE_OUTPUT_BYTES)
+    except FileNotFoundError:
+        return {}
+
+    outputs = {}
+    for line in data.decode(errors="replace").splitlines():
+        key, sep, value = line.partition("=")
+        if sep and OUTPUT_KEY.match(key.strip()):
+            outputs[key.strip()] = value
+    return outputs
+
+
+def _utf8_boundary(data: bytes) -> int:
+    """Length of `data` without a trailing incomplete UTF-8 sequence"""
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte & 0xC0 != 0x80:  # not a continuation byte
+            if 0xC0 <= byte < 0xF8:  # starts a multibyte sequence
+                width = 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+                if back < width:
+                    return len(data) - back
+            break
+    return len(data)
+
+
+def collapse_progress(text: str) -> str:
+    """Reduce carriage-return redraws to the last state of each line
+
+    CRLF becomes LF, and a line redrawn with bare \r keeps only its final
+    redraw, prefixed with \r so viewers overwrite the line in place.
+    """
+    if "\r" not in text:
+        return text
+
+    lines = text.split("\n")
+    for i, line in enumerate(lines):
+        if i < len(lines) - 1 and line.endswith("\r"):
+            line = line[:-1]
+        if "\r" in line:
+            line = "\r" + line.rpartition("\r")[2]
+        lines[i] = line
+    return "\n".join(lines)
+
+
+class OutputDecoder:
+    """Incrementally turns one stream's raw output into viewer text
+
+    UTF-8 sequences split across reads are reassembled, and carriage-return
+    redraws are collapsed with collapse_progress.
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._pending_cr = ""
+
+    def decode(self, data: bytes, final: bool = False) -> str:
+        text = self._pending_cr + self._decoder.decode(data, final=final)
+
+        # Hold back a trailing \r, it may be the first half of \r\n
+        self._pending_cr = ""
+        if not final and text.endswith("\r"):
+            text, self._pending_cr = text[:-1], "\r"
+
+        return collapse_progress(text)
+
+
+class ExecutionLogWriter:
+    """Buffers execution output and appends it to the log store in batches
+
+    Consecutive writes to the same stream are merged into chunks of at most
+    LOG_CHUNK_BYTES, and pending chunks are inserted together once
+    LOG_FLUSH_BYTES are buffered or LOG_FLUSH_INTERVAL has elapsed, so the
+    memory held per execution stays bounded.
+
+    With `head_bytes` set, only the first `head_bytes` of the combined log
+    are stored as they arrive; after that the last `tail_bytes` are kept in
+    memory and stored on close, leaving a gap in the log offsets.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        execution_id: str,
+        head_bytes: Optional[int] = None,
+        tail_bytes: int = 0,
+    ):
+        self.db = db
+        self.execution_id = execution_id
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.seq = 0
+        self.end = 0  # combined log offset after everything written so far
+        self.stream_ends = {}  # stream: offset after everything written so far
+        self.stored = 0  # bytes kept in the log store
+        self.tail = []  # (stream, offset, data) stored on close
+        self.truncation_announced = False
+        self._pending = []  # [stream, bytearray, ts, offset, stream_offset]
+        self._pending_bytes = 0
+        self._tail = collections.deque()  # same layout as _pending
+        self._tail_bytes = 0
+        self._lock = asyncio.Lock()
+        self._flusher = None
+
+    @property
+    def truncated(self) -> bool:
+        return self.head_bytes is not None and self.end > self.head_bytes
+
+    async def open(self):
+        """Resume after any chunks already stored and start the flusher"""
+        async with self.db.async_session_scope() as session:
+            repo = AsyncExecutionLogRepository(session)
+            position = await repo.get_position(self.execution_id)
+
+        self.seq = position["seq"]
+        self.end = position["offset"]
+        self.stream_ends = dict(position["stream_offsets"])
+        self._flusher = asyncio.create_task(self._flush_periodically())
+        return self
+
+    def in_head(self, offset: int, size: int) -> int:
+        """How many bytes of a write at `offset` fall within the stored head"""
+        if self.head_bytes is None:
+            return size
+        return max(0, min(size, self.head_bytes - offset))
+
+    async def write(self, stream: str, data: bytes) -> int:
+        """Buffer output, flushing when the batch is large enough
+
+        Returns the combined log offset the data was written at.
+        """
+        start = self.end
+        if not data:
+            return start
+
+        stream_start = self.stream_ends.get(stream, 0)
+        self.end += len(data)
+        self.stream_ends[stream] = stream_start + len(data)
+
+        head = self.in_head(start, len(data))
+        if head:
+            self._buffer(self._pending, stream, data[:head], start, stream_start)
+            self._pending_bytes += head
+        if head < len(data):
+            self._keep_tail(stream, data[head:], start + head, stream_start + head)
+
+        if self._pending_bytes >= LOG_FLUSH_BYTES:
+            await self.flush()
+        return start
+
+    def _buffer(self, buffer, stream, data, offset, stream_offset):
+        last = buffer[-1] if buffer else None
+        if (
+            last
+            and last[0] == stream
+            and last[3] + len(last[1]) == offset
+            and len(last[1]) + len(data) <= LOG_CHUNK_BYTES
+        ):
+            last[1].extend(data)
+        else:
+            buffer.append(
+                [stream, bytearray(data), datetime.utcnow(), offset, stream_offset]
+            )
+
+    def _keep_tail(self, stream, data, offset, stream_offset):
+        """Add to the in-memory tail, dropping what falls out of its window"""
+        if len(data) > self.tail_bytes:
+            skip = len(data) - self.tail_bytes
+            data, offset, stream_offset = (
+                data[skip:],
+                offset + skip,
+                stream_offset + skip,
+            )
+        if data:
+            self._buffer(self._tail, stream, data, offset, stream_offset)
+            self._tail_bytes += len(data)
+
+        while self._tail_bytes > self.tail_bytes:
+            first = self._tail[0]
+            excess = self._tail_bytes - self.tail_bytes
+            if len(first[1]) <= excess:
+                self._tail.popleft()
+                self._tail_bytes -= len(first[1])
+            else:
+                del first[1][:excess]
+                first[3] += excess
+                first[4] += excess
+                self._tail_bytes -= excess
+
+    async def flush(self):
+        """Append all pending chunks in one batched insert"""
+        async with self._lock:
+            if not self._pending:
+                return
+
+            pending, self._pending = self._pending, []
+            self._pending_bytes = 0
+
+            # Compress off the event loop; chunks are up to LOG_CHUNK_BYTES
+            packed = await asyncio.to_thread(
+                lambda: [compress(bytes(entry[1])) for entry in pending]
+            )
+
+            rows = []
+            for (stream, data, ts, offset, stream_offset), (codec, stored) in zip(
+                pending, packed
+            ):
+                rows.append(
+                    {
+                        "execution_id": self.execution_id,
+                        "seq": self.seq,
+                        "stream": stream,
+                        "offset": offset,
+                        "stream_offset": stream_offset,
+                        "size": len(data),
+                        "data": stored,
+                        "codec": codec,
+                        "ts": ts,
+                    }
+                )
+                self.seq += 1
+
+            async with self.db.async_session_scope() as session:
+                await AsyncExecutionLogRepository(session).append(rows)
+                await AsyncStatsRepository(session).bump(
+                    {
+                        "log_bytes": sum(row["size"] for row in rows),
+                        "log_stored_bytes": sum(len(row["data"]) for row in rows),
+                    }
+                )
+            self.stored += sum(row["size"] for row in rows)
+
+    async def close(self):
+        """Stop the flusher and write out whatever is still buffered,
+        including the kept tail"""
+        if self._flusher:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+
+        if self._tail:
+            await self.flush()
+            self.tail = [(entry[0], entry[3], bytes(entry[1])) for entry in self._tail]
+            self._pending.extend(self._tail)
+            self._tail.clear()
+            self._tail_bytes = 0
+        await self.flush()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(LOG_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to flush log of %s", self.execution_id)
+
 
 class ScriptService:
     """Service layer for Script operations"""
 
     def __init__(self):
         self.db = Database()
+        self.registry = ExecutionRegistry()
+        self.registry.on("script", self._on_script_changed)
+        self.registry.on("reconnect", self._on_reconnect)
+        self._tag_cache = TTLCache(maxsize=256, ttl=TAG_CACHE_TTL)
+        self._script_cache = TTLCache(maxsize=SCRIPT_CACHE_SIZE, ttl=SCRIPT_CACHE_TTL)
+        # Bumped on every eviction, so a read that raced a write isn't cached
+        self._generation = 0
 
-    def get_all_scripts(
-        self, tag: Optional[str] = None, search: Optional[str] = None
+    def _invalidate(self, script_id: str):
+        self._generation += 1
+        self._script_cache.pop(script_id)
+        self._tag_cache.clear()
+
+    async def _on_script_changed(self, message: Dict):
+        self._invalidate(message.get("script_id"))
+
+    async def _on_reconnect(self, message: Dict):
+        # Evictions may have been missed while the listener was down
+        self._generation += 1
+        self._script_cache.clear()
+        self._tag_cache.clear()
+
+    async def _changed(self, script_id: str):
+        """Evict a written script here right away and on the other workers"""
+        self._invalidate(script_id)
+        await self.registry.notify("script", script_id=script_id)
+
+    async def get_scripts_page(
+        self,
+        tags: Optional[List[str]] = None,
+        search: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = SCRIPT_PAGE_SIZE,
+        fields: Optional[List[str]] = None,
+        match: str = "all",
+    ) -> Dict:
+        """Get one page of scripts and the cursor of the next page
+
+        Only `fields` are loaded and returned; by default everything but
+        `content`. Raises ValueError for unknown fields or a bad cursor.
+        """
+        fields = list(fields or SCRIPT_LIST_FIELDS)
+        unknown = set(fields) - set(Script.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+
+        after = None
+        if cursor:
+            updated_at, script_id = decode_cursor(cursor)
+            after = (datetime.fromisoformat(updated_at), script_id)
+
+        # The keyset columns are always needed to build the next cursor
+        load = list(dict.fromkeys(fields + ["id", "updated_at"]))
+        async with self.db.async_session_scope() as session:
+            repo = AsyncScriptRepository(session)
+            scripts = await repo.get_page(tags, search, after, limit + 1, load, match)
+            total = await repo.count_filtered(tags, search, match)
+
+            next_cursor = None
+            if len(scripts) > limit:
+                scripts = scripts[:limit]
+                last = scripts[-1]
+                next_cursor = encode_cursor(last.updated_at.isoformat(), last.id)
+
+            return {
+                "items": [script.to_dict(fields) for script in scripts],
+                "total": total,
+                "next_cursor": next_cursor,
+            }
+
+    async def search_scripts(
+        self,
+        text: str,
+        limit: int = 20,
+        tags: Optional[List[str]] = None,
+        match: str = "all",
     ) -> List[Dict]:
-        """Get all scripts"""
-        with self.db.session_scope() as session:
-            repo = ScriptRepository(session)
-            scripts = repo.get_all(tag=tag, search=search)
-            return [script.to_dict() for script in scripts]
+        """Ranked search over script name, description and content"""
+        async with self.db.async_session_scope() as session:
+            repo = AsyncScriptRepository(session)
+            return await repo.search(text, limit=limit, tags=tags, match=match)
 
-    def get_script(self, script_id: str) -> Optional[Dict]:
-        """Get a script by ID"""
-        with self.db.session_scope() as session:
-            repo = ScriptRepository(session)
-            script = repo.get_by_id(script_id)
-            return script.to_dict() if script else None
+    async def get_tag_facets(
+        self,
+        tags: Optional[List[str]] = None,
+        search: Optional[str] = None,
+        match: str = "all",
+    ) -> List[Dict]:
+        """Tags with script counts, among scripts matching the filters
+
+        Results are cached for TAG_CACHE_TTL seconds and dropped whenever a
+        script changes.
+        """
+        key = (tuple(sorted(tags or [])), search, match)
+        facets = self._tag_cache.get(key)
+        if facets is None:
+            async with self.db.async_session_scope() as session:
+                repo = AsyncScriptRepository(session)
+                counts = await repo.tag_counts(tags, search, match)
+            facets = [{"tag": tag, "count": count} for tag, count in counts]
+            self._tag_cache.set(key, facets)
+        return facets
+
+    async def get_script(self, script_id: str) -> Optional[Dict]:
+        """Get a script by ID, served from the cache when possible"""
+        script = self._script_cache.get(script_id)
+        if script is not None:
+            return dict(script)
 
-    def create_script(self, data: Dict[str, Any]) -> Dict:
+        generation = self._generation
+        async with self.db.async_session_scope() as session:
+            repo = AsyncScriptRepository(session)
+            script = await repo.get_by_id(script_id)
+            if not script:
+                return None
+            script = script.to_dict()
+
+        if generation == self._generation:
+            self._script_cache.set(script_id, script)
+        return dict(script)
+
+    async def create_script(self, data: Dict[str, Any]) -> Dict:
         """Create a new script"""
-        with self.db.session_scope() as session:
-            repo = ScriptRepository(session)
+        async with self.db.async_session_scope() as session:
+            repo = AsyncScriptRepository(session)
 
             # Check if name already exists
-            existing = repo.get_by_name(data.get("name"))
+            existing = await repo.get_by_name(data.get("name"))
             if existing:
                 raise ValueError(
                     f"Script with name '{data.get('name')}' already exists"
                 )
 
-            script = repo.create(data)
-            return script.to_dict()
+            script = await repo.create(data)
+            await AsyncStatsRepository(session).bump({"scripts": 1})
+            script = script.to_dict()
+
+        await self._changed(script["id"])
+        return script
 
-    def update_script(self, script_id: str, data: Dict[str, Any]) -> Optional[Dict]:
+    async def update_script(
+        self, script_id: str, data: Dict[str, Any]
+    ) -> Optional[Dict]:
         """Update an existing script"""
-        with self.db.session_scope() as session:
-            repo = ScriptRepository(session)
+        async with self.db.async_session_scope() as session:
+            repo = AsyncScriptRepository(session)
 
             # Check if name already exists (excluding current script)
             if "name" in data:
-                existing = repo.get_by_name(data["name"])
+                existing = await repo.get_by_name(data["name"])
                 if existing and existing.id != script_id:
                     raise ValueError(
                         f"Script with name '{data['name']}' already exists"
                     )
 
-            script = repo.update(script_id, data)
-            return script.to_dict() if script else None
+            script = await repo.update(script_id, data)
+            if not script:
+                return None
+            script = script.to_dict()
+
+        await self._changed(script_id)
+        return script
+
+    async def delete_script(self, script_id: str) -> bool:
+        """Delete a script"""
+        async with self.db.async_session_scope() as session:
+            repo = AsyncScriptRepository(session)
+            # Executions go with the script, so take them off the counters too
+            counts = await AsyncExecutionRepository(session).status_counts(script_id)
+            size, stored = await AsyncExecutionLogRepository(session).totals(script_id)
+            deleted = await repo.delete(script_id)
+            if deleted:
+                await AsyncStatsRepository(session).bump(
+                    {
+                        "scripts": -1,
+                        "executions": -counts.pop("total"),
+                        "log_bytes": -size,
+                        "log_stored_bytes": -stored,
+                        **{
+                            f"executions:{status}": -count
+                            for status, count in counts.items()
+                        },
+                    }
+                )
+
+        if deleted:
+            await self._changed(script_id)
+        return deleted
+
+
+class ExecutionScheduler:
+    """Runs executions with bounded concurrency, highest priority first
+
+    Executions beyond `max_concurrency` wait in a priority queue (FIFO
+    within a priority) and start as running ones finish. Executions
+    submitted with a `group` additionally run at most `group_limit` of that
+    group at a time.
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENT_EXECUTIONS):
+        self.max_concurrency = max(1, max_concurrency)
+        self.running = {}  # execution_id: asyncio.Task
+        self._queue = []  # heap of (-priority, order, execution_id)
+        # execution_id: (priority, queued_at, start, group, group_limit)
+        self._queued = {}
+        self._groups = collections.Counter()  # group: running executions
+        self._order = itertools.count()
+
+    def submit(
+        self,
+        execution_id: str,
+        start: Callable[[], Awaitable[None]],
+        priority: int = 0,
+        group: Optional[str] = None,
+        group_limit: int = 0,
+    ):
+        """Start an execution now, or queue it until a slot frees up"""
+        self._queued[execution_id] = (
+            priority,
+            time.monotonic(),
+            start,
+            group,
+            group_limit,
+        )
+        heapq.heappush(self._queue, (-priority, next(self._order), execution_id))
+        self._dispatch()
+
+    def cancel(self, execution_id: str) -> bool:
+        """Drop a queued execution; running ones are not affected"""
+        return self._queued.pop(execution_id, None) is not None
+
+    def position(self, execution_id: str) -> Optional[int]:
+        """1-based place of a queued execution in the queue"""
+        if execution_id not in self._queued:
+            return None
+        ordered = sorted(entry for entry in self._queue if entry[2] in self._queued)
+        return [entry[2] for entry in ordered].index(execution_id) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        ordered = sorted(entry for entry in self._queue if entry[2] in self._queued)
+        return {
+            "max_concurrency": self.max_concurrency,
+            "running": len(self.running),
+            "queued": len(self._queued),
+            "items": [
+                {
+                    "execution_id": execution_id,
+                    "priority": -priority,
+                    "waiting_ms": int((now - self._queued[execution_id][1]) * 1000),
+                }
+                for priority, _, execution_id in ordered
+            ],
+        }
+
+    def _dispatch(self):
+        held = []  # entries of groups at their limit, queued again below
+        while self._queue and len(self.running) < self.max_concurrency:
+            entry = heapq.heappop(self._queue)
+            execution_id = entry[2]
+            queued = self._queued.get(execution_id)
+            if queued is None:
+                continue  # cancelled while queued
+
+            _, _, start, group, group_limit = queued
+            if group and group_limit and self._groups[group] >= group_limit:
+                held.append(entry)
+                continue
+
+            del self._queued[execution_id]
+            if group:
+                self._groups[group] += 1
+            task = asyncio.create_task(start())
+            self.running[execution_id] = task
+            task.add_done_callback(
+                lambda _, execution_id=execution_id, group=group: self._finished(
+                    execution_id, group
+                )
+            )
+
+        for entry in held:
+            heapq.heappush(self._queue, entry)
+
+    def _finished(self, execution_id: str, group: Optional[str] = None):
+        self.running.pop(execution_id, None)
+        if group:
+            self._groups[group] -= 1
+            if self._groups[group] <= 0:
+                del self._groups[group]
+        self._dispatch()
+
+
+class LogCompactor:
+    """Background pass that compresses and ages out stored execution output
+
+    Each run compresses chunks stored raw, moves output still kept inline
+    on old executions into the log store, and applies the retention tiers.
+    Runs are serialized across workers by a registry lock.
+    """
+
+    LOCK = "log-compaction"
+
+    def __init__(self, db: Database, registry: ExecutionRegistry):
+        self.db = db
+        self.registry = registry
+        self._task = None
+
+    def start(self):
+        if LOG_COMPACT_INTERVAL > 0:
+            self._task = asyncio.create_task(self._run_periodically())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run_periodically(self):
+        while True:
+            await asyncio.sleep(LOG_COMPACT_INTERVAL)
+            if not await self.registry.try_lock(self.LOCK):
+                continue
+            try:
+                stats = await self.compact()
+                logger.info("Log compaction: %s", stats)
+            except Exception:
+                logger.exception("Log compaction failed")
+            finally:
+                await self.registry.unlock(self.LOCK)
+
+    async def compact(self) -> Dict[str, int]:
+        """Run every compaction step to completion"""
+        stats = {"compressed": 0, "migrated": 0, "trimmed": 0, "purged": 0}
+        now = datetime.utcnow()
+
+        while batch := await self._compress():
+            stats["compressed"] += batch
+        while batch := await self._migrate():
+            stats["migrated"] += batch
+        if LOG_RETENTION_DAYS:
+            before = now - timedelta(days=LOG_RETENTION_DAYS)
+            while batch := await self._purge(before):
+                stats["purged"] += batch
+        if LOG_RETENTION_FULL_DAYS:
+            before = now - timedelta(days=LOG_RETENTION_FULL_DAYS)
+            while batch := await self._trim(before):
+                stats["trimmed"] += batch
+        return stats
+
+    async def _compress(self) -> int:
+        """Compress a batch of chunks stored before compression was on"""
+        async with self.db.async_session_scope() as session:
+            chunks = await AsyncExecutionLogRepository(session).get_uncompressed(
+                LOG_COMPACT_BATCH
+            )
+            saved = 0
+            for chunk in chunks:
+                codec, stored = await asyncio.to_thread(compress, chunk.data)
+                saved += len(chunk.data) - len(stored)
+                chunk.codec, chunk.data = codec, stored
+            await AsyncStatsRepository(session).bump({"log_stored_bytes": -saved})
+            return len(chunks)
+
+    async def _migrate(self) -> int:
+        """Move a batch of inline `output` columns into the log store"""
+        async with self.db.async_session_scope() as session:
+            executions = await AsyncExecutionRepository(session).get_inline_output(
+                LOG_COMPACT_BATCH
+            )
+            rows = []
+            for execution in executions:
+                output = execution.output.encode()
+                for seq, offset in enumerate(range(0, len(output), LOG_CHUNK_BYTES)):
+                    data = output[offset : offset + LOG_CHUNK_BYTES]
+                    codec, stored = await asyncio.to_thread(compress, data)
+                    rows.append(
+                        {
+                            "execution_id": execution.id,
+                            "seq": seq,
+                            "stream": "stdout",
+                            "offset": offset,
+                            "stream_offset": offset,
+                            "size": len(data),
+                            "data": stored,
+                            "codec": codec,
+                            "ts": execution.completed_at or execution.started_at,
+                        }
+                    )
+                execution.output = ""
+
+            await AsyncExecutionLogRepository(session).append(rows)
+            await AsyncStatsRepository(session).bump(
+                {
+                    "log_bytes": sum(row["size"] for row in rows),
+                    "log_stored_bytes": sum(len(row["data"]) for row in rows),
+                }
+            )
+            return len(executions)
+
+    async def _trim(self, before: datetime) -> int:
+        """Keep only the head and tail of a batch of logs older than `before`"""
+        async with self.db.async_session_scope() as session:
+            log_repo = AsyncExecutionLogRepository(session)
+            executions = await AsyncExecutionRepository(session).get_for_retention(
+                before, ("full",), LOG_COMPACT_BATCH
+            )
+            size = stored = 0
+            for execution in executions:
+                end = (await log_repo.get_position(execution.id))["offset"]
+                if end > LOG_RETAIN_HEAD_BYTES + LOG_RETAIN_TAIL_BYTES:
+                    removed = await log_repo.delete_range(
+                        execution.id,
+                        LOG_RETAIN_HEAD_BYTES,
+                        end - LOG_RETAIN_TAIL_BYTES,
+                    )
+                    size += removed[0]
+                    stored += removed[1]
+                execution.log_retention = "trimmed"
+
+            await AsyncStatsRepository(session).bump(
+                {
+                    "log_bytes": -size,
+                    "log_stored_bytes": -stored,
+                    "log_bytes_removed": size,
+                }
+            )
+            return len(executions)
+
+    async def _purge(self, before: datetime) -> int:
+        """Drop the output of a batch of executions older than `before`"""
+        async with self.db.async_session_scope() as session:
+            log_repo = AsyncExecutionLogRepository(session)
+            executions = await AsyncExecutionRepository(session).get_for_retention(
+                before, ("full", "trimmed"), LOG_COMPACT_BATCH
+            )
+            size = stored = 0
+            for execution in executions:
+                removed = await log_repo.delete_range(execution.id)
+                size += removed[0]
+                stored += removed[1]
+                execution.output = execution.error = ""
+                execution.log_retention = "purged"
+
+            await AsyncStatsRepository(session).bump(
+                {
+                    "log_bytes": -size,
+                    "log_stored_bytes": -stored,
+                    "log_bytes_removed": size,
+                }
+            )
+            return len(executions)
+
+
+class ExecutionReaper:
+    """Background pass that settles executions whose worker is gone
+
+    A worker that crashes or restarts mid-run leaves its executions queued
+    or running forever. Each pass marks those of dead workers (see
+    ExecutionRegistry.alive) lost, killing what is left of their process
+    groups when they ran on this host since its last boot, and does the
+    same for their batches and pipeline runs. Passes run at startup and
+    then periodically, serialized across workers by a registry lock. A
+    worker briefly loses its lock while its lock connection reconnects, so
+    only rows found orphaned by two passes in a row are settled. A
+    standalone worker can't tell whether others are alive and never reaps.
+    """
+
+    LOCK = "execution-reaper"
+
+    def __init__(self, executions: "ExecutionService"):
+        self.executions = executions
+        self.db = executions.db
+        self.registry = executions.registry
+        self._task = None
+        self._suspects = set()  # ids found orphaned by the previous pass
+
+    def start(self):
+        if REAPER_INTERVAL > 0:
+            self._task = asyncio.create_task(self._run_periodically())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run_periodically(self):
+        while True:
+            await asyncio.sleep(REAPER_INTERVAL)
+            try:
+                stats = await self.reap()
+                if any(stats.values()):
+                    logger.info("Execution reaper: %s", stats)
+            except Exception:
+                logger.exception("Execution reaper failed")
+
+    async def reap(self) -> Dict[str, int]:
+        """Run one pass, unless another worker is running one"""
+        if not self.registry.enabled or not await self.registry.try_lock(self.LOCK):
+            return {}
+        try:
+            return await self._reap()
+        finally:
+            await self.registry.unlock(self.LOCK)
+
+    async def _reap(self) -> Dict[str, int]:
+        stats = {"lost": 0, "killed": 0, "batches": 0, "pipeline_runs": 0}
+        alive = {}
+        suspects = set()
+
+        async def orphaned(item) -> bool:
+            # Rows from before workers were recorded have no owner to wait on
+            if item.worker_id:
+                if item.worker_id not in alive:
+                    alive[item.worker_id] = await self.registry.alive(item.worker_id)
+                if alive[item.worker_id]:
+                    return False
+            suspects.add(item.id)
+            return item.id in self._suspects
+
+        async with self.db.async_session_scope() as session:
+            executions = await AsyncExecutionRepository(session).get_unfinished()
+            batches = await AsyncBatchRepository(session).get_running()
+            runs = await AsyncPipelineRunRepository(session).get_running()
+
+        for execution in executions:
+            if not await orphaned(execution):
+                continue
+            if (
+                execution.pid
+                and execution.pid_started is not None
+                and execution.host == HOSTNAME
+                and execution.boot_id == BOOT_ID
+            ):
+                stats["killed"] += await asyncio.to_thread(
+                    kill_leftovers, execution.pid, execution.pid_started
+                )
+            if await self.executions.mark_lost(
+                execution.id, "The worker running this execution stopped"
+            ):
+                stats["lost"] += 1
+
+        for key, repository, items in (
+            ("batches", AsyncBatchRepository, batches),
+            ("pipeline_runs", AsyncPipelineRunRepository, runs),
+        ):
+            for item in items:
+                if not await orphaned(item):
+                    continue
+                async with self.db.async_session_scope() as session:
+                    await repository(session).update(
+                        item.id, {"status": "lost", "completed_at": datetime.utcnow()}
+                    )
+                if key == "pipeline_runs":
+                    await asyncio.to_thread(
+                        shutil.rmtree,
+                        os.path.join(PIPELINE_ARTIFACT_DIR, item.id),
+                        True,
+                    )
+                stats[key] += 1
+
+        self._suspects = suspects
+        stats["temp_files"] = await asyncio.to_thread(self._remove_temp_files)
+        return stats
+
+    @staticmethod
+    def _remove_temp_files() -> int:
+        """Remove script files runs used to write to the temp dir, which a
+        crash left behind"""
+        before = time.time() - REAPER_TEMP_FILE_AGE
+        removed = 0
+        for path in glob.glob(os.path.join(tempfile.gettempdir(), "script_*.sh")):
+            try:
+                if os.path.getmtime(path) < before:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+
+class ExecutionService:
+    """Service layer for Execution operations"""
+
+    def __init__(self, scripts: Optional[ScriptService] = None):
+        self.db = Database()
+        self.scripts = scripts or ScriptService()
+        # script_id (execution_id for shared runs): (process, execution_id)
+        self.active_executions = {}
+        self.broadcasters = {}  # execution_id: ExecutionBroadcaster
+        self.batch_broadcasters = {}  # batch_id: ExecutionBroadcaster
+        self.scheduler = ExecutionScheduler()
+        self.registry = ExecutionRegistry()
+        self.registry.on("cancel", self._on_cancel)
+        self.registry.on("cancel-batch", self._on_cancel_batch)
+        self.compactor = LogCompactor(self.db, self.registry)
+        self.reaper = ExecutionReaper(self)
+        self.pool = ShellPool(EXECUTION_POOL_SIZE)
+        self._cancelled = set()  # execution_ids cancelled while running
+        self._cancelled_batches = set()
+        self._batch_tasks = set()
+        self._kill_tasks = set()
+        self._start_lock = asyncio.Lock()
+
+    async def start(self):
+        """Join the cross-worker execution registry"""
+        await self.seed_stats()
+        await self.registry.start()
+        # Find what a previous run of this worker left behind; the next pass
+        # settles it
+        try:
+            stats = await self.reaper.reap()
+            logger.info("Execution reaper: %s", stats)
+        except Exception:
+            logger.exception("Execution reaper failed")
+        self.reaper.start()
+        self.compactor.start()
+        self.pool.start()
+
+    async def seed_stats(self):
+        """Build the stats counters and hourly rollup if they don't exist yet
+
+        Runs once per database; after that they are maintained on every
+        write. Truncate `stats_counters` to force a rebuild.
+        """
+        async with self.db.async_session_scope() as session:
+            stats = AsyncStatsRepository(session)
+            counters = await stats.get_counters()
+
+            if "executions" not in counters:
+                counts = await AsyncExecutionRepository(session).status_counts()
+                scripts = await AsyncScriptRepository(session).count()
+                seeded = await stats.initialize(
+                    {
+                        "scripts": scripts,
+                        "executions": counts.pop("total"),
+                        **{
+                            f"executions:{status}": count
+                            for status, count in counts.items()
+                        },
+                    }
+                )
+                # Another worker may have won the race
+                if seeded:
+                    await stats.rebuild_hourly()
+
+            if "log_bytes" not in counters:
+                size, stored = await AsyncExecutionLogRepository(session).totals()
+                await stats.initialize(
+                    {
+                        "log_bytes": size,
+                        "log_stored_bytes": stored,
+                        "log_bytes_removed": 0,
+                    }
+                )
+
+    async def stop(self):
+        await self.pool.stop()
+        await self.compactor.stop()
+        await self.reaper.stop()
+        await self.registry.stop()
+
+    async def get_executions_page(
+        self,
+        script_id: Optional[str] = None,
+        statuses: Optional[List[str]] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        cursor: Optional[str] = None,
+        limit: int = EXECUTION_PAGE_SIZE,
+        fields: Optional[List[str]] = None,
+    ) -> Dict:
+        """Get one page of execution history, the number of executions
+        matching the filters and the cursor of the next page
+
+        Only `fields` are loaded and returned; by default everything but
+        `output` and `error`. Raises ValueError for unknown fields or
+        statuses, or a bad cursor.
+        """
+        fields = list(fields or EXECUTION_LIST_FIELDS)
+        unknown = set(fields) - set(Execution.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        unknown = set(statuses or []) - set(Execution.STATUSES)
+        if unknown:
+            raise ValueError(f"Unknown statuses: {', '.join(sorted(unknown))}")
+
+        # Timestamps are stored as naive UTC
+        since, until = (
+            (
+                value.astimezone(timezone.utc).replace(tzinfo=None)
+                if value and value.tzinfo
+                else value
+            )
+            for value in (since, until)
+        )
+
+        after = None
+        if cursor:
+            created_at, execution_id = decode_cursor(cursor)
+            after = (datetime.fromisoformat(created_at), execution_id)
+
+        # The keyset columns are always needed to build the next cursor
+        load = list(dict.fromkeys(fields + ["id", "created_at"]))
+        async with self.db.async_session_scope() as session:
+            repo = AsyncExecutionRepository(session)
+            executions = await repo.get_page(
+                script_id, statuses, since, until, after, limit + 1, load
+            )
+
+            next_cursor = None
+            if len(executions) > limit:
+                executions = executions[:limit]
+                last = executions[-1]
+                next_cursor = encode_cursor(last.created_at.isoformat(), last.id)
+
+            # History is large; without script or time filters the total
+            # comes from the maintained counters instead of a count
+            total = None
+            if not (script_id or since or until):
+                counters = await AsyncStatsRepository(session).get_counters()
+                names = [f"executions:{status}" for status in statuses or []]
+                if all(name in counters for name in names or ["executions"]):
+                    total = sum(counters[name] for name in names or ["executions"])
+            if total is None:
+                total = await repo.count_filtered(script_id, statuses, since, until)
+
+            return {
+                "items": [execution.to_dict(fields) for execution in executions],
+                "total": total,
+                "next_cursor": next_cursor,
+            }
+
+    async def get_script(self, script_id: str) -> Optional[Dict]:
+        """Get a script by ID"""
+        return await self.scripts.get_script(script_id)
+
+    async def get_execution(self, execution_id: str) -> Optional[Dict]:
+        """Get an execution by ID, with its output read back from the log store"""
+        async with self.db.async_session_scope() as session:
+            repo = AsyncExecutionRepository(session)
+            execution = await repo.get_by_id(execution_id)
+            if not execution:
+                return None
+
+            log_repo = AsyncExecutionLogRepository(session)
+            streams = {"stdout": [], "stderr": []}
+            ends = {"stdout": 0, "stderr": 0}
+            for chunk in await log_repo.get_chunks(execution_id):
+                # Mark where retention dropped the middle of the output
+                if chunk.stream_offset > ends[chunk.stream]:
+                    removed = chunk.stream_offset - ends[chunk.stream]
+                    streams[chunk.stream].append(
+                        f"\n[... {removed} bytes removed ...]\n".encode()
+                    )
+                streams[chunk.stream].append(chunk.payload)
+                ends[chunk.stream] = chunk.stream_offset + chunk.size
+
+            # Rows written before the log store keep their output inline, and
+            # the error column still carries internal failure messages
+            data = execution.to_dict()
+            data["output"] += b"".join(streams["stdout"]).decode(
+                "utf-8", errors="replace"
+            )
+            data["error"] = (
+                b"".join(streams["stderr"]).decode("utf-8", errors="replace")
+                + data["error"]
+            )
+            if execution.log_retention == "purged":
+                data["output"] = "[output removed by retention]"
+            return data
+
+    async def read_log(
+        self,
+        execution_id: str,
+        offset: int = 0,
+        limit: int = LOG_CHUNK_BYTES,
+        stream: Optional[str] = None,
+    ) -> Optional[Dict]:
+        """Read a window of an execution's log and where to resume from
+
+        A negative `offset` counts back from the end of the log.
+        """
+        async with self.db.async_session_scope() as session:
+            execution = await AsyncExecutionRepository(session).get_by_id(execution_id)
+            if not execution:
+                return None
+
+            log_repo = AsyncExecutionLogRepository(session)
+            position = await log_repo.get_position(execution_id)
+            size = (
+                position["stream_offsets"].get(stream, 0)
+                if stream
+                else position["offset"]
+            )
+            if offset < 0:
+                offset = max(0, size + offset)
+            offset, data = await log_repo.read(execution_id, offset, limit, stream)
+
+        next_offset = offset + len(data)
+        return {
+            "execution_id": execution_id,
+            "stream": stream,
+            "status": execution.status,
+            "data": data,
+            "offset": offset,
+            "next_offset": next_offset,
+            "size": size,
+            "complete": execution.status not in ("queued", "running")
+            and next_offset >= size,
+        }
+
+    async def follow_log(
+        self,
+        execution_id: str,
+        offset: int = 0,
+        limit: int = LOG_CHUNK_BYTES,
+        stream: Optional[str] = None,
+    ):
+        """Yield log windows from `offset` until the execution has finished"""
+        while True:
+            window = await self.read_log(execution_id, offset, limit, stream)
+            if window is None:
+                return
+
+            # Hold back a UTF-8 sequence split across windows
+            if not window["complete"]:
+                cut = _utf8_boundary(window["data"])
+                window["data"] = window["data"][:cut]
+                window["next_offset"] = window["offset"] + cut
+
+            if window["data"] or window["complete"]:
+                yield window
+            if window["complete"]:
+                return
+
+            offset = window["next_offset"]
+            if not window["data"]:
+                await asyncio.sleep(LOG_FLUSH_INTERVAL)
+
+    async def create_execution(
+        self, script_id: str, script_name: str, priority: int = 0, **fields: Any
+    ) -> Dict:
+        """Create a new execution record, queued until the scheduler starts it"""
+        async with self.db.async_session_scope() as session:
+            repo = AsyncExecutionRepository(session)
+            execution = await repo.create(
+                {
+                    "script_id": script_id,
+                    "script_name": script_name,
+                    "status": "queued",
+                    "priority": priority,
+                    "queued_at": datetime.utcnow(),
+                    "output": "",
+                    "error": "",
+                    "worker_id": self.registry.worker_id,
+                    **fields,
+                }
+            )
+            await AsyncStatsRepository(session).bump(
+                {"executions": 1, "executions:queued": 1}
+            )
+            return execution.to_dict()
+
+    async def update_execution(
+        self, execution_id: str, data: Dict[str, Any]
+    ) -> Optional[Dict]:
+        """Update an execution, keeping the stats in step with its status"""
+        async with self.db.async_session_scope() as session:
+            repo = AsyncExecutionRepository(session)
+            execution = await repo.get_for_update(execution_id)
+            if not execution:
+                return None
+
+            previous = execution.status
+            execution = await repo.update(execution_id, data)
+            if execution.status != previous:
+                await self._record_transition(session, execution, previous)
+            return execution.to_dict()
+
+    async def _record_transition(self, session, execution: Execution, previous: str):
+        """Move an execution between status counters, rolling it up once finished"""
+        stats = AsyncStatsRepository(session)
+        await stats.bump(
+            {f"executions:{previous}": -1, f"executions:{execution.status}": 1}
+        )
+
+        if (
+            execution.status in Execution.FINISHED
+            and previous not in Execution.FINISHED
+        ):
+            started_at = execution.started_at or execution.created_at
+            completed_at = execution.completed_at or datetime.utcnow()
+            cpu_ms = (execution.cpu_user_ms or 0) + (execution.cpu_system_ms or 0)
+            await stats.record(
+                execution.script_id,
+                started_at.replace(minute=0, second=0, microsecond=0),
+                execution.status in Execution.FAILED,
+                int((completed_at - started_at).total_seconds() * 1000),
+                cpu_ms,
+                execution.max_rss_kb or 0,
+            )
+            await stats.bump({"cpu_ms": cpu_ms})
+
+    async def get_running_execution(self, script_id):
+        async with self.db.async_session_scope() as session:
+            repo = AsyncExecutionRepository(session)
+            execution = await repo.get_running(script_id)
+            return execution.to_dict() if execution else None
+
+    async def first_or_create(
+        self, script_id: str, script_name: str, priority: int = 0
+    ):
+        """Create the script's execution once its lock is held
+
+        A running row left behind by then belongs to a worker that died
+        with it, so it is marked lost rather than reused. Standalone the
+        lock proves nothing, and such a row is only left alone.
+        """
+        execution = await self.get_running_execution(script_id)
+        if (
+            execution
+            and self.registry.enabled
+            and execution["id"] not in self.broadcasters
+        ):
+            await self.mark_lost(execution["id"], "Superseded by a new execution")
+
+        execution_id = (await self.create_execution(script_id, script_name, priority))[
+            "id"
+        ]
+
+        return execution_id
+
+    async def mark_lost(self, execution_id: str, reason: str) -> bool:
+        """Finish an execution whose worker is gone, unless it finished already"""
+        async with self.db.async_session_scope() as session:
+            repo = AsyncExecutionRepository(session)
+            execution = await repo.get_for_update(execution_id)
+            if not execution or execution.status not in ("queued", "running"):
+                return False
+
+            previous = execution.status
+            execution = await repo.update(
+                execution_id,
+                {
+                    "status": "lost",
+                    "error": (execution.error or "") + reason,
+                    "completed_at": datetime.utcnow(),
+                },
+            )
+            await self._record_transition(session, execution, previous)
+            return True
+
+    def get_queue(self) -> Dict[str, Any]:
+        """Get the scheduler's concurrency and queue depth"""
+        return self.scheduler.stats()
+
+    async def get_stats(self) -> Dict[str, int]:
+        """Get dashboard statistics from the maintained counters"""
+        async with self.db.async_session_scope() as session:
+            counters = await AsyncStatsRepository(session).get_counters()
+        return {
+            "total_scripts": counters.get("scripts", 0),
+            "total_executions": counters.get("executions", 0),
+            "failed_executions": counters.get("executions:failed", 0),
+            "running_executions": counters.get("executions:running", 0),
+            "queued_executions": counters.get("executions:queued", 0),
+            "successful_executions": counters.get("executions:completed", 0),
+            "cancelled_executions": counters.get("executions:cancelled", 0),
+            "timed_out_executions": counters.get("executions:timed_out", 0),
+            "lost_executions": counters.get("executions:lost", 0),
+            "total_cpu_ms": counters.get("cpu_ms", 0),
+            "log_bytes": counters.get("log_bytes", 0),
+            "log_stored_bytes": counters.get("log_stored_bytes", 0),
+            "log_bytes_saved": counters.get("log_bytes", 0)
+            - counters.get("log_stored_bytes", 0),
+            "log_bytes_removed": counters.get("log_bytes_removed", 0),
+        }
+
+    async def get_hourly_stats(
+        self, script_id: Optional[str] = None, hours: int = 24
+    ) -> List[Dict]:
+        """Get finished executions, failures, mean duration and CPU time, and
+        peak memory per hour"""
+        since = datetime.utcnow().replace(
+            minute=0, second=0, microsecond=0
+        ) - timedelta(hours=hours - 1)
+        async with self.db.async_session_scope() as session:
+            rows = await AsyncStatsRepository(session).get_hourly(since, script_id)
+        return [
+            {
+                "bucket": bucket.isoformat(),
+                "executions": executions,
+                "failures": failures,
+                "avg_duration_ms": duration_ms / executions if executions else None,
+                "avg_cpu_ms": cpu_ms / executions if executions else None,
+                "max_rss_kb": max_rss_kb,
+            }
+            for bucket, executions, failures, duration_ms, cpu_ms, max_rss_kb in rows
+        ]
+
+    async def _stream_output(
+        self,
+        stream,
+        broadcaster: ExecutionBroadcaster,
+        log: ExecutionLogWriter,
+        execution_id: str,
+        stream_type: str,
+    ):
+        """Pump a pipe in fixed-size reads into the log store and viewers
+
+        Reads are not line based, so arbitrarily long lines and binary
+        output are fine. The raw bytes go to the log store; viewers get
+        incrementally decoded UTF-8 with progress redraws collapsed. Past
+        the log's head cap viewers get a marker instead, and the kept tail
+        once the execution ends.
+        """
+        decoder = OutputDecoder()
+
+        while True:
+            chunk = await stream.read(STREAM_READ_BYTES)
+            final = not chunk
+
+            offset = await log.write(stream_type, chunk)
+            head = log.in_head(offset, len(chunk))
+            if head < len(chunk) and not log.truncation_announced:
+                log.truncation_announced = True
+                broadcaster.publish(
+                    {
+                        "type": stream_type,
+                        "data": f"\n[... output over {log.head_bytes} bytes truncated,"
+                        f" the last {log.tail_bytes} bytes follow at the end ...]\n",
+                        "execution_id": execution_id,
+                        "offset": offset + head,
+                    }
+                )
+
+            text = decoder.decode(chunk[:head], final)
+            if text:
+                broadcaster.publish(
+                    {
+                        "type": stream_type,
+                        "data": text,
+                        "execution_id": execution_id,
+                        "offset": offset,
+                    }
+                )
+
+            if final:
+                break
+
+    def _publish_tail(
+        self, broadcaster: ExecutionBroadcaster, log: ExecutionLogWriter, execution_id
+    ):
+        """Send viewers the output kept from the end of a truncated log"""
+        decoders = {}
+        for stream, offset, data in log.tail:
+            decoder = decoders.setdefault(stream, OutputDecoder())
+            text = decoder.decode(data)
+            if text:
+                broadcaster.publish(
+                    {
+                        "type": stream,
+                        "data": text,
+                        "execution_id": execution_id,
+                        "offset": offset,
+                    }
+                )
+        for stream, decoder in decoders.items():
+            text = decoder.decode(b"", True)
+            if text:
+                broadcaster.publish(
+                    {
+                        "type": stream,
+                        "data": text,
+                        "execution_id": execution_id,
+                        "offset": log.end,
+                    }
+                )
+
+    def resolve_priority(
+        self, tags: Optional[List[str]] = None, priority: Optional[int] = None
+    ) -> int:
+        """Explicit priority, else the highest configured for the script's tags"""
+        if priority is not None:
+            return priority
+        return max(
+            (EXECUTION_TAG_PRIORITIES.get(tag, 0) for tag in tags or []), default=0
+        )
+
+    async def start_execution(
+        self,
+        script_id: str,
+        script_name: str,
+        script_content: str,
+        priority: int = 0,
+    ) -> str:
+        """Queue a script to run in the background, or join its execution"""
+        async with self._start_lock:
+            if script_id in self.active_executions:
+                return self.active_executions[script_id][1]
+
+            # Only the worker holding the script's lock may run it; any other
+            # worker joins that execution instead
+            lock_key = f"script:{script_id}"
+            for _ in range(REGISTRY_CLAIM_ATTEMPTS):
+                if await self.registry.try_lock(lock_key):
+                    break
+                execution = await self.get_running_execution(script_id)
+                if execution:
+                    return execution["id"]
+                await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("Execution already in progress on another worker")
+
+            try:
+                execution_id = await self.first_or_create(
+                    script_id, script_name, priority
+                )
+            except Exception:
+                await self.registry.unlock(lock_key)
+                raise
+
+            logger.debug("Execution %s of script %s", execution_id, script_id)
+
+            broadcaster = ExecutionBroadcaster(execution_id)
+            self.broadcasters[execution_id] = broadcaster
+            self.active_executions[script_id] = (None, execution_id)
+
+            queued_at = datetime.utcnow()
+            self.scheduler.submit(
+                execution_id,
+                lambda: self._run_execution(
+                    script_id, execution_id, script_content, queued_at
+                ),
+                priority,
+            )
+
+            position = self.scheduler.position(execution_id)
+            if position:
+                broadcaster.publish(
+                    {
+                        "type": "queued",
+                        "position": position,
+                        "execution_id": execution_id,
+                        "offset": 0,
+                    }
+                )
+            return execution_id
+
+    async def attach(
+        self,
+        websocket: WebSocket,
+        execution_id: str,
+        batch_ms: int = 0,
+        batch_bytes: int = WS_BATCH_BYTES,
+    ) -> bool:
+        """Replay and follow an execution's output over a WebSocket
+
+        With `batch_ms` set, messages are coalesced into one "batch" frame
+        per `batch_ms` milliseconds or `batch_bytes` of output. Every frame
+        carries a per-connection `seq`. Returns False when the execution
+        does not exist. Disconnecting only detaches this viewer; the
+        execution keeps running.
+        """
+        broadcaster = self.broadcasters.get(execution_id)
+        if not broadcaster:
+            execution = await self.get_execution_status(execution_id)
+            if not execution:
+                return False
+
+            if execution["status"] in ("queued", "running"):
+                await self._attach_remote(websocket, execution_id)
+                return True
+
+            await websocket.send_json(
+                {
+                    "type": "status",
+                    "data": execution["status"],
+                    "execution_id": execution_id,
+                    "seq": 0,
+                }
+            )
+            return True
+
+        await websocket.send_json(
+            {
+                "type": "stdout",
+                "execution_id": execution_id,
+                "seq": 0,
+            }
+        )
+        await self.relay(
+            websocket, broadcaster, batch_ms, batch_bytes, execution_id=execution_id
+        )
+        return True
+
+    async def relay(
+        self,
+        websocket: WebSocket,
+        broadcaster: ExecutionBroadcaster,
+        batch_ms: int,
+        batch_bytes: int,
+        **ids: str,
+    ):
+        """Send a broadcaster's messages, tagged with `ids` when batched,
+        until it closes or the viewer disconnects"""
+        seq = 0
+        try:
+            if batch_ms > 0:
+                async for batch in broadcaster.stream_batches(
+                    batch_ms / 1000, batch_bytes
+                ):
+                    seq += 1
+                    await websocket.send_json(
+                        {"type": "batch", "seq": seq, **ids, "messages": batch}
+                    )
+            else:
+                async for message in broadcaster.stream():
+                    seq += 1
+                    await websocket.send_json({**message, "seq": seq})
+        except WebSocketDisconnect:
+            pass
+
+    async def execute_script_ws(
+        self,
+        websocket: WebSocket,
+        script_id: str,
+        script_name: str,
+        script_content: str,
+        batch_ms: int = 0,
+        batch_bytes: int = WS_BATCH_BYTES,
+        priority: int = 0,
+    ):
+        """Execute a script, or join its running execution, over a WebSocket"""
+        execution_id = await self.start_execution(
+            script_id, script_name, script_content, priority
+        )
+        await self.attach(websocket, execution_id, batch_ms, batch_bytes)
+
+    async def _attach_remote(self, websocket: WebSocket, execution_id: str):
+        """Follow an execution owned by another worker through the log store"""
+        await websocket.send_json(
+            {"type": "stdout", "execution_id": execution_id, "seq": 0}
+        )
+
+        decoders = {"stdout": OutputDecoder(), "stderr": OutputDecoder()}
+        after_seq = -1
+        seq = 0
+        try:
+            while True:
+                # Status first: once it is final, every chunk is already stored
+                execution = await self.get_execution_status(execution_id)
+                async with self.db.async_session_scope() as session:
+                    chunks = await AsyncExecutionLogRepository(session).get_chunks(
+                        execution_id, after_seq=after_seq, limit=100
+                    )
+
+                for chunk in chunks:
+                    after_seq = chunk.seq
+                    text = decoders[chunk.stream].decode(chunk.payload)
+                    if text:
+                        seq += 1
+                        await websocket.send_json(
+                            {
+                                "type": chunk.stream,
+                                "data": text,
+                                "execution_id": execution_id,
+                                "offset": chunk.offset,
+                                "seq": seq,
+                            }
+                        )
+
+                if chunks:
+                    continue
+                if execution["status"] not in ("queued", "running"):
+                    break
+                await asyncio.sleep(LOG_FLUSH_INTERVAL)
+
+            seq += 1
+            await websocket.send_json(
+                {
+                    "type": "status",
+                    "data": execution["status"],
+                    "execution_id": execution_id,
+                    "seq": seq,
+                }
+            )
+        except WebSocketDisconnect:
+            pass
+
+    async def cancel_execution(self, execution_id: str) -> bool:
+        """Cancel a queued or running execution on whichever worker owns it"""
+        if execution_id in self.broadcasters:
+            await self._cancel_local(execution_id)
+            return True
+
+        execution = await self.get_execution_status(execution_id)
+        if not execution or execution["status"] not in ("queued", "running"):
+            return False
+
+        await self.registry.notify("cancel", execution_id=execution_id)
+        return True
+
+    async def _on_cancel(self, message: Dict):
+        if message.get("execution_id") in self.broadcasters:
+            await self._cancel_local(message["execution_id"])
+
+    async def _cancel_local(self, execution_id: str):
+        key, process = next(
+            (
+                (key, process)
+                for key, (process, active_id) in self.active_executions.items()
+                if active_id == execution_id
+            ),
+            (None, None),
+        )
+
+        if self.scheduler.cancel(execution_id):
+            # Never started: settle it here, as _run_execution will not run
+            await self.update_execution(
+                execution_id,
+                {"status": "cancelled", "completed_at": datetime.utcnow()},
+            )
+            broadcaster = self.broadcasters.pop(execution_id, None)
+            if broadcaster:
+                broadcaster.publish(
+                    {
+                        "type": "status",
+                        "data": "cancelled",
+                        "execution_id": execution_id,
+                        "offset": 0,
+                    }
+                )
+                broadcaster.close()
+            if key:
+                del self.active_executions[key]
+                # Shared runs are keyed by their own id and hold no script lock
+                if key != execution_id:
+                    await self.registry.unlock(f"script:{key}")
+            return
+
+        self._cancelled.add(execution_id)
+        if process:
+            self._stop_process(execution_id, process)
+
+    def _stop_process(self, execution_id: str, process):
+        """SIGTERM the script's process group, then SIGKILL whatever of it is
+        still holding the execution open after CANCEL_GRACE_SECONDS"""
+        try:
+            process.terminate()
+        except ProcessLookupError:
+            return
 
-    def delete_script(self, script_id: str) -> bool:
-        """Delete a script"""
-        with self.db.session_scope() as session:
-            repo = ScriptRepository(session)
-            return repo.delete(script_id)
+        async def kill_after_grace():
+            await asyncio.sleep(CANCEL_GRACE_SECONDS)
+            if execution_id in self.broadcasters:
+                try:
+                    process.kill()
+                except ProcessLookupError:
+                    pass
 
-    def get_script_count(self) -> int:
-        """Get total script count"""
-        with self.db.session_scope() as session:
-            repo = ScriptRepository(session)
-            return repo.count()
+        task = asyncio.create_task(kill_after_grace())
+        self._kill_tasks.add(task)
+        task.add_done_callback(self._kill_tasks.discard)
 
+    async def start_detached(
+        self,
+        script: Dict[str, Any],
+        priority: int = 0,
+        concurrent: bool = False,
+        parameters: Optional[Dict[str, Any]] = None,
+    ) -> Dict:
+        """Start a script in the background for a client that may never attach
 
-class ExecutionService:
-    """Service layer for Execution operations"""
+        By default this behaves like the WebSocket trigger: a script runs
+        once at a time, and triggering it while it runs joins that
+        execution. `concurrent` runs, and any with `parameters`, always get
+        an execution of their own. Returns the execution's id and status.
+        """
+        if not (concurrent or parameters):
+            execution_id = await self.start_execution(
+                script["id"], script["name"], script["content"], priority
+            )
+        else:
+            execution = await self.create_execution(
+                script["id"], script["name"], priority, parameters=parameters
+            )
+            execution_id = execution["id"]
+            self.submit_shared(
+                script, execution, datetime.fromisoformat(execution["queued_at"])
+            )
 
-    def __init__(self):
-        self.db = Database()
-        self.active_executions = {}  # script_id: (process, execution_id)
+        execution = await self.get_execution_status(execution_id)
+        return {
+            "execution_id": execution_id,
+            "status": execution["status"],
+            "queue_position": self.scheduler.position(execution_id),
+        }
 
-    def get_all_executions(self, script_id: Optional[str] = None) -> List[Dict]:
-        """Get all executions"""
-        with self.db.session_scope() as session:
-            repo = ExecutionRepository(session)
-            executions = repo.get_all(script_id=script_id)
-            return [execution.to_dict() for execution in executions]
+    async def start_batch(
+        self,
+        script: Dict[str, Any],
+        parameter_sets: List[Dict[str, Any]],
+        parallelism: int = BATCH_PARALLELISM,
+        priority: int = 0,
+    ) -> Dict:
+        """Run a script once per parameter set in the background
 
-    def get_script(self, script_id: str) -> Optional[Dict]:
-        """Get a script by ID"""
-        with self.db.session_scope() as session:
-            repo = ScriptRepository(session)
-            script = repo.get_by_id(script_id)
-            return script.to_dict() if script else None
-
-    def get_execution(self, execution_id: str) -> Optional[Dict]:
-        """Get an execution by ID"""
-        with self.db.session_scope() as session:
-            repo = ExecutionRepository(session)
-            execution = repo.get_by_id(execution_id)
-            return execution.to_dict() if execution else None
+        Each set ({"env": {...}, "args": [...]}) gets an execution of its
+        own. At most `parallelism` of them run at once, within the
+        scheduler's global limit, and unlike single runs they may overlap
+        other executions of the script. Their output is multiplexed onto
+        the batch's broadcaster, tagged with each run's `batch_index`.
+        """
+        if not parameter_sets:
+            raise ValueError("A batch needs at least one parameter set")
+        if len(parameter_sets) > BATCH_MAX_SIZE:
+            raise ValueError(f"A batch takes at most {BATCH_MAX_SIZE} parameter sets")
+        parallelism = max(1, min(parallelism, len(parameter_sets)))
 
-    def create_execution(self, script_id: str, script_name: str) -> str:
-        """Create a new execution record"""
-        with self.db.session_scope() as session:
-            repo = ExecutionRepository(session)
-            execution = repo.create(
+        queued_at = datetime.utcnow()
+        async with self.db.async_session_scope() as session:
+            batch = await AsyncBatchRepository(session).create(
                 {
-                    "script_id": script_id,
-                    "script_name": script_name,
+                    "script_id": script["id"],
+                    "script_name": script["name"],
                     "status": "running",
-                    "output": "",
-                    "error": "",
+                    "total": len(parameter_sets),
+                    "parallelism": parallelism,
+                    "worker_id": self.registry.worker_id,
+                }
+            )
+            executions = await AsyncExecutionRepository(session).create_many(
+                [
+                    {
+                        "script_id": script["id"],
+                        "script_name": script["name"],
+                        "status": "queued",
+                        "batch_id": batch.id,
+                        "batch_index": index,
+                        "parameters": parameters,
+                        "priority": priority,
+                        "queued_at": queued_at,
+                        "output": "",
+                        "error": "",
+                        "worker_id": self.registry.worker_id,
+                    }
+                    for index, parameters in enumerate(parameter_sets)
+                ]
+            )
+            await AsyncStatsRepository(session).bump(
+                {
+                    "executions": len(executions),
+                    "executions:queued": len(executions),
                 }
             )
-            return execution
+            batch = batch.to_dict()
+            executions = [
+                execution.to_dict(BATCH_EXECUTION_FIELDS) for execution in executions
+            ]
 
-    def update_execution(
-        self, execution_id: str, data: Dict[str, Any]
-    ) -> Optional[Dict]:
-        """Update an execution"""
-        with self.db.session_scope() as session:
-            repo = ExecutionRepository(session)
-            execution = repo.update(execution_id, data)
-            return execution.to_dict() if execution else None
+        batch_id = batch["id"]
+        broadcaster = ExecutionBroadcaster(batch_id)
+        self.batch_broadcasters[batch_id] = broadcaster
+
+        forwarders = [
+            self.submit_shared(
+                script,
+                execution,
+                queued_at,
+                broadcaster,
+                {"batch_id": batch_id, "batch_index": execution["batch_index"]},
+                priority,
+                group=batch_id,
+                group_limit=parallelism,
+            )
+            for execution in executions
+        ]
+
+        task = asyncio.create_task(self._finish_batch(batch_id, forwarders))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+        return {**batch, "executions": executions}
+
+    def submit_shared(
+        self,
+        script: Dict[str, Any],
+        execution: Dict[str, Any],
+        queued_at: datetime,
+        target: Optional[ExecutionBroadcaster] = None,
+        tags: Optional[Dict[str, Any]] = None,
+        priority: Optional[int] = None,
+        group: Optional[str] = None,
+        group_limit: int = 0,
+    ) -> Optional[asyncio.Task]:
+        """Queue a created execution that may overlap others of its script
+
+        Used for concurrent runs and the runs of batches and pipelines. The
+        execution runs with its `parameters`. With a `target`, its messages
+        are republished there with `tags`, and the returned task forwards
+        them and ends with the execution.
+        """
+        execution_id = execution["id"]
+        self.broadcasters[execution_id] = ExecutionBroadcaster(execution_id)
+        self.active_executions[execution_id] = (None, execution_id)
+        forwarder = None
+        if target:
+            forwarder = asyncio.create_task(
+                self._forward(self.broadcasters[execution_id], target, **(tags or {}))
+            )
+        self.scheduler.submit(
+            execution_id,
+            lambda: self._run_execution(
+                script["id"],
+                execution_id,
+                script["content"],
+                queued_at,
+                exclusive=False,
+                parameters=execution["parameters"],
+            ),
+            execution["priority"] if priority is None else priority,
+            group=group,
+            group_limit=group_limit,
+        )
+        return forwarder
+
+    @staticmethod
+    async def _forward(
+        source: ExecutionBroadcaster, target: ExecutionBroadcaster, **tags: Any
+    ):
+        """Republish one execution's messages on another broadcaster"""
+        async for message in source.stream():
+            target.publish({**message, **tags})
+
+    async def _finish_batch(self, batch_id: str, forwarders: List[asyncio.Task]):
+        """Settle a batch once all its executions have finished"""
+        broadcaster = self.batch_broadcasters[batch_id]
+        try:
+            await asyncio.gather(*forwarders)
 
-    def get_running_execution(self, script_id):
-        with self.db.session_scope() as session:
-            execution = (
-                session.query(Execution)
-                .filter(
-                    Execution.script_id == script_id,
-                    Execution.status == "running",
+            batch = await self.get_batch(batch_id)
+            if batch["summary"]["completed"] == batch["total"]:
+                status = "completed"
+            elif batch_id in self._cancelled_batches:
+                status = "cancelled"
+            else:
+                status = "failed"
+            async with self.db.async_session_scope() as session:
+                await AsyncBatchRepository(session).update(
+                    batch_id, {"status": status, "completed_at": datetime.utcnow()}
                 )
-                .order_by(Execution.started_at.desc())
-                .first()
+
+            batch = await self.get_batch(batch_id)
+            broadcaster.publish(
+                {
+                    "type": "summary",
+                    "data": status,
+                    "batch_id": batch_id,
+                    "summary": batch["summary"],
+                }
             )
+        except Exception:
+            logger.exception("Could not settle batch %s", batch_id)
+        finally:
+            broadcaster.close()
+            self.batch_broadcasters.pop(batch_id, None)
+            self._cancelled_batches.discard(batch_id)
 
-            return execution.to_dict() if execution else None
+    async def get_batch(self, batch_id: str) -> Optional[Dict]:
+        """Get a batch with its executions and their aggregated results"""
+        async with self.db.async_session_scope() as session:
+            batch = await AsyncBatchRepository(session).get_by_id(batch_id)
+            if not batch:
+                return None
+            executions = await AsyncExecutionRepository(session).get_by_batch(
+                batch_id, BATCH_EXECUTION_FIELDS
+            )
+            batch = batch.to_dict()
+            executions = [
+                execution.to_dict(BATCH_EXECUTION_FIELDS) for execution in executions
+            ]
+        return {
+            **batch,
+            "summary": batch_summary(batch, executions),
+            "executions": executions,
+        }
 
-    def first_or_create(self, script_id: str, script_name: str):
-        execution = self.get_running_execution(script_id)
+    async def cancel_batch(self, batch_id: str) -> bool:
+        """Cancel the queued and running executions of a batch"""
+        batch = await self.get_batch(batch_id)
+        if not batch or batch["status"] != "running":
+            return False
 
-        if execution:
-            execution_id = execution["id"]
+        if batch_id in self.batch_broadcasters:
+            self._cancelled_batches.add(batch_id)
         else:
-            execution_id = self.create_execution(script_id, script_name)["id"]
+            await self.registry.notify("cancel-batch", batch_id=batch_id)
+        for execution in batch["executions"]:
+            if execution["status"] in ("queued", "running"):
+                await self.cancel_execution(execution["id"])
+        return True
 
-        return execution_id
+    async def _on_cancel_batch(self, message: Dict):
+        if message.get("batch_id") in self.batch_broadcasters:
+            self._cancelled_batches.add(message["batch_id"])
 
-    def get_stats(self) -> Dict[str, int]:
-        """Get execution statistics"""
-        with self.db.session_scope() as session:
-            repo = ExecutionRepository(session)
-            return {
-                "total_executions": repo.count_total(),
-                "failed_executions": repo.count_by_status("failed"),
-                "running_executions": repo.count_by_status("running"),
-                "successful_executions": repo.count_by_status("completed"),
-            }
+    async def attach_batch(
+        self,
+        websocket: WebSocket,
+        batch_id: str,
+        batch_ms: int = 0,
+        batch_bytes: int = WS_BATCH_BYTES,
+    ) -> bool:
+        """Follow the multiplexed output of a batch over a WebSocket
 
-    async def _stream_output(
-        self, stream, websocket: WebSocket, execution_id: str, stream_type: str
-    ):
-        full_output = ""
-        while True:
-            line = await stream.readline()
-            if not line:
-                break
-            try:
-                decoded_line = line.decode("utf-8")
-            except UnicodeDecodeError:
-                decoded_line = line.decode("utf-8", errors="replace")
-            full_output += decoded_line
+        Messages of the batch's executions carry their `execution_id` and
+        `batch_index`; a final "summary" message has the aggregated
+        results. A batch run by another worker only gets its current
+        summary; its executions can be followed one by one. Returns False
+        when the batch does not exist.
+        """
+        broadcaster = self.batch_broadcasters.get(batch_id)
+        if not broadcaster:
+            batch = await self.get_batch(batch_id)
+            if not batch:
+                return False
             await websocket.send_json(
                 {
-                    "type": stream_type,
-                    "data": decoded_line,
-                    "execution_id": execution_id,
+                    "type": "summary",
+                    "data": batch["status"],
+                    "batch_id": batch_id,
+                    "summary": batch["summary"],
+                    "seq": 0,
                 }
             )
-        return full_output
+            return True
 
-    async def execute_script_ws(
+        await self.relay(
+            websocket, broadcaster, batch_ms, batch_bytes, batch_id=batch_id
+        )
+        return True
+
+    async def get_execution_status(self, execution_id: str) -> Optional[Dict]:
+        """Get an execution's metadata without reading its log"""
+        async with self.db.async_session_scope() as session:
+            repo = AsyncExecutionRepository(session)
+            execution = await repo.get_by_id(execution_id)
+            return execution.to_dict() if execution else None
+
+    async def _run_execution(
         self,
-        websocket: WebSocket,
         script_id: str,
-        script_name: str,
+        execution_id: str,
         script_content: str,
+        queued_at: datetime,
+        exclusive: bool = True,
+        parameters: Optional[Dict[str, Any]] = None,
     ):
-        """Execute a script and stream output over a WebSocket"""
-        # Cancel any existing execution for this script
-        if script_id in self.active_executions:
-            old_process, old_execution_id = self.active_executions[script_id]
-            if old_process and old_process.returncode is None:
-                try:
-                    old_process.terminate()
-                    await old_process.wait()
-                except ProcessLookupError:
-                    pass
-            self.update_execution(
-                old_execution_id,
-                {"status": "cancelled", "completed_at": datetime.utcnow()},
-            )
-            # Clean up old temp file
-            old_temp_script = f"/tmp/script_{old_execution_id}.sh"
-            if os.path.exists(old_temp_script):
-                os.remove(old_temp_script)
-            del self.active_executions[script_id]
-
-        # execution_id = self.create_execution(script_id, script_name)
-        execution_id = self.first_or_create(script_id, script_name)
-
-        print("================================================================")
-        print("script_id: ", script_id)
-        print("execution_id: ", execution_id)
-        print("================================================================")
-
-        # await websocket.send_json(
-        #     {"type": "execute", "data": execution_id, "command": script_content}
-        # )
-
-        # Send command execution message
-        await websocket.send_json(
-            {
-                "type": "stdout",
-                # "data": f"Executing script: {script_name}\n",
-                "execution_id": execution_id,
-            }
-        )
+        """Run a script to completion, publishing its output as it arrives
 
-        temp_script = f"/tmp/script_{execution_id}.sh"
+        A run of a batch or pipeline gets its `parameters` ({"env": {...},
+        "args": [...]}) and, not being exclusive to the script, is tracked
+        under its own id and takes no script lock.
+        """
+        broadcaster = self.broadcasters[execution_id]
+        key = script_id if exclusive else execution_id
+        parameters = parameters or {}
         process = None
+        log = None
 
         try:
-            with open(temp_script, "w") as f:
-                f.write(script_content)
-            os.chmod(temp_script, 0o755)
-
-            # PS4='[DEBUG:${LINENO}] set -x
-            # stdbuf -oL -eL sh deploy.sh
-            # process = await asyncio.create_subprocess_shell(
-            #     f"stdbuf -oL -eL bash -x {temp_script}",
-            #     stdout=asyncio.subprocess.PIPE,
-            #     stderr=asyncio.subprocess.PIPE,
-            #     env={
-            #         **os.environ,
-            #         "PS4": "\$ ",
-            #         # "PS4": " \n[CMD:${LINENO}] ",
-            #     },
-            # )
-
-            process = await asyncio.create_subprocess_shell(
-                f"stdbuf -oL -eL bash {temp_script}",
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
+            started_at = datetime.utcnow()
+            await self.update_execution(
+                execution_id,
+                {
+                    "status": "running",
+                    "started_at": started_at,
+                    "queue_wait_ms": int(
+                        (started_at - queued_at).total_seconds() * 1000
+                    ),
+                },
+            )
+
+            script = await self.get_script(script_id) or {}
+            head_bytes, tail_bytes = output_caps(script)
+            log = await ExecutionLogWriter(
+                self.db, execution_id, head_bytes, tail_bytes
+            ).open()
+
+            spawned_at = time.monotonic()
+            process = await self.pool.spawn(
+                script_content,
+                {
+                    "cpu_seconds": script.get("cpu_limit_seconds"),
+                    "memory_bytes": script.get("memory_limit_bytes"),
+                    "open_files": script.get("open_files_limit"),
+                },
+                parameters.get("env"),
+                parameters.get("args") or (),
             )
 
             # Store active execution
-            self.active_executions[script_id] = (process, execution_id)
+            self.active_executions[key] = (process, execution_id)
+            # Where the process group runs, for the reaper should we die
+            await self.update_execution(
+                execution_id,
+                {
+                    "host": HOSTNAME,
+                    "boot_id": BOOT_ID,
+                    "pid": process.pid,
+                    "pid_started": process_start_time(process.pid),
+                },
+            )
+            if execution_id in self._cancelled:
+                # Cancelled while it was being spawned
+                self._stop_process(execution_id, process)
 
             stdout_task = asyncio.create_task(
-                self._stream_output(process.stdout, websocket, execution_id, "stdout")
+                self._stream_output(
+                    process.stdout, broadcaster, log, execution_id, "stdout"
+                )
             )
             stderr_task = asyncio.create_task(
-                self._stream_output(process.stderr, websocket, execution_id, "stderr")
+                self._stream_output(
+                    process.stderr, broadcaster, log, execution_id, "stderr"
+                )
             )
 
-            await asyncio.gather(stdout_task, stderr_task)
+            streams = asyncio.gather(stdout_task, stderr_task)
+            timeout = script.get("timeout_seconds") or EXECUTION_TIMEOUT
+            timed_out = False
+            try:
+                await asyncio.wait_for(asyncio.shield(streams), timeout or None)
+            except asyncio.TimeoutError:
+                timed_out = True
+                try:
+                    process.kill()
+                except ProcessLookupError:
+                    pass
+                try:
+                    # Children of the script may still hold the pipes open
+                    await asyncio.wait_for(streams, 5)
+                except asyncio.TimeoutError:
+                    pass
             await process.wait()  # Wait for the process to finish
+            wall_ms = int((time.monotonic() - spawned_at) * 1000)
+            await log.close()
+            self._publish_tail(broadcaster, log, execution_id)
 
-            full_stdout = stdout_task.result()
-            full_stderr = stderr_task.result()
-
-            status = "completed" if process.returncode == 0 else "failed"
-            self.update_execution(
+            if execution_id in self._cancelled:
+                status = "cancelled"
+            elif timed_out:
+                status = "timed_out"
+            else:
+                status = "completed" if process.returncode == 0 else "failed"
+            await self.update_execution(
                 execution_id,
                 {
                     "status": status,
-                    "error": full_stderr,
-                    "output": full_stdout,
                     "exit_code": process.returncode,
                     "completed_at": datetime.utcnow(),
+                    "output_bytes": log.end,
+                    "stored_bytes": log.stored,
+                    "wall_ms": wall_ms,
+                    **process.usage(),
                 },
             )
 
-            await websocket.send_json(
+            broadcaster.publish(
                 {
                     "type": "status",
                     "data": status,
                     "execution_id": execution_id,
+                    "offset": log.end,
                 }
             )
 
         except Exception as e:
             error_message = f"An error occurred during script execution: {str(e)}"
-            self.update_execution(
-                execution_id,
+            logger.exception("Execution %s failed", execution_id)
+            broadcaster.publish(
                 {
-                    "status": "failed",
-                    "error": error_message,
-                    "completed_at": datetime.utcnow(),
-                },
-            )
-            await websocket.send_json(
-                {"type": "error", "data": error_message, "execution_id": execution_id}
+                    "type": "error",
+                    "data": error_message,
+                    "execution_id": execution_id,
+                    "offset": log.end if log else 0,
+                }
             )
+            try:
+                await self.update_execution(
+                    execution_id,
+                    {
+                        "status": "failed",
+                        "error": error_message,
+                        "completed_at": datetime.utcnow(),
+                        **(
+                            {"output_bytes": log.end, "stored_bytes": log.stored}
+                            if log
+                            else {}
+                        ),
+                    },
+                )
+            except Exception:
+                logger.exception("Could not mark execution %s failed", execution_id)
 
         finally:
+            if log:
+                try:
+                    await log.close()
+                except Exception:
+                    logger.exception("Failed to flush log of %s", execution_id)
+
             # Remove from active executions if this is the current one
             if (
-                script_id in self.active_executions
-                and self.active_executions[script_id][1] == execution_id
+                key in self.active_executions
+                and self.active_executions[key][1] == execution_id
             ):
-                del self.active_executions[script_id]
+                del self.active_executions[key]
+
+            broadcaster.close()
+            self.broadcasters.pop(execution_id, None)
+            self._cancelled.discard(execution_id)
 
             if process and process.returncode is None:
                 try:
@@ -327,5 +2417,670 @@ class ExecutionService:
                 except ProcessLookupError:
                     pass  # Process already finished
 
-            if os.path.exists(temp_script):
-                os.remove(temp_script)
+            if exclusive:
+                try:
+                    await self.registry.unlock(f"script:{script_id}")
+                except Exception:
+                    logger.exception("Could not release lock of script %s", script_id)
+
+
+class PipelineService:
+    """Service layer for Pipeline operations and runs
+
+    A run starts every stage whose needs have completed, so independent
+    branches run in parallel through the ExecutionService scheduler. The
+    first stage that doesn't complete cancels the running ones and skips
+    the rest. Stages share $PIPELINE_ARTIFACTS, a directory for files, and
+    pass values on through KEY=VALUE lines written to $PIPELINE_OUTPUT,
+    which every later stage depending on them gets as PIPELINE_<STAGE>_<KEY>.
+    """
+
+    def __init__(self, executions: ExecutionService):
+        self.db = Database()
+        self.executions = executions
+        self.executions.registry.on("cancel-pipeline-run", self._on_cancel)
+        self.broadcasters = {}  # run_id: ExecutionBroadcaster
+        self._states = {}  # run_id: stage states of a run in progress here
+        self._cancelled = set()  # run_ids
+        self._tasks = set()
+
+    async def get_all_pipelines(self) -> List[Dict]:
+        """Get all pipelines"""
+        async with self.db.async_session_scope() as session:
+            repo = AsyncPipelineRepository(session)
+            return [pipeline.to_dict() for pipeline in await repo.get_all()]
+
+    async def get_pipeline(self, pipeline_id: str) -> Optional[Dict]:
+        """Get pipeline by ID"""
+        async with self.db.async_session_scope() as session:
+            pipeline = await AsyncPipelineRepository(session).get_by_id(pipeline_id)
+            return pipeline.to_dict() if pipeline else None
+
+    async def _check_stages(self, stages: List[Dict[str, Any]]):
+        stage_order(stages)
+        for stage in stages:
+            if not await self.executions.get_script(stage["script_id"]):
+                raise ValueError(
+                    f"Stage '{stage['name']}' uses unknown script {stage['script_id']}"
+                )
+
+    async def create_pipeline(self, data: Dict[str, Any]) -> Dict:
+        """Create a new pipeline"""
+        await self._check_stages(data["stages"])
+        async with self.db.async_session_scope() as session:
+            repo = AsyncPipelineRepository(session)
+
+            # Check if name already exists
+            if await repo.get_by_name(data["name"]):
+                raise ValueError(f"Pipeline with name '{data['name']}' already exists")
+
+            pipeline = await repo.create(data)
+            return pipeline.to_dict()
+
+    async def update_pipeline(
+        self, pipeline_id: str, data: Dict[str, Any]
+    ) -> Optional[Dict]:
+        """Update an existing pipeline; runs in progress keep their stages"""
+        if "stages" in data:
+            await self._check_stages(data["stages"])
+        async with self.db.async_session_scope() as session:
+            repo = AsyncPipelineRepository(session)
+
+            # Check if name already exists (excluding current pipeline)
+            if "name" in data:
+                existing = await repo.get_by_name(data["name"])
+                if existing and existing.id != pipeline_id:
+                    raise ValueError(
+                        f"Pipeline with name '{data['name']}' already exists"
+                    )
+
+            pipeline = await repo.update(pipeline_id, data)
+            return pipeline.to_dict() if pipeline else None
+
+    async def delete_pipeline(self, pipeline_id: str) -> bool:
+        """Delete a pipeline and its runs; stage executions stay in history"""
+        async with self.db.async_session_scope() as session:
+            return await AsyncPipelineRepository(session).delete(pipeline_id)
+
+    async def get_runs(self, pipeline_id: str, limit: int = 100) -> List[Dict]:
+        """Get a pipeline's latest runs"""
+        async with self.db.async_session_scope() as session:
+            repo = AsyncPipelineRunRepository(session)
+            runs = await repo.get_all(pipeline_id=pipeline_id, limit=limit)
+            return [run.to_dict() for run in runs]
+
+    async def get_run(self, run_id: str) -> Optional[Dict]:
+        """Get a pipeline run with the state of its stages"""
+        async with self.db.async_session_scope() as session:
+            run = await AsyncPipelineRunRepository(session).get_by_id(run_id)
+            return run.to_dict() if run else None
+
+    async def _save_run(self, run_id: str, data: Dict[str, Any]):
+        async with self.db.async_session_scope() as session:
+            await AsyncPipelineRunRepository(session).update(run_id, data)
+
+    async def start_run(
+        self, pipeline_id: str, priority: Optional[int] = None
+    ) -> Optional[Dict]:
+        """Start a run of a pipeline in the background
+
+        Returns the run right away, or None when the pipeline does not
+        exist. Follow it with `attach` or `get_run`.
+        """
+        pipeline = await self.get_pipeline(pipeline_id)
+        if not pipeline:
+            return None
+
+        scripts = {}
+        for stage in pipeline["stages"]:
+            script = await self.executions.get_script(stage["script_id"])
+            if not script:
+                raise ValueError(
+                    f"Stage '{stage['name']}' uses a script that no longer exists"
+                )
+            scripts[stage["name"]] = script
+
+        async with self.db.async_session_scope() as session:
+            run = await AsyncPipelineRunRepository(session).create(
+                {
+                    "pipeline_id": pipeline_id,
+                    "pipeline_name": pipeline["name"],
+                    "status": "running",
+                    "stages": {
+                        stage["name"]: {
+                            "status": "pending",
+                            "script_id": stage["script_id"],
+                            "needs": stage.get("needs") or [],
+                            "execution_id": None,
+                            "start_ms": None,
+                            "end_ms": None,
+                            "outputs": {},
+                        }
+                        for stage in pipeline["stages"]
+                    },
+                    "started_at": datetime.utcnow(),
+                    "worker_id": self.executions.registry.worker_id,
+                }
+            )
+            run = run.to_dict()
+
+        self.broadcasters[run["id"]] = ExecutionBroadcaster(run["id"])
+        self._states[run["id"]] = run["stages"]
+        task = asyncio.create_task(self._run(run, scripts, priority))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return run
+
+    async def _run(
+        self,
+        run: Dict[str, Any],
+        scripts: Dict[str, Dict[str, Any]],
+        priority: Optional[int],
+    ):
+        run_id = run["id"]
+        broadcaster = self.broadcasters[run_id]
+        stages = run["stages"]
+        started_at = datetime.fromisoformat(run["started_at"])
+        artifacts = os.path.join(PIPELINE_ARTIFACT_DIR, run_id)
+        running = {}  # forwarder task: stage name
+        failed = False
+
+        try:
+            await asyncio.to_thread(
+                os.makedirs, os.path.join(artifacts, ".outputs"), exist_ok=True
+            )
+            while True:
+                if not failed and run_id not in self._cancelled:
+                    for name, stage in stages.items():
+                        if stage["status"] == "pending" and all(
+                            stages[need]["status"] == "completed"
+                            for need in stage["needs"]
+                        ):
+                            task = await self._start_stage(
+                                run_id, name, scripts[name], artifacts, priority
+                            )
+                            running[task] = name
+                    await self._save_run(run_id, {"stages": stages})
+
+                if not running:
+                    break
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    name = running.pop(task)
+                    await self._finish_stage(run_id, name, started_at, artifacts)
+                    if stages[name]["status"] != "completed" and not failed:
+                        # Short-circuit: nothing else is worth finishing
+                        failed = True
+                        for other in running.values():
+                            await self.executions.cancel_execution(
+                                stages[other]["execution_id"]
+                            )
+
+            for stage in stages.values():
+                if stage["status"] == "pending":
+                    stage["status"] = "skipped"
+            if run_id in self._cancelled:
+                status = "cancelled"
+            elif failed:
+                status = "failed"
+            else:
+                status = "completed"
+            timing = critical_path(stages)
+            await self._save_run(
+                run_id,
+                {
+                    "status": status,
+                    "stages": stages,
+                    "completed_at": datetime.utcnow(),
+                    **timing,
+                },
+            )
+            broadcaster.publish(
+                {
+                    "type": "summary",
+                    "data": status,
+                    "pipeline_run_id": run_id,
+                    "stages": {name: stage["status"] for name, stage in stages.items()},
+                    **timing,
+                }
+            )
+        except Exception:
+            logger.exception("Pipeline run %s failed", run_id)
+            for name in running.values():
+                await self.executions.cancel_execution(stages[name]["execution_id"])
+            try:
+                await self._save_run(
+                    run_id, {"status": "failed", "completed_at": datetime.utcnow()}
+                )
+            except Exception:
+                logger.exception("Could not mark pipeline run %s failed", run_id)
+        finally:
+            broadcaster.close()
+            self.broadcasters.pop(run_id, None)
+            self._states.pop(run_id, None)
+            self._cancelled.discard(run_id)
+            await asyncio.to_thread(shutil.rmtree, artifacts, True)
+
+    async def _start_stage(
+        self,
+        run_id: str,
+        name: str,
+        script: Dict[str, Any],
+        artifacts: str,
+        priority: Optional[int],
+    ) -> asyncio.Task:
+        """Queue a stage's execution with the outputs of the stages it needs"""
+        stages = self._states[run_id]
+        env = {
+            "PIPELINE_RUN_ID": run_id,
+            "PIPELINE_STAGE": name,
+            "PIPELINE_ARTIFACTS": artifacts,
+            "PIPELINE_OUTPUT": os.path.join(artifacts, ".outputs", name),
+        }
+        upstream, pending = set(), list(stages[name]["needs"])
+        while pending:
+            need = pending.pop()
+            if need not in upstream:
+                upstream.add(need)
+                pending.extend(stages[need]["needs"])
+        for need in sorted(upstream):
+            for key, value in stages[need]["outputs"].items():
+                env[f"PIPELINE_{need}_{key}".upper().replace("-", "_")] = value
+
+        priority = self.executions.resolve_priority(script["tags"], priority)
+        execution = await self.executions.create_execution(
+            script["id"],
+            script["name"],
+            priority,
+            pipeline_run_id=run_id,
+            stage=name,
+            parameters={"env": env},
+        )
+        stages[name].update(status="running", execution_id=execution["id"])
+        return self.executions.submit_shared(
+            script,
+            execution,
+            datetime.fromisoformat(execution["queued_at"]),
+            self.broadcasters[run_id],
+            {"pipeline_run_id": run_id, "stage": name},
+            priority,
+        )
+
+    async def _finish_stage(
+        self, run_id: str, name: str, started_at: datetime, artifacts: str
+    ):
+        """Record how a stage ended, when, and the outputs it set"""
+        stage = self._states[run_id][name]
+        execution = await self.executions.get_execution_status(stage["execution_id"])
+        stage["status"] = execution["status"]
+        for key, field in (("start_ms", "started_at"), ("end_ms", "completed_at")):
+            if execution[field]:
+                moment = datetime.fromisoformat(execution[field])
+                stage[key] = int((moment - started_at).total_seconds() * 1000)
+        if stage["status"] == "completed":
+            stage["outputs"] = await asyncio.to_thread(
+                read_stage_outputs, os.path.join(artifacts, ".outputs", name)
+            )
+
+    async def cancel_run(self, run_id: str) -> bool:
+        """Cancel a pipeline run on whichever worker runs it"""
+        if run_id in self._states:
+            await self._cancel_local(run_id)
+            return True
+
+        run = await self.get_run(run_id)
+        if not run or run["status"] != "running":
+            return False
+
+        await self.executions.registry.notify("cancel-pipeline-run", run_id=run_id)
+        return True
+
+    async def _on_cancel(self, message: Dict):
+        if message.get("run_id") in self._states:
+            await self._cancel_local(message["run_id"])
+
+    async def _cancel_local(self, run_id: str):
+        self._cancelled.add(run_id)
+        for stage in self._states[run_id].values():
+            if stage["status"] == "running":
+                await self.executions.cancel_execution(stage["execution_id"])
+
+    async def attach(
+        self,
+        websocket: WebSocket,
+        run_id: str,
+        batch_ms: int = 0,
+        batch_bytes: int = WS_BATCH_BYTES,
+    ) -> bool:
+        """Follow the output of a pipeline run's stages over a WebSocket
+
+        Messages carry the `execution_id` and `stage` they come from; a
+        final "summary" message has the stage results and critical path.
+        A run on another worker only gets its current state. Returns False
+        when the run does not exist.
+        """
+        broadcaster = self.broadcasters.get(run_id)
+        if not broadcaster:
+            run = await self.get_run(run_id)
+            if not run:
+                return False
+            await websocket.send_json(
+                {
+                    "type": "summary",
+                    "data": run["status"],
+                    "pipeline_run_id": run_id,
+                    "stages": {
+                        name: stage["status"] for name, stage in run["stages"].items()
+                    },
+                    "critical_path": run["critical_path"],
+                    "critical_path_ms": run["critical_path_ms"],
+                    "total_stage_ms": run["total_stage_ms"],
+                    "seq": 0,
+                }
+            )
+            return True
+
+        await self.executions.relay(
+            websocket, broadcaster, batch_ms, batch_bytes, pipeline_run_id=run_id
+        )
+        return True
+
+
+class ScheduleService:
+    """Service layer for Schedule operations, and the timer that fires them
+
+    Every worker runs the timer, but only the one holding the "scheduler"
+    registry lock fires schedules; the others try to take it every
+    SCHEDULER_LEADER_INTERVAL. The leader keeps a heap of fire times and
+    sleeps until the earliest one, waking early when a schedule changes.
+    Firing advances `next_run_at` under a row lock first, so a schedule
+    fires once per due time even while leadership changes hands.
+    """
+
+    LOCK = "scheduler"
+
+    def __init__(self, executions: ExecutionService):
+        self.db = Database()
+        self.executions = executions
+        self.registry = executions.registry
+        self.registry.on("schedule", self._on_schedule_changed)
+        self.leader = False
+        self._heap = []  # (fire_at, schedule_id)
+        self._fire_at = {}  # schedule_id: fire_at of its current heap entry
+        self._waiting = set()  # schedule_ids with a run queued behind another
+        self._wakeup = asyncio.Event()
+        self._timer = None
+        self._tasks = set()
+
+    def start(self):
+        self._timer = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = [task for task in (self._timer, *self._tasks) if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._timer = None
+
+        if self.leader:
+            self.leader = False
+            try:
+                await self.registry.unlock(self.LOCK)
+            except Exception:
+                logger.exception("Could not release the scheduler lock")
+
+    async def get_schedules(self, script_id: Optional[str] = None) -> List[Dict]:
+        """Get schedules, soonest due first"""
+        async with self.db.async_session_scope() as session:
+            repo = AsyncScheduleRepository(session)
+            schedules = await repo.get_all(script_id=script_id)
+            return [schedule.to_dict() for schedule in schedules]
+
+    async def get_schedule(self, schedule_id: str) -> Optional[Dict]:
+        """Get schedule by ID"""
+        async with self.db.async_session_scope() as session:
+            schedule = await AsyncScheduleRepository(session).get_by_id(schedule_id)
+            return schedule.to_dict() if schedule else None
+
+    async def _prepare(
+        self, data: Dict[str, Any], current: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Validate a schedule write and work out its next fire time
+
+        A cron expression and an interval replace each other; an empty
+        cron expression clears it.
+        """
+        data = dict(data)
+        if data.get("cron") is not None:
+            data["cron"] = data["cron"].strip() or None
+            if data["cron"]:
+                data.setdefault("interval_seconds", None)
+        if data.get("interval_seconds"):
+            data.setdefault("cron", None)
+        schedule = {**(current or {}), **data}
+
+        if bool(schedule.get("cron")) == bool(schedule.get("interval_seconds")):
+            raise ValueError("A schedule needs either a cron expression or an interval")
+        if schedule.get("cron"):
+            CronExpression(schedule["cron"]).next_after(datetime.utcnow())
+        if schedule.get("misfire_policy", "run_once") not in Schedule.MISFIRE_POLICIES:
+            raise ValueError(
+                f"misfire_policy must be one of {', '.join(Schedule.MISFIRE_POLICIES)}"
+            )
+        if schedule.get("overlap_policy", "skip") not in Schedule.OVERLAP_POLICIES:
+            raise ValueError(
+                f"overlap_policy must be one of {', '.join(Schedule.OVERLAP_POLICIES)}"
+            )
+        if "script_id" in data and not await self.executions.get_script(
+            data["script_id"]
+        ):
+            raise ValueError(f"Script {data['script_id']} not found")
+
+        # New timing, or re-enabled: count from now rather than misfire
+        if current is None or {"cron", "interval_seconds", "enabled"} & data.keys():
+            data["next_run_at"] = next_run_at(
+                schedule.get("cron"),
+                schedule.get("interval_seconds"),
+                datetime.utcnow(),
+            )
+        return data
+
+    async def create_schedule(self, data: Dict[str, Any]) -> Dict:
+        """Create a new schedule"""
+        data = await self._prepare(data)
+        async with self.db.async_session_scope() as session:
+            schedule = await AsyncScheduleRepository(session).create(data)
+            schedule = schedule.to_dict()
+
+        await self.registry.notify("schedule", schedule_id=schedule["id"])
+        return schedule
+
+    async def update_schedule(
+        self, schedule_id: str, data: Dict[str, Any]
+    ) -> Optional[Dict]:
+        """Update an existing schedule"""
+        current = await self.get_schedule(schedule_id)
+        if not current:
+            return None
+
+        data = await self._prepare(data, current)
+        async with self.db.async_session_scope() as session:
+            schedule = await AsyncScheduleRepository(session).update(schedule_id, data)
+            if not schedule:
+                return None
+            schedule = schedule.to_dict()
+
+        await self.registry.notify("schedule", schedule_id=schedule_id)
+        return schedule
+
+    async def delete_schedule(self, schedule_id: str) -> bool:
+        """Delete a schedule"""
+        async with self.db.async_session_scope() as session:
+            deleted = await AsyncScheduleRepository(session).delete(schedule_id)
+
+        if deleted:
+            await self.registry.notify("schedule", schedule_id=schedule_id)
+        return deleted
+
+    async def _on_schedule_changed(self, message: Dict):
+        if self.leader:
+            await self._load(message.get("schedule_id"))
+
+    async def _load(self, schedule_id: Optional[str] = None):
+        """Put one schedule's, or every enabled schedule's, next fire on the heap"""
+        async with self.db.async_session_scope() as session:
+            repo = AsyncScheduleRepository(session)
+            if schedule_id:
+                schedule = await repo.get_by_id(schedule_id)
+                schedules = [schedule] if schedule else []
+                # Any entry it had is stale now
+                self._fire_at.pop(schedule_id, None)
+            else:
+                schedules = await repo.get_all(enabled=True)
+            schedules = [schedule.to_dict() for schedule in schedules]
+
+        for schedule in schedules:
+            if schedule["enabled"] and schedule["next_run_at"]:
+                self._push(schedule)
+        self._wakeup.set()
+
+    def _push(self, schedule: Dict[str, Any]):
+        fire_at = datetime.fromisoformat(schedule["next_run_at"])
+        if schedule["jitter_seconds"]:
+            fire_at += timedelta(seconds=random.uniform(0, schedule["jitter_seconds"]))
+        self._fire_at[schedule["id"]] = fire_at
+        heapq.heappush(self._heap, (fire_at, schedule["id"]))
+
+    async def _lead(self) -> bool:
+        """Keep or try to take the scheduler lock; True while leading"""
+        if self.leader:
+            try:
+                self.leader = await self.registry.holds(self.LOCK)
+            except Exception:
+                self.leader = False
+            if not self.leader:
+                logger.warning("Lost the scheduler lock, no longer firing schedules")
+                self._heap.clear()
+                self._fire_at.clear()
+
+        if not self.leader:
+            try:
+                self.leader = await self.registry.try_lock(self.LOCK)
+            except Exception:
+                self.leader = False
+            if self.leader:
+                logger.info("Took the scheduler lock, firing schedules")
+                await self._load()
+        return self.leader
+
+    async def _run(self):
+        while True:
+            try:
+                await self._tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Scheduler tick failed")
+                await asyncio.sleep(SCHEDULER_LEADER_INTERVAL)
+
+    async def _tick(self):
+        """Fire every due schedule, then sleep until the next is due"""
+        self._wakeup.clear()
+        if not await self._lead():
+            await asyncio.sleep(SCHEDULER_LEADER_INTERVAL)
+            return
+
+        now = datetime.utcnow()
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, schedule_id = heapq.heappop(self._heap)
+            if self._fire_at.get(schedule_id) != fire_at:
+                continue  # superseded by a later reload
+            del self._fire_at[schedule_id]
+
+            task = asyncio.create_task(self._fire(schedule_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        delay = SCHEDULER_LEADER_INTERVAL
+        if self._heap:
+            delay = min(delay, (self._heap[0][0] - datetime.utcnow()).total_seconds())
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), max(delay, 0))
+        except asyncio.TimeoutError:
+            pass
+
+    async def _fire(self, schedule_id: str):
+        """Advance a due schedule to its next time and run its script"""
+        try:
+            now = datetime.utcnow()
+            async with self.db.async_session_scope() as session:
+                repo = AsyncScheduleRepository(session)
+                schedule = await repo.get_for_update(schedule_id)
+                if not schedule or not schedule.enabled or not schedule.next_run_at:
+                    return
+
+                due = schedule.next_run_at
+                if due <= now:
+                    late = (now - due).total_seconds() - schedule.jitter_seconds
+                    run = (
+                        late <= schedule.misfire_grace_seconds
+                        or schedule.misfire_policy == "run_once"
+                    )
+                    # Times missed meanwhile collapse into this one fire
+                    schedule.next_run_at = next_run_at(
+                        schedule.cron, schedule.interval_seconds, now, due
+                    )
+                    if not run:
+                        schedule.last_status = "missed"
+                else:
+                    run = False  # fired elsewhere, or moved without us hearing
+                schedule = schedule.to_dict()
+
+            self._push(schedule)
+            self._wakeup.set()
+            if run:
+                await self._trigger(schedule)
+        except Exception:
+            logger.exception("Schedule %s failed to fire", schedule_id)
+
+    async def _trigger(self, schedule: Dict[str, Any]):
+        """Start a schedule's script, minding its overlap policy"""
+        schedule_id = schedule["id"]
+        script = await self.executions.get_script(schedule["script_id"])
+        if not script:
+            return
+
+        running = await self.executions.get_running_execution(script["id"])
+        if running:
+            # At most one run waits per schedule; later fires are skipped
+            if schedule["overlap_policy"] == "skip" or schedule_id in self._waiting:
+                await self._record(schedule_id, "skipped")
+                return
+
+            self._waiting.add(schedule_id)
+            try:
+                if schedule["overlap_policy"] == "cancel_previous":
+                    await self.executions.cancel_execution(running["id"])
+                while await self.executions.get_running_execution(script["id"]):
+                    await asyncio.sleep(SCHEDULE_OVERLAP_POLL)
+            finally:
+                self._waiting.discard(schedule_id)
+
+        execution_id = await self.executions.start_execution(
+            script["id"],
+            script["name"],
+            script["content"],
+            self.executions.resolve_priority(script["tags"], schedule["priority"]),
+        )
+        await self._record(schedule_id, "started", execution_id)
+
+    async def _record(
+        self, schedule_id: str, status: str, execution_id: Optional[str] = None
+    ):
+        data = {"last_run_at": datetime.utcnow(), "last_status": status}
+        if execution_id:
+            data["last_execution_id"] = execution_id
+        async with self.db.async_session_scope() as session:
+            await AsyncScheduleRepository(session).update(schedule_id, data)
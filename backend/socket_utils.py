@@ -1,3 +1,8 @@
+import asyncio
+import os
+from collections import deque
+from typing import Any, AsyncGenerator, Deque, Dict, List, Optional, Set
+
 # from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 # from fastapi.responses import HTMLResponse
 
@@ -19,3 +24,185 @@
 #     async def broadcast(self, message: str):
 #         for connection in self.active_connections:
 #             await connection.send_text(message)
+
+
+# Bytes of recent output kept per execution for late subscribers
+REPLAY_BUFFER_BYTES = int(os.getenv("REPLAY_BUFFER_BYTES", 256 * 1024))
+
+# Bytes of output a subscriber may lag behind before it is skipped to live
+SUBSCRIBER_QUEUE_BYTES = int(os.getenv("SUBSCRIBER_QUEUE_BYTES", 4 * 1024 * 1024))
+
+
+def _size(message: Optional[Dict[str, Any]]) -> int:
+    return len(message.get("data") or "") if message else 0
+
+
+class SubscriberQueue(asyncio.Queue):
+    """Unbounded queue that keeps count of the output bytes it holds"""
+
+    def _init(self, maxsize: int):
+        super()._init(maxsize)
+        self.bytes = 0
+
+    def _put(self, item):
+        super()._put(item)
+        self.bytes += _size(item)
+
+    def _get(self):
+        item = super()._get()
+        self.bytes -= _size(item)
+        return item
+
+
+class ExecutionBroadcaster:
+    """Fans the output of one execution out to any number of subscribers
+
+    The pipe reader publishes each message once; every subscriber gets its
+    own queue, first replaying a bounded ring buffer of recent messages and
+    then following live output until the execution is closed.
+
+    Publishing never waits on a subscriber. When a subscriber's queue would
+    hold more than `queue_bytes` of output its backlog is dropped and
+    replaced by a "skipped" message with the log offsets it missed, which
+    stay readable from the execution log store.
+    """
+
+    def __init__(
+        self,
+        execution_id: str,
+        buffer_bytes: int = REPLAY_BUFFER_BYTES,
+        queue_bytes: int = SUBSCRIBER_QUEUE_BYTES,
+    ):
+        self.execution_id = execution_id
+        self.buffer_bytes = buffer_bytes
+        self.queue_bytes = queue_bytes
+        self.buffer: Deque[Dict[str, Any]] = deque()
+        self.buffered = 0
+        self.subscribers: Set[SubscriberQueue] = set()
+        self.closed = False
+
+    def publish(self, message: Dict[str, Any]):
+        """Record a message in the replay buffer and hand it to subscribers"""
+        self.buffer.append(message)
+        self.buffered += _size(message)
+        while self.buffered > self.buffer_bytes and len(self.buffer) > 1:
+            self.buffered -= _size(self.buffer.popleft())
+
+        for queue in self.subscribers:
+            self._deliver(queue, message)
+
+    def subscribe(self) -> SubscriberQueue:
+        """Attach a subscriber, pre-filled with the replay buffer"""
+        queue = SubscriberQueue()
+        for message in self.buffer:
+            self._deliver(queue, message)
+
+        if self.closed:
+            self._deliver(queue, None)
+        else:
+            self.subscribers.add(queue)
+        return queue
+
+    def _deliver(self, queue: SubscriberQueue, message: Optional[Dict[str, Any]]):
+        """Enqueue without blocking, skipping a lagging subscriber to live"""
+        size = _size(message)
+        if size and not queue.empty() and queue.bytes + size > self.queue_bytes:
+            first = queue.get_nowait()
+            while not queue.empty():
+                queue.get_nowait()
+
+            queue.put_nowait(
+                {
+                    "type": "skipped",
+                    "execution_id": self.execution_id,
+                    "from_offset": first.get("from_offset", first.get("offset")),
+                    "to_offset": message.get("offset") if message else None,
+                }
+            )
+        queue.put_nowait(message)
+
+    def unsubscribe(self, queue: SubscriberQueue):
+        self.subscribers.discard(queue)
+
+    def close(self):
+        """Signal end of output to every subscriber"""
+        self.closed = True
+        for queue in self.subscribers:
+            self._deliver(queue, None)
+        self.subscribers.clear()
+
+    async def stream(self) -> AsyncGenerator[Dict[str, Any], None]:
+        """Replay then follow the execution's messages"""
+        queue = self.subscribe()
+        try:
+            while True:
+                message: Optional[Dict[str, Any]] = await queue.get()
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.unsubscribe(queue)
+
+    async def stream_batches(
+        self, max_delay: float, max_bytes: int
+    ) -> AsyncGenerator[List[Dict[str, Any]], None]:
+        """Replay then follow the execution, coalescing messages into batches
+
+        A batch is yielded as soon as `max_bytes` of data are pending, the
+        output ends, or `max_delay` seconds have passed since its first
+        message, whichever comes first.
+        """
+        queue = self.subscribe()
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                message = await queue.get()
+                if message is None:
+                    return
+
+                batch = [message]
+                size = _size(message)
+                deadline = loop.time() + max_delay
+                finished = False
+
+                while size < max_bytes:
+                    if queue.empty():
+                        remaining = deadline - loop.time()
+                        if remaining <= 0:
+                            break
+                        try:
+                            message = await asyncio.wait_for(queue.get(), remaining)
+                        except asyncio.TimeoutError:
+                            break
+                    else:
+                        message = queue.get_nowait()
+
+                    if message is None:
+                        finished = True
+                        break
+                    batch.append(message)
+                    size += _size(message)
+
+                yield coalesce(batch)
+                if finished:
+                    return
+        finally:
+            self.unsubscribe(queue)
+
+
+def coalesce(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merge consecutive stdout/stderr messages of the same stream"""
+    merged: List[Dict[str, Any]] = []
+    for message in messages:
+        last = merged[-1] if merged else None
+        if (
+            last
+            and message["type"] in ("stdout", "stderr")
+            and last["type"] == message["type"]
+            and "data" in last
+            and "data" in message
+        ):
+            merged[-1] = {**last, "data": last["data"] + message["data"]}
+        else:
+            merged.append(message)
+    return merged
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# The backend's modules are imported top-level, as uvicorn runs them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Integration tests run against this database, and are skipped without it.
+# Its tables are created, and the tests' rows removed again.
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
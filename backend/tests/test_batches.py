@@ -0,0 +1,36 @@
+from services import batch_summary
+
+
+def _execution(index, status, wall_ms=100, cpu_ms=10):
+    return {
+        "batch_index": index,
+        "status": status,
+        "wall_ms": wall_ms,
+        "cpu_user_ms": cpu_ms,
+        "cpu_system_ms": None,
+    }
+
+
+def test_summary_counts_statuses_and_lists_failed_indexes():
+    batch = {
+        "total": 4,
+        "created_at": "2026-01-01T00:00:00",
+        "completed_at": "2026-01-01T00:00:02",
+    }
+    executions = [
+        _execution(0, "failed"),
+        _execution(1, "completed", wall_ms=300),
+        _execution(2, "timed_out"),
+        _execution(3, "completed", wall_ms=None, cpu_ms=None),
+    ]
+
+    summary = batch_summary(batch, executions)
+
+    assert summary["failed"] == 1
+    assert summary["timed_out"] == 1
+    assert summary["completed"] == 2
+    assert summary["failed_indexes"] == [0, 2]
+    assert summary["duration_ms"] == 2000
+    assert summary["max_wall_ms"] == 300
+    assert summary["total_wall_ms"] == 500
+    assert summary["total_cpu_ms"] == 30
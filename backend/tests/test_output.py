@@ -0,0 +1,131 @@
+import asyncio
+import time
+
+import pytest
+
+from runner import spawn_script
+from services import (
+    ExecutionService,
+    OutputDecoder,
+    _utf8_boundary,
+    collapse_progress,
+)
+from socket_utils import ExecutionBroadcaster
+
+
+def _decode_in_pieces(data: bytes, size: int) -> str:
+    decoder = OutputDecoder()
+    pieces = [decoder.decode(data[i : i + size]) for i in range(0, len(data), size)]
+    return "".join(pieces) + decoder.decode(b"", True)
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5])
+def test_multibyte_characters_split_across_reads(size):
+    text = "naïve café € 😀 ✓\n" * 3
+    assert _decode_in_pieces(text.encode(), size) == text
+
+
+def test_crlf_split_across_reads_is_one_newline():
+    decoder = OutputDecoder()
+    assert decoder.decode(b"line\r") == "line"
+    assert decoder.decode(b"\nnext") == "\nnext"
+    assert decoder.decode(b"", True) == ""
+
+
+def _render(text: str) -> str:
+    """What a terminal shows: each line as its last carriage-return redraw"""
+    return "\n".join(line.rpartition("\r")[2] for line in text.split("\n"))
+
+
+def test_progress_redraws_collapse_to_the_last():
+    assert collapse_progress("10%\r50%\r100%\ndone\n") == "\r100%\ndone\n"
+    assert collapse_progress("a\r\nb\r\n") == "a\nb\n"
+    assert collapse_progress("plain\n") == "plain\n"
+
+
+@pytest.mark.parametrize("size", [1, 2, 4, 64])
+def test_progress_split_across_reads_renders_the_same(size):
+    output = b"step 1/3\rstep 2/3\rstep 3/3\r\nok\r\n"
+    text = _decode_in_pieces(output, size)
+    assert "\r\n" not in text
+    assert _render(text) == "step 3/3\nok\n"
+
+
+def test_invalid_bytes_are_replaced():
+    assert _decode_in_pieces(b"ok \xff\xfe end\n", 3) == "ok �� end\n"
+    # A sequence cut off by the end of output
+    assert _decode_in_pieces(b"cut \xe2\x82", 1) == "cut �"
+
+
+@pytest.mark.parametrize(
+    "data, cut",
+    [
+        (b"abc", 3),
+        ("é".encode(), 2),
+        ("é".encode()[:1], 0),
+        (b"x" + "€".encode()[:2], 1),
+        (b"x" + "😀".encode()[:3], 1),
+        (b"x" + "😀".encode(), 5),
+        (b"x\xff", 2),
+        (b"", 0),
+    ],
+)
+def test_utf8_boundary(data, cut):
+    assert _utf8_boundary(data) == cut
+
+
+class MemoryLog:
+    """What _stream_output needs of ExecutionLogWriter, kept in memory"""
+
+    head_bytes = None
+    tail_bytes = 0
+    truncation_announced = False
+
+    def __init__(self):
+        self.data = bytearray()
+
+    async def write(self, stream: str, chunk: bytes) -> int:
+        offset = len(self.data)
+        self.data += chunk
+        return offset
+
+    def in_head(self, offset: int, size: int) -> int:
+        return size
+
+
+async def _pump(script: str):
+    """Run `script` through _stream_output: (log bytes, viewer text, seconds)"""
+    broadcaster = ExecutionBroadcaster("e1", queue_bytes=1 << 40)
+    queue = broadcaster.subscribe()
+    log = MemoryLog()
+    process = await spawn_script(script)
+    start = time.perf_counter()
+    await ExecutionService()._stream_output(
+        process.stdout, broadcaster, log, "e1", "stdout"
+    )
+    elapsed = time.perf_counter() - start
+    await process.wait()
+
+    text = []
+    while not queue.empty():
+        text.append(queue.get_nowait()["data"])
+    return bytes(log.data), "".join(text), elapsed
+
+
+def test_one_huge_line_streams_in_fixed_size_reads():
+    size = 32 * 1024 * 1024
+    data, text, elapsed = asyncio.run(
+        _pump(f"head -c {size} /dev/zero | tr '\\0' x; echo")
+    )
+    assert len(data) == size + 1 and text == "x" * size + "\n"
+    print(f"\n{size / elapsed / 1e6:.0f} MB/s for one {size >> 20} MiB line")
+
+
+def test_binary_output_is_stored_raw_and_streamed_decoded():
+    size = 8 * 1024 * 1024
+    data, text, elapsed = asyncio.run(_pump(f"head -c {size} /dev/urandom"))
+    assert len(data) == size
+    # Reads come in whatever sizes the pipe gives; the result must not depend
+    # on them once redraws are applied
+    assert _render(text) == _render(data.decode(errors="replace").replace("\r\n", "\n"))
+    print(f"\n{size / elapsed / 1e6:.0f} MB/s of random binary output")
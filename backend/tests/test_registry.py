@@ -0,0 +1,265 @@
+"""Multi-worker coordination against a live Postgres (TEST_DATABASE_URL)
+
+Each ExecutionRegistry below is a worker of its own as far as Postgres is
+concerned: it has its own connections, advisory locks and worker id. The
+last test runs the API under `uvicorn --workers 2`.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+import uuid
+
+import pytest
+
+from conftest import TEST_DATABASE_URL
+
+pytestmark = pytest.mark.skipif(
+    not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set"
+)
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def worker():
+    """A registry independent of the process-wide singleton"""
+    from registry import ExecutionRegistry
+
+    registry = object.__new__(ExecutionRegistry)
+    registry._initialize()
+    return registry
+
+
+async def started(*registries):
+    for registry in registries:
+        await registry.start()
+        assert registry.enabled
+    return registries
+
+
+async def eventually(check, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while not await check():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.05)
+
+
+def test_locks_are_exclusive_across_workers():
+    async def run():
+        a, b = await started(worker(), worker())
+        key = f"script:{uuid.uuid4()}"
+        try:
+            assert await a.try_lock(key)
+            assert not await b.try_lock(key)
+            assert await a.holds(key) and not await b.holds(key)
+            await a.unlock(key)
+            assert await b.try_lock(key)
+        finally:
+            await a.stop()
+            await b.stop()
+
+    asyncio.run(run())
+
+
+def test_relocked_keys_stay_held_until_every_unlock():
+    async def run():
+        a, b = await started(worker(), worker())
+        key = f"script:{uuid.uuid4()}"
+        try:
+            assert await a.try_lock(key)
+            assert await a.try_lock(key)
+            await a.unlock(key)
+            assert a._held[key] == 1
+            assert await a.holds(key) and not await b.try_lock(key)
+            await a.unlock(key)
+            assert key not in a._held
+            assert await b.try_lock(key)
+        finally:
+            await a.stop()
+            await b.stop()
+
+    asyncio.run(run())
+
+
+def test_locks_are_released_with_their_worker():
+    async def run():
+        a, b = await started(worker(), worker())
+        key = f"script:{uuid.uuid4()}"
+        try:
+            assert await a.try_lock(key)
+            assert await b.alive(a.worker_id)
+            await a.stop()
+            assert not await b.alive(a.worker_id)
+            assert await b.try_lock(key)
+        finally:
+            await b.stop()
+
+    asyncio.run(run())
+
+
+def test_standalone_workers_are_taken_to_be_alive():
+    async def unreachable():
+        raise OSError("connection refused")
+
+    async def run():
+        (a,) = await started(worker())
+        b = worker()
+        b._connect = unreachable
+        await b.start()
+        try:
+            assert not b.enabled
+            assert b.worker_id.startswith("standalone:")
+            # b holds no worker lock, which must not make it look dead
+            assert await a.alive(b.worker_id)
+        finally:
+            await a.stop()
+
+    asyncio.run(run())
+
+
+def test_signals_reach_every_worker():
+    async def run():
+        a, b = await started(worker(), worker())
+        received = {a.worker_id: [], b.worker_id: []}
+        for registry in (a, b):
+            registry.on(
+                "cancel",
+                lambda message, registry=registry: asyncio.sleep(
+                    0, received[registry.worker_id].append(message["execution_id"])
+                ),
+            )
+        try:
+            await a.notify("cancel", execution_id="e1")
+
+            async def delivered():
+                return all(messages == ["e1"] for messages in received.values())
+
+            await eventually(delivered)
+        finally:
+            await a.stop()
+            await b.stop()
+
+    asyncio.run(run())
+
+
+def test_lock_connection_reconnects_and_keeps_locks(monkeypatch):
+    import registry as registry_module
+
+    monkeypatch.setattr(registry_module, "REGISTRY_KEEPALIVE_INTERVAL", 0.1)
+
+    async def run():
+        a, b = await started(worker(), worker())
+        key = f"script:{uuid.uuid4()}"
+        try:
+            assert await a.try_lock(key)
+            backend_pid = a._lock_conn.info.backend_pid
+            await b._execute("SELECT pg_terminate_backend(%s)", (backend_pid,))
+
+            async def reconnected():
+                return a._lock_conn.info.backend_pid != backend_pid
+
+            await eventually(reconnected)
+            assert await b.alive(a.worker_id)
+            assert not await b.try_lock(key)
+            assert await a.holds(key)
+            await a.unlock(key)
+            assert await b.try_lock(key)
+        finally:
+            await a.stop()
+            await b.stop()
+
+    asyncio.run(run())
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Api:
+    """JSON client; urllib opens a connection per request, so requests
+    spread over the workers"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+
+    def request(self, method: str, path: str, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=data,
+            method=method,
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return json.loads(response.read() or b"null")
+
+    def get(self, path: str):
+        return self.request("GET", path)
+
+    def post(self, path: str, body=None):
+        return self.request("POST", path, body)
+
+    def delete(self, path: str):
+        return self.request("DELETE", path)
+
+
+@pytest.fixture
+def api():
+    """The API served by two uvicorn workers"""
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app"]
+        + ["--port", str(port), "--workers", "2"],
+        cwd=BACKEND,
+        env={**os.environ, "DATABASE_URL": TEST_DATABASE_URL},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    client = Api(f"http://127.0.0.1:{port}")
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                client.get("/api/stats")
+                break
+            except OSError:
+                assert time.monotonic() < deadline, "API did not start"
+                time.sleep(0.2)
+        yield client
+    finally:
+        server.terminate()
+        server.wait(30)
+
+
+def test_any_worker_joins_and_cancels_an_execution(api):
+    script = api.post(
+        "/api/scripts",
+        {"name": f"test-{uuid.uuid4()}", "content": "sleep 60", "tags": []},
+    )
+    try:
+        # Whichever worker takes each request, all join the one execution
+        ids = {
+            api.post(f"/api/scripts/{script['id']}/execute")["execution_id"]
+            for _ in range(8)
+        }
+        assert len(ids) == 1
+        execution_id = ids.pop()
+
+        api.post(f"/api/executions/{execution_id}/cancel")
+        deadline = time.monotonic() + 20
+        while api.get(f"/api/executions/{execution_id}")["status"] in (
+            "queued",
+            "running",
+        ):
+            assert time.monotonic() < deadline, "execution was not cancelled"
+            time.sleep(0.2)
+        assert api.get(f"/api/executions/{execution_id}")["status"] == "cancelled"
+    finally:
+        api.delete(f"/api/scripts/{script['id']}")
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from runner import MODES, ShellPool, spawn_script
+
+# Reading stdin must not consume the rest of the script
+READS_STDIN = "echo before\ncat\nread line\necho after $1\nexit 3\n"
+
+
+async def _run(spawn):
+    process = await spawn()
+    stdout, _ = await asyncio.wait_for(process.communicate(), 10)
+    return stdout.decode(), process.returncode
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_script_stdin_is_dev_null(mode):
+    spawn = lambda: spawn_script(READS_STDIN, mode, args=["x"])
+    assert asyncio.run(_run(spawn)) == ("before\nafter x\n", 3)
+
+
+def test_pooled_script_stdin_is_dev_null():
+    async def run():
+        pool = ShellPool(2)
+        pool.start()
+        await asyncio.sleep(0.5)  # let the pool fill
+        try:
+            return [await _run(lambda: pool.spawn(READS_STDIN)) for _ in range(3)]
+        finally:
+            await pool.stop()
+
+    assert asyncio.run(run()) == [("before\nafter\n", 3)] * 3
+
+
+def test_pooled_shell_applies_limits():
+    async def run():
+        pool = ShellPool(1)
+        pool.start()
+        await asyncio.sleep(0.5)
+        try:
+            return await _run(lambda: pool.spawn("ulimit -n", {"open_files": 64}))
+        finally:
+            await pool.stop()
+
+    assert asyncio.run(run()) == ("64\n", 0)
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_limits_apply_before_the_script_runs(mode):
+    limits = {"cpu_seconds": 30, "memory_bytes": 512 * 1024 * 1024, "open_files": 64}
+    spawn = lambda: spawn_script(
+        "ulimit -t; ulimit -v; ulimit -n; ulimit -Hn", mode, limits
+    )
+    assert asyncio.run(_run(spawn)) == ("30\n524288\n64\n64\n", 0)
@@ -0,0 +1,89 @@
+import asyncio
+
+from socket_utils import ExecutionBroadcaster, coalesce
+
+
+def _output(offset: int, data: str):
+    return {"type": "stdout", "data": data, "offset": offset}
+
+
+def _drain(queue):
+    messages = []
+    while not queue.empty():
+        messages.append(queue.get_nowait())
+    return messages
+
+
+def test_lagging_subscriber_is_skipped_by_bytes():
+    async def run():
+        broadcaster = ExecutionBroadcaster("e1", buffer_bytes=0, queue_bytes=100)
+        queue = broadcaster.subscribe()
+        for index in range(3):
+            broadcaster.publish(_output(index * 40, "x" * 40))
+        return _drain(queue), queue.bytes
+
+    messages, held = asyncio.run(run())
+    assert messages == [
+        {"type": "skipped", "execution_id": "e1", "from_offset": 0, "to_offset": 80},
+        _output(80, "x" * 40),
+    ]
+    assert held == 0
+
+
+def test_message_larger_than_the_bound_still_reaches_an_idle_subscriber():
+    async def run():
+        broadcaster = ExecutionBroadcaster("e1", queue_bytes=10)
+        queue = broadcaster.subscribe()
+        broadcaster.publish(_output(0, "x" * 64))
+        broadcaster.close()
+        return _drain(queue)
+
+    assert asyncio.run(run()) == [_output(0, "x" * 64), None]
+
+
+def test_late_subscriber_replays_the_buffer():
+    async def run():
+        broadcaster = ExecutionBroadcaster("e1", buffer_bytes=8)
+        for index in range(4):
+            broadcaster.publish(_output(index * 4, "abcd"))
+        broadcaster.close()
+        return [message async for message in broadcaster.stream()]
+
+    assert asyncio.run(run()) == [_output(8, "abcd"), _output(12, "abcd")]
+
+
+def test_batch_is_flushed_once_max_bytes_are_pending():
+    async def run():
+        broadcaster = ExecutionBroadcaster("e1")
+        batches = broadcaster.stream_batches(max_delay=5, max_bytes=1024)
+        first = asyncio.ensure_future(batches.__anext__())
+        await asyncio.sleep(0)
+        broadcaster.publish(_output(0, "x" * 10))
+        await asyncio.sleep(0.05)
+        broadcaster.publish(_output(10, "x" * 2048))
+        batch = await asyncio.wait_for(first, 1)
+
+        # The end of output flushes the open batch too
+        second = asyncio.ensure_future(batches.__anext__())
+        broadcaster.publish(_output(2058, "y"))
+        await asyncio.sleep(0.05)
+        broadcaster.close()
+        return batch, await asyncio.wait_for(second, 1)
+
+    batch, last = asyncio.run(run())
+    assert batch == [_output(0, "x" * 2058)]
+    assert last == [_output(2058, "y")]
+
+
+def test_coalesce_merges_runs_of_one_stream():
+    messages = [
+        _output(0, "a"),
+        _output(1, "b"),
+        {"type": "stderr", "data": "c", "offset": 2},
+        _output(3, "d"),
+    ]
+    assert coalesce(messages) == [
+        _output(0, "ab"),
+        {"type": "stderr", "data": "c", "offset": 2},
+        _output(3, "d"),
+    ]
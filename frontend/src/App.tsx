@@ -294,9 +294,15 @@ function App() {
 		setIsModalOpen(true);
 	};
 
-	const handleEdit = (script: Script) => {
-		setSelectedScript(script);
-		setIsModalOpen(true);
+	const handleEdit = async (script: Script) => {
+		// List rows leave out content; edit the full script
+		try {
+			const res = await apiScript.get(script.id);
+			setSelectedScript(res.data);
+			setIsModalOpen(true);
+		} catch (error) {
+			console.error("Error loading script:", error);
+		}
 	};
 
 	const handleDelete = async (id: string) => {
@@ -321,9 +327,16 @@ function App() {
 		loadData(); // Refresh data after execution
 	};
 
-	const viewExecution = (execution: Execution) => {
+	const viewExecution = async (execution: Execution) => {
+		// List rows leave out output/error; fetch the full record
 		setSelectedExecution(execution);
 		setIsExecutionModalOpen(true);
+		try {
+			const res = await apiExecution.get(execution.id);
+			setSelectedExecution(res.data);
+		} catch (error) {
+			console.error("Error loading execution:", error);
+		}
 	};
 
 	return (
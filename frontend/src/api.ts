@@ -10,7 +10,9 @@ export const apiStats = {
 };
 
 export const apiScript = {
+    // List rows leave out content; get() returns the full script
     list: () => axios.get(`${API_URL}/scripts`),
+    get: (id: string) => axios.get(`${API_URL}/scripts/${id}`),
     save: async (data: any, id: string | undefined) => {
         return id
             ? await axios.put(`${API_URL}/scripts/${id}`, data)
@@ -20,5 +22,6 @@ export const apiScript = {
 };
 
 export const apiExecution = {
-    list: () => axios.get(`${API_URL}/executions`)
+    list: () => axios.get(`${API_URL}/executions`, { params: { limit: 10 } }),
+    get: (id: string) => axios.get(`${API_URL}/executions/${id}`),
 };
\ No newline at end of file
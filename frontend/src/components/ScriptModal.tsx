@@ -29,7 +29,7 @@ function ScriptModal({ isOpen, onClose, onError, onSuccess, data, isExecuting }:
             setFormData({
                 name: data.name,
                 tags: data.tags.join(", "),
-                content: data.content,
+                content: data.content ?? "",
                 description: data.description,
             });
         } else {
@@ -2,7 +2,37 @@ import { useEffect, useRef, useState } from "react";
 
 export type SocketStatus = "running" | "completed" | "failed";
 
-export const useSocket = ({ url }: { url: string }) => {
+// Apply output pieces; a carriage return redraws the current line. Only
+// the trailing pieces after the last newline are touched, so a redraw
+// costs the length of the current line, not of the whole output.
+const appendOutput = (prev: string[], pieces: string[]) => {
+	const next = [...prev];
+	for (const piece of pieces) {
+		const [first, ...redraws] = piece.split(/\r(?!\n)/);
+		next.push(first);
+		for (const redraw of redraws) {
+			while (next.length) {
+				const last = next[next.length - 1];
+				const newline = last.lastIndexOf("\n");
+				if (newline >= 0) {
+					next[next.length - 1] = last.slice(0, newline + 1);
+					break;
+				}
+				next.pop();
+			}
+			next.push(redraw);
+		}
+	}
+	return next;
+};
+
+export const useSocket = ({
+	url,
+	batchMs = 50,
+}: {
+	url: string;
+	batchMs?: number;
+}) => {
 	const [connected, setConnected] = useState(false);
 	const [log, setLog] = useState<string[]>([]);
 	const [status, setStatus] = useState<SocketStatus>("running");
@@ -18,7 +48,9 @@ export const useSocket = ({ url }: { url: string }) => {
 			setLog((prev) => [...prev, `${prefix} ${text}`]);
 		};
 
-		const socket = new WebSocket(url);
+		const socket = new WebSocket(
+			batchMs > 0 ? `${url}${url.includes("?") ? "&" : "?"}batch_ms=${batchMs}` : url,
+		);
 
 		socket.onopen = () => {
 			setConnected(true);
@@ -37,36 +69,50 @@ export const useSocket = ({ url }: { url: string }) => {
 
 			addLog(`Websocket message: ${text}`);
 
-			switch (message.type) {
-				// case "execute":
-				// 	setOutput((prev) => [...prev, `${message.command} \n`]);
-				// 	break;
-
-				case "stdout":
-				case "stderr": {
-					setOutput((prev) => [...prev, message.data]);
-					break;
+			// Batched frames carry several messages; apply them in one update
+			const messages = message.type === "batch" ? message.messages : [message];
+			const lines: string[] = [];
+
+			for (const item of messages) {
+				switch (item.type) {
+					// case "execute":
+					// 	setOutput((prev) => [...prev, `${item.command} \n`]);
+					// 	break;
+
+					case "stdout":
+					case "stderr": {
+						if (item.data !== undefined) lines.push(item.data);
+						break;
+					}
+
+					// The viewer fell behind; the gap stays readable from the log API
+					case "skipped":
+						lines.push(
+							`\n[output skipped: bytes ${item.from_offset}-${item.to_offset ?? "end"}]\n`,
+						);
+						break;
+
+					case "status":
+						lines.push(`\nExecution finished with status: ${item.data}`);
+						setStatus(item.data);
+						break;
+
+					case "error":
+						setStatus("failed");
+						addLog(`Error: ${item.data}`);
+						break;
 				}
+			}
 
-				case "status":
-					setOutput((prev) => [
-						...prev,
-						`\nExecution finished with status: ${message.data}`,
-					]);
-					setStatus(message.data);
-					break;
-
-				case "error":
-					setStatus("failed");
-					addLog(`Error: ${message.data}`);
-					break;
+			if (lines.length) {
+				setOutput((prev) => appendOutput(prev, lines));
 			}
 		};
 
 		ws.current = socket;
 
 		return () => socket.close();
-	}, [url]);
+	}, [url, batchMs]);
 
 	//
 
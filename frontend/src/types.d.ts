@@ -2,7 +2,7 @@ export interface Script {
     id: string;
     name: string;
     description: string;
-    content: string;
+    content?: string; // left out of list responses
     tags: string[];
     created_at: string;
     updated_at: string;